@@ -0,0 +1,251 @@
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+
+RESULT_FORMAT_VERSION = 1
+DEFAULT_REGRESSION_THRESHOLD = 0.10  # 比较结果时，变慢超过 10% 视为退化
+
+# 角色目录中的文件大小分布：大多是几 KB 的配置，少量较大的界面/缓存文件
+FILE_SIZE_BUCKETS = [
+    (0.70, 512, 8 * 1024),
+    (0.25, 8 * 1024, 64 * 1024),
+    (0.05, 64 * 1024, 512 * 1024),
+]
+ROLE_SUBDIRS = ["interface", "interface/layout", "cache"]
+
+def random_file_size(rng):
+    roll = rng.random()
+    for weight, low, high in FILE_SIZE_BUCKETS:
+        if roll < weight:
+            return rng.randint(low, high)
+        roll -= weight
+    return FILE_SIZE_BUCKETS[-1][2]
+
+def generate_userdata(root, accounts, regions, servers, roles, files_per_role, seed=0):
+    # 生成 账号×大区×区服×角色 的合成 userdata 目录，返回所有角色目录的路径
+    rng = random.Random(seed)
+    payload = rng.randbytes(FILE_SIZE_BUCKETS[-1][2])
+    role_paths = []
+    for a in range(accounts):
+        for r in range(regions):
+            for s in range(servers):
+                for ro in range(roles):
+                    role_path = os.path.join(root, f"account{a:03d}", f"电信{r}区", f"服务器{s:02d}", f"角色{ro:02d}")
+                    for subdir in ROLE_SUBDIRS:
+                        os.makedirs(os.path.join(role_path, subdir), exist_ok=True)
+                    for f in range(files_per_role):
+                        subdir = ([""] + ROLE_SUBDIRS)[f % (len(ROLE_SUBDIRS) + 1)]
+                        size = random_file_size(rng)
+                        offset = rng.randint(0, len(payload) - size)
+                        with open(os.path.join(role_path, subdir, f"config{f:03d}.dat"), "wb") as fp:
+                            fp.write(payload[offset:offset + size])
+                    role_paths.append(role_path)
+    return role_paths
+
+def measure(func, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return {
+        "runs": repeat,
+        "min": min(timings),
+        "median": statistics.median(timings),
+        "mean": statistics.mean(timings),
+    }
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ""
+
+def walk_hierarchy(base_path, get_children):
+    stack = [(base_path, 0)]
+    while stack:
+        path, depth = stack.pop()
+        if depth >= 4:
+            continue
+        for name in get_children(path):
+            stack.append((os.path.join(path, name), depth + 1))
+
+def bench_scans(base_path, workdir, repeat, results):
+    from file_operations import get_subdirectories
+    from hierarchy_index import HierarchyIndex
+
+    results["scan_uncached"] = measure(lambda: walk_hierarchy(base_path, get_subdirectories), repeat)
+
+    def cold_index():
+        db_path = os.path.join(workdir, "cold_index.db")
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+        index = HierarchyIndex(db_path)
+        walk_hierarchy(base_path, index.get_children)
+        index.close()
+    results["scan_index_cold"] = measure(cold_index, repeat)
+
+    warm_db = os.path.join(workdir, "warm_index.db")
+    index = HierarchyIndex(warm_db)
+    walk_hierarchy(base_path, index.get_children)
+    index.close()
+
+    def warm_index():
+        # 模拟再次启动：从磁盘加载索引，只校验 mtime
+        reopened = HierarchyIndex(warm_db)
+        walk_hierarchy(base_path, reopened.get_children)
+        reopened.close()
+    results["scan_index_warm"] = measure(warm_index, repeat)
+
+def bench_copies(role_paths, workdir, repeat, results):
+    from file_operations import sync_folder, sync_to_targets
+
+    source = role_paths[0]
+    target = os.path.join(workdir, "copy_target")
+
+    def full_copy():
+        shutil.rmtree(target, ignore_errors=True)
+        sync_folder(source, target)
+    results["copy_full"] = measure(full_copy, repeat)
+
+    sync_folder(source, target)
+    changed = os.path.join(source, "config000.dat")
+
+    def incremental_copy():
+        os.utime(changed)  # 只有一个文件变化
+        sync_folder(source, target)
+    results["copy_incremental"] = measure(incremental_copy, repeat)
+
+    fanout_targets = [os.path.join(workdir, f"fanout_{i}") for i in range(8)]
+
+    def fanout_copy():
+        for path in fanout_targets:
+            shutil.rmtree(path, ignore_errors=True)
+        sync_to_targets(source, fanout_targets)
+    results["copy_fanout_8"] = measure(fanout_copy, repeat)
+
+def bench_qt(base_path, role_paths, workdir, repeat, results):
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    from PyQt5.QtWidgets import QApplication
+
+    app = QApplication.instance() or QApplication([])
+    ui_dir = os.path.join(workdir, "ui")
+    os.makedirs(ui_dir, exist_ok=True)
+    previous_cwd = os.getcwd()
+    os.chdir(ui_dir)  # 界面在当前目录读写 last_path.json / presets.json
+    try:
+        with open("last_path.json", "w") as f:
+            json.dump({"base_path": base_path, "last_left_path": role_paths[-1]}, f)
+
+        start = time.perf_counter()
+        from file_manager_ui import FileManagerUI
+        window = FileManagerUI()
+        window.show()
+        app.processEvents()
+        elapsed = time.perf_counter() - start
+        results["startup"] = {"runs": 1, "min": elapsed, "median": elapsed, "mean": elapsed}
+
+        results["populate_combos"] = measure(
+            lambda: window.update_combos(base_path, window.target_combos), repeat)
+
+        presets = [[base_path] + os.path.relpath(path, base_path).split(os.sep) for path in role_paths[:50]]
+
+        def restore_presets():
+            for selections in presets:
+                window.set_combo_selections(window.source_combos, selections[1:])
+        results["preset_restore_x50"] = measure(restore_presets, repeat)
+        window.close()
+    finally:
+        os.chdir(previous_cwd)
+
+def compare_results(current, baseline, threshold):
+    regressions = []
+    for name, stats in current["results"].items():
+        old = baseline.get("results", {}).get(name)
+        if not old or not old.get("median"):
+            print(f"{name:24s} {stats['median'] * 1000:10.2f} ms   (无基线)")
+            continue
+        change = stats["median"] / old["median"] - 1
+        flag = ""
+        if change > threshold:
+            flag = "  <-- 退化"
+            regressions.append(name)
+        print(f"{name:24s} {stats['median'] * 1000:10.2f} ms   基线 {old['median'] * 1000:10.2f} ms   {change:+.1%}{flag}")
+    return regressions
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="剑网3改键工具性能基准：生成合成 userdata 并计时扫描、改键和预设恢复")
+    parser.add_argument("--accounts", type=int, default=10)
+    parser.add_argument("--regions", type=int, default=3)
+    parser.add_argument("--servers", type=int, default=5)
+    parser.add_argument("--roles", type=int, default=4)
+    parser.add_argument("--files-per-role", type=int, default=40)
+    parser.add_argument("--repeat", type=int, default=5, help="每项重复次数")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workdir", help="生成数据的目录，默认使用临时目录并在结束后删除")
+    parser.add_argument("--no-qt", action="store_true", help="跳过需要 PyQt5 的界面基准")
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前保存的结果 JSON 比较")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_REGRESSION_THRESHOLD)
+    return parser
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    workdir = args.workdir or tempfile.mkdtemp(prefix="jx3bench_")
+    workdir = os.path.abspath(workdir)
+    config = {key: getattr(args, key) for key in ("accounts", "regions", "servers", "roles", "files_per_role", "repeat", "seed")}
+    try:
+        base_path = os.path.join(workdir, "userdata")
+        shutil.rmtree(base_path, ignore_errors=True)
+        start = time.perf_counter()
+        role_paths = generate_userdata(base_path, args.accounts, args.regions, args.servers, args.roles,
+                                       args.files_per_role, args.seed)
+        print(f"生成 {len(role_paths)} 个角色，用时 {time.perf_counter() - start:.2f}s")
+
+        results = {}
+        bench_scans(base_path, workdir, args.repeat, results)
+        bench_copies(role_paths, workdir, args.repeat, results)
+        if not args.no_qt:
+            bench_qt(base_path, role_paths, workdir, args.repeat, results)
+    finally:
+        if not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        "format": RESULT_FORMAT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("config") != config:
+            print("警告: 基线的数据规模配置不同，比较结果仅供参考")
+        regressions = compare_results(report, baseline, args.threshold)
+        return 1 if regressions else 0
+
+    for name, stats in results.items():
+        print(f"{name:24s} 中位数 {stats['median'] * 1000:10.2f} ms   最小 {stats['min'] * 1000:10.2f} ms")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
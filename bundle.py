@@ -0,0 +1,303 @@
+import os
+import re
+import json
+import time
+import shutil
+import zipfile
+from copy_engine import COPY_BUFFER_SIZE
+from file_operations import build_manifest, hash_file, resolve_role_path, new_stats, remove_path
+from trash_bin import make_staging_dir, mark_ready, swap_in, discard_staging, recover_interrupted, SwapFailed
+from transfer_filter import preset_selections, preset_profile, make_preset
+from telemetry import telemetry
+
+BUNDLE_FORMAT = 1
+BUNDLE_SUFFIX = '.jx3bundle'
+MANIFEST_NAME = 'manifest.json'
+OBJECTS_DIR = 'objects/'
+COMPRESS_LEVEL = 6
+
+# 配置包是一个 zip 文件：
+#   objects/<sha256>  文件内容，所有角色中相同的内容只存一份
+#   manifest.json     {"format", "created", "roots": [来源数据文件夹],
+#                      "roles": [{"parts": [账号, 大区, 区服, 角色], "root": 来源数据文件夹序号,
+#                                 "files": {相对路径: [哈希, 大小, mtime_ns]}, "dirs": [...]}],
+#                      "presets": {名称: {"parts": [...], "profile": 方案, "role": 角色序号}}}
+# 不同数据文件夹中的同名角色（例如正式服和测试服）分别保存；旧版本的配置包没有 roots/root/role
+
+class BundleError(Exception):
+    pass
+
+def role_key(parts):
+    return '/'.join(parts)
+
+def _role_parts(selections):
+    # 与 resolve_role_path 一致：遇到空的一级即停止
+    parts = []
+    for part in selections:
+        if not part:
+            break
+        parts.append(part)
+    return parts
+
+def _check_relative(rel_path):
+    # 导入别人的配置包时防止路径跳出角色目录；Windows 上 \ 也是分隔符，: 可以指定盘符或数据流
+    parts = rel_path.split('/')
+    if not rel_path or any(p in ('', '.', '..') or '\\' in p or ':' in p for p in parts):
+        raise BundleError(f"配置包中的路径不合法: {rel_path}")
+
+def _member_path(directory, rel_path):
+    # 解压时再确认一次拼接后的路径仍在 directory 之下
+    directory = os.path.normpath(directory)
+    path = os.path.normpath(os.path.join(directory, *rel_path.split('/')))
+    if not path.startswith(directory + os.sep):
+        raise BundleError(f"配置包中的路径不合法: {rel_path}")
+    return path
+
+def _zip_time(mtime_ns):
+    return time.localtime(max(mtime_ns / 1e9, 315532800))[:6]  # zip 不能表示 1980 年以前的时间
+
+def export_bundle(path, roles, presets=None, hash_cache=None, progress=None):
+    # roles 为 (base_path, [账号, 大区, 区服, 角色]) 列表；presets 为要一起导出的预设（其源角色自动加入）
+    # 文件内容直接从磁盘流式压缩进 zip，不经过临时目录；progress(已导出角色数, 角色总数)
+    with telemetry.span("bundle.export", path=path) as span:
+        stats = _export_bundle(path, roles, presets, hash_cache, progress)
+        span.add(files=stats["files"], num_bytes=stats["bytes"])
+        span.fields.update(roles=stats["roles"], bundle_bytes=stats["bundle_bytes"])
+        return stats
+
+def _export_bundle(path, roles, presets, hash_cache, progress):
+    roles = [(base_path, _role_parts(parts)) for base_path, parts in roles]
+    preset_roles = {}
+    for name, preset in (presets or {}).items():
+        selections = preset_selections(preset)
+        preset_roles[name] = (len(roles), preset_profile(preset))
+        roles.append((selections[0], _role_parts(selections[1:])))
+    # 按 (数据文件夹, 角色) 去重，role_indexes[i] 为 roles[i] 在 unique_roles 中的序号
+    roots = []
+    root_ids = {}
+    unique_roles = []
+    unique_ids = {}
+    role_indexes = []
+    for base_path, parts in roles:
+        if not parts:
+            raise BundleError("没有选择角色")
+        root_path = os.path.normpath(base_path)
+        root = root_ids.setdefault(os.path.normcase(root_path), len(roots))
+        if root == len(roots):
+            roots.append(root_path)
+        index = unique_ids.setdefault((root, role_key(parts)), len(unique_roles))
+        if index == len(unique_roles):
+            unique_roles.append((root, base_path, parts))
+        role_indexes.append(index)
+    exported_presets = {name: {"parts": roles[i][1], "profile": profile, "role": role_indexes[i]}
+                        for name, (i, profile) in preset_roles.items()}
+
+    stats = {"roles": 0, "files": 0, "objects": 0, "bytes": 0, "unique_bytes": 0}
+    manifest = {"format": BUNDLE_FORMAT, "created": time.time(), "roots": roots, "roles": [],
+                "presets": exported_presets}
+    temp_path = path + '.tmp'
+    written = set()
+    try:
+        with zipfile.ZipFile(temp_path, 'w', zipfile.ZIP_DEFLATED, compresslevel=COMPRESS_LEVEL) as zf:
+            for root, base_path, parts in unique_roles:
+                role_path = resolve_role_path(base_path, parts)
+                if not os.path.isdir(role_path):
+                    raise BundleError(f"角色目录不存在: {role_path}")
+                files, dirs = build_manifest(role_path)
+                paths = {rel_path: os.path.join(os.path.normpath(role_path), rel_path) for rel_path in files}
+                if hash_cache is not None:
+                    digests = hash_cache.get_hashes(list(paths.values()))
+                else:
+                    digests = {path: hash_file(path) for path in paths.values()}
+                entries = {}
+                for rel_path, (size, mtime_ns) in files.items():
+                    digest = digests[paths[rel_path]]
+                    entries[rel_path.replace(os.sep, '/')] = [digest, size, mtime_ns]
+                    stats["files"] += 1
+                    stats["bytes"] += size
+                    if digest in written:
+                        continue
+                    info = zipfile.ZipInfo(OBJECTS_DIR + digest, _zip_time(mtime_ns))
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                    info.file_size = size
+                    with open(paths[rel_path], 'rb') as src, zf.open(info, 'w') as dst:
+                        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+                    written.add(digest)
+                    stats["objects"] += 1
+                    stats["unique_bytes"] += size
+                manifest["roles"].append({"parts": parts, "root": root, "files": entries,
+                                          "dirs": sorted(d.replace(os.sep, '/') for d in dirs)})
+                stats["roles"] += 1
+                if progress is not None:
+                    progress(stats["roles"], len(unique_roles))
+            zf.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False))
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+    stats["bundle_bytes"] = os.path.getsize(path)
+    return stats
+
+def _is_str_list(value, allow_empty=True):
+    return isinstance(value, list) and (allow_empty or value) and all(isinstance(item, str) for item in value)
+
+def _is_index(value, size):
+    return isinstance(value, int) and not isinstance(value, bool) and 0 <= value < size
+
+def _check_manifest(manifest):
+    # 字段缺失或类型不对（损坏或手工修改过的配置包）统一报 BundleError
+    def fail(what):
+        raise BundleError(f"配置包内容不完整或已损坏: {what}")
+    roles = manifest.get("roles")
+    if not isinstance(roles, list):
+        fail("roles")
+    roots = manifest.get("roots", [])
+    if not _is_str_list(roots):
+        fail("roots")
+    for role in roles:
+        if not isinstance(role, dict) or not _is_str_list(role.get("parts"), allow_empty=False):
+            fail("parts")
+        if "root" in role and not _is_index(role["root"], max(len(roots), 1)):
+            fail("root")
+        if not isinstance(role.get("files"), dict):
+            fail("files")
+        for rel_path, entry in role["files"].items():
+            if not (isinstance(entry, list) and len(entry) == 3 and isinstance(entry[0], str)
+                    and re.fullmatch('[0-9a-f]{64}', entry[0]) and isinstance(entry[1], int) and entry[1] >= 0
+                    and isinstance(entry[2], int)):
+                fail(rel_path)
+        if not _is_str_list(role.get("dirs")):
+            fail("dirs")
+    presets = manifest.get("presets", {})
+    if not isinstance(presets, dict):
+        fail("presets")
+    for name, entry in presets.items():
+        if not isinstance(entry, dict) or not _is_str_list(entry.get("parts"), allow_empty=False) \
+                or not isinstance(entry.get("profile"), (str, type(None))):
+            fail(name)
+        if "role" in entry and not _is_index(entry["role"], len(roles)):
+            fail(name)
+
+def _read_manifest(zf):
+    try:
+        manifest = json.loads(zf.read(MANIFEST_NAME).decode('utf-8'))
+    except (KeyError, ValueError) as e:
+        raise BundleError(f"不是有效的配置包: {e}")
+    if not isinstance(manifest, dict):
+        raise BundleError("不是有效的配置包")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise BundleError(f"不支持的配置包版本: {manifest.get('format')}")
+    _check_manifest(manifest)
+    for role in manifest["roles"]:
+        for part in role["parts"]:
+            if part in ('', '.', '..') or '/' in part or '\\' in part or ':' in part:
+                raise BundleError(f"配置包中的角色路径不合法: {role_key(role['parts'])}")
+        for rel_path in list(role["files"]) + role["dirs"]:
+            _check_relative(rel_path)
+    return manifest
+
+def read_bundle_manifest(path):
+    try:
+        with zipfile.ZipFile(path) as zf:
+            return _read_manifest(zf)
+    except zipfile.BadZipFile as e:
+        raise BundleError(f"不是有效的配置包: {e}")
+
+def role_base_path(role, base_path, root_paths=None):
+    # 角色导入到的数据文件夹：root_paths[来源序号]，未指定时为 base_path
+    root = role.get("root", 0)
+    if root_paths and root < len(root_paths) and root_paths[root]:
+        return root_paths[root]
+    return base_path
+
+def bundle_presets(manifest, base_path, root_paths=None):
+    # 把配置包中的预设转换为指向导入后角色的预设
+    presets = {}
+    for name, entry in manifest.get("presets", {}).items():
+        role = manifest["roles"][entry["role"]] if "role" in entry else {"parts": entry["parts"]}
+        presets[name] = make_preset([role_base_path(role, base_path, root_paths)] + role["parts"], entry.get("profile"))
+    return presets
+
+def _extract_role(zf, role, directory):
+    for rel_dir in role["dirs"]:
+        os.makedirs(_member_path(directory, rel_dir), exist_ok=True)
+    for rel_path, (digest, size, mtime_ns) in role["files"].items():
+        path = _member_path(directory, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with zf.open(OBJECTS_DIR + digest) as src, open(path, 'wb') as dst:
+            shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
+        os.utime(path, ns=(mtime_ns, mtime_ns))
+
+def _import_role(zf, role, target, atomic):
+    # 解压到同级暂存目录后整体换入；目标被占用时逐个文件覆盖，并删除配置包中没有的文件
+    stats = new_stats()
+    stats["copied_files"] = len(role["files"])
+    stats["copied_bytes"] = sum(entry[1] for entry in role["files"].values())
+    wanted = {rel_path.replace('/', os.sep) for rel_path in role["files"]}
+    current_files, current_dirs = build_manifest(target)
+    stats["deleted"] = sum(1 for rel_path in current_files if rel_path not in wanted)
+    parent = os.path.dirname(target)
+    os.makedirs(parent, exist_ok=True)
+    if atomic:
+        recover_interrupted(parent)
+        staging = make_staging_dir(parent)
+        try:
+            _extract_role(zf, role, staging)
+            staging = mark_ready(staging, os.path.basename(target))
+            swap_in(staging, target)
+            return stats
+        except SwapFailed as e:
+            telemetry.warn(f"无法整体替换 {target}，改为逐个文件写入: {e}")
+            discard_staging(staging)
+        except BaseException:
+            discard_staging(staging)
+            raise
+    wanted_dirs = {rel_dir.replace('/', os.sep) for rel_dir in role["dirs"]}
+    for rel_path in current_files:
+        if rel_path not in wanted:
+            remove_path(os.path.join(target, rel_path))
+    for rel_dir in sorted(current_dirs - wanted_dirs, reverse=True):
+        if not os.listdir(os.path.join(target, rel_dir)):
+            os.rmdir(os.path.join(target, rel_dir))
+    _extract_role(zf, role, target)
+    return stats
+
+def import_bundle(path, base_path, role_keys=None, targets=None, before_import=None, atomic=True, root_paths=None):
+    # 角色按 resolve_role_path(数据文件夹, parts) 解析到目标路径（与界面选择一致），数据文件夹见 role_base_path；
+    # targets 可为 角色键 -> 目标路径 的映射，用于导入到其他角色
+    # 多个角色解析到同一目标时（不同来源的同名角色导入到同一数据文件夹）只导入第一个，其余报错
+    # before_import(target) 在覆盖每个目标之前调用（例如拍快照）
+    # 返回每个目标的结果 {"target", "ok", "stats", "error"}
+    results = []
+    try:
+        zf = zipfile.ZipFile(path)
+    except zipfile.BadZipFile as e:
+        raise BundleError(f"不是有效的配置包: {e}")
+    with zf:
+        manifest = _read_manifest(zf)
+        claimed = set()
+        for role in manifest["roles"]:
+            key = role_key(role["parts"])
+            if role_keys is not None and key not in role_keys:
+                continue
+            target = os.path.normpath((targets or {}).get(key) or
+                                      resolve_role_path(role_base_path(role, base_path, root_paths), role["parts"]))
+            if os.path.normcase(target) in claimed:
+                results.append({"target": target, "ok": False, "stats": None,
+                                "error": "配置包中另一个数据文件夹的同名角色已导入到这里，已跳过"})
+                continue
+            claimed.add(os.path.normcase(target))
+            try:
+                with telemetry.span("bundle.import", target=target) as span:
+                    if before_import is not None:
+                        with span.phase("snapshot"):
+                            before_import(target)
+                    stats = _import_role(zf, role, target, atomic)
+                    span.add(files=stats["copied_files"], num_bytes=stats["copied_bytes"])
+                results.append({"target": target, "ok": True, "stats": stats, "error": None})
+            except (OSError, zipfile.BadZipFile, KeyError, BundleError) as e:
+                results.append({"target": target, "ok": False, "stats": None, "error": str(e)})
+    return results
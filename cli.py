@@ -0,0 +1,297 @@
+import os
+import sys
+import json
+import argparse
+from file_operations import resolve_role_path, sync_to_targets, DEFAULT_FANOUT_WORKERS
+from snapshot_store import SnapshotStore, DEFAULT_SNAPSHOT_ROOT
+from state_store import PRESETS_FILE, StateWriter, PresetStore, read_presets
+from bundle import BundleError, export_bundle, import_bundle, read_bundle_manifest, bundle_presets, role_key
+from transfer_filter import (PROFILES_FILE, ProfileError, load_profiles, compile_profile,
+                             preset_selections, preset_profile)
+
+# 退出码
+EXIT_OK = 0
+EXIT_FAILED = 1  # 有目标改键失败
+EXIT_USAGE = 2  # 参数、任务文件或预设有误
+
+ROLE_DEPTH = 4  # 账号/大区/区服/角色
+
+class JobError(Exception):
+    pass
+
+def load_job_file(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        if path.lower().endswith(('.yaml', '.yml')):
+            try:
+                import yaml
+            except ImportError:
+                raise JobError("读取 YAML 任务文件需要安装 PyYAML")
+            try:
+                return yaml.safe_load(f)
+            except yaml.YAMLError as e:
+                raise JobError(f"任务文件格式错误: {e}")
+        return json.load(f)
+
+def load_presets(path=PRESETS_FILE):
+    # 与界面共用读取逻辑：presets.json 加上尚未合并的修改日志
+    try:
+        return read_presets(path)
+    except FileNotFoundError:
+        raise JobError(f"找不到预设文件: {path}")
+    except ValueError as e:
+        raise JobError(f"预设文件格式错误: {e}")
+
+def resolve_job_path(base_path, value, data_folders=()):
+    # 支持绝对路径、"账号/大区/区服/角色" 形式的相对路径，或各级名称组成的列表
+    # 无人值守运行时写错一级就可能把整个账号或数据文件夹当成目标清空，所以相对路径必须正好是四级；
+    # 绝对路径不能是数据文件夹（base_path、data_folders）本身或其上级，位于数据文件夹中时也必须是四级
+    if isinstance(value, (list, tuple)):
+        parts = [str(part) for part in value]
+    elif isinstance(value, str):
+        if os.path.isabs(value):
+            return _check_absolute(os.path.normpath(value), [base_path, *data_folders])
+        parts = value.replace('\\', '/').strip('/').split('/')
+    else:
+        raise JobError(f"无法识别的路径: {value!r}")
+    if not base_path:
+        raise JobError("使用相对路径时必须指定 base_path")
+    if len(parts) != ROLE_DEPTH or any(part in ('', '.', '..') or ':' in part for part in parts):
+        raise JobError(f"路径必须是 账号/大区/区服/角色 四级: {value!r}")
+    return resolve_role_path(base_path, parts)
+
+def _check_absolute(path, data_folders):
+    normalized = os.path.normcase(path)
+    prefix = normalized if normalized.endswith(os.sep) else normalized + os.sep
+    for folder in data_folders:
+        if not folder:
+            continue
+        folder = os.path.normcase(os.path.abspath(folder))
+        if folder == normalized or folder.startswith(prefix):
+            raise JobError(f"目标不能是数据文件夹或其上级目录: {path}")
+        if normalized.startswith(folder + os.sep) and \
+                len(normalized[len(folder) + 1:].split(os.sep)) != ROLE_DEPTH:
+            raise JobError(f"路径必须是 账号/大区/区服/角色 四级: {path}")
+    return path
+
+def resolve_preset_source(presets, name):
+    # 返回 (base_path, 源角色路径, 预设中的传输方案)
+    if name not in presets:
+        raise JobError(f"预设不存在: {name}")
+    preset = presets[name]
+    selections = preset_selections(preset)
+    try:
+        source = resolve_job_path(selections[0], list(selections[1:]))
+    except JobError as e:
+        raise JobError(f"预设 {name} 不是完整的角色: {e}")
+    return selections[0], source, preset_profile(preset)
+
+def normalize_jobs(spec, presets_path, profiles_path=PROFILES_FILE, profile=None):
+    # 任务文件格式：{"base_path": ..., "jobs": [{"source" 或 "preset": ..., "targets": [...],
+    #               "use_hash": false, "profile": 传输方案}]}
+    # profile 参数（命令行 --profile）优先于任务和预设中的传输方案
+    if isinstance(spec, list):
+        spec = {"jobs": spec}
+    if not isinstance(spec, dict) or not isinstance(spec.get("jobs"), list):
+        raise JobError("任务文件中缺少 jobs 列表")
+    default_base = spec.get("base_path", "")
+    presets = None
+    profiles = load_profiles(profiles_path)
+    jobs = []
+    for number, job in enumerate(spec["jobs"], 1):
+        if not isinstance(job, dict):
+            raise JobError(f"第 {number} 个任务格式错误")
+        base_path = job.get("base_path", default_base)
+        job_profile = job.get("profile", spec.get("profile"))
+        if "preset" in job:
+            if presets is None:
+                presets = load_presets(presets_path)
+            preset_base, source, preset_profile_name = resolve_preset_source(presets, job["preset"])
+            base_path = base_path or preset_base
+            job_profile = job_profile or preset_profile_name
+            source_base = preset_base
+        elif "source" in job:
+            source_base = base_path
+            try:
+                source = resolve_job_path(base_path, job["source"], [default_base])
+            except JobError as e:
+                raise JobError(f"第 {number} 个任务的源: {e}")
+        else:
+            raise JobError(f"第 {number} 个任务缺少 source 或 preset")
+        targets = job.get("targets") or []
+        if isinstance(targets, str):
+            targets = [targets]
+        if not targets:
+            raise JobError(f"第 {number} 个任务缺少 targets")
+        try:
+            target_paths = [resolve_job_path(base_path, target, [default_base, source_base]) for target in targets]
+        except JobError as e:
+            raise JobError(f"第 {number} 个任务的目标: {e}")
+        try:
+            transfer_filter = compile_profile(profiles, profile or job_profile)
+        except ProfileError as e:
+            raise JobError(f"第 {number} 个任务: {e}")
+        jobs.append({
+            "source": source,
+            "targets": target_paths,
+            "use_hash": bool(job.get("use_hash", spec.get("use_hash", False))),
+            "transfer_filter": transfer_filter,
+        })
+    return jobs
+
+def run_jobs(jobs, workers=DEFAULT_FANOUT_WORKERS, use_hash=False, snapshot_store=None, atomic=True, verify=False):
+    # 任务按顺序执行（避免不同任务同时写同一目标），每个任务内的目标并行写入
+    before_sync = None
+    if snapshot_store is not None:
+        before_sync = lambda target: snapshot_store.take_snapshot(target, label="命令行改键前自动备份")
+    summary = {"ok": True, "jobs": [], "targets": 0, "failed": 0, "copied_files": 0,
+               "copied_bytes": 0, "skipped_files": 0, "deleted": 0}
+    for job in jobs:
+        if not os.path.isdir(job["source"]):
+            results = [{"target": target, "ok": False, "stats": None, "error": f"源路径不存在: {job['source']}"}
+                       for target in job["targets"]]
+        else:
+            results = sync_to_targets(job["source"], job["targets"], use_hash or job["use_hash"], workers,
+                                      before_sync=before_sync, atomic=atomic,
+                                      transfer_filter=job.get("transfer_filter"), verify=verify)
+        for result in results:
+            summary["targets"] += 1
+            if not result["ok"]:
+                summary["failed"] += 1
+                continue
+            for key in ("copied_files", "copied_bytes", "skipped_files", "deleted"):
+                summary[key] += result["stats"][key]
+        summary["jobs"].append({"source": job["source"], "results": results})
+    summary["ok"] = summary["failed"] == 0
+    return summary
+
+def print_summary(summary, stream):
+    for job in summary["jobs"]:
+        print(f"源: {job['source']}", file=stream)
+        for result in job["results"]:
+            if result["ok"]:
+                stats = result["stats"]
+                print(f"  成功 {result['target']}: 复制 {stats['copied_files']} 个文件，"
+                      f"跳过 {stats['skipped_files']} 个，删除 {stats['deleted']} 项", file=stream)
+            else:
+                print(f"  失败 {result['target']}: {result['error']}", file=stream)
+                for mismatch in result.get("mismatches") or []:
+                    print(f"    {mismatch['path']}: {mismatch['reason']}", file=stream)
+    print(f"共 {summary['targets']} 个目标，失败 {summary['failed']} 个", file=stream)
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="剑网3改键工具命令行版：批量把源角色的配置同步到目标角色")
+    parser.add_argument("job_file", nargs="?", help="JSON/YAML 任务文件")
+    parser.add_argument("--preset", help="使用 presets.json 中的预设作为源")
+    parser.add_argument("--target", action="append", default=[],
+                        help="目标角色（账号/大区/区服/角色 或绝对路径），可重复")
+    parser.add_argument("--base-path", default="", help="userdata 路径，默认取任务文件或预设中的设置")
+    parser.add_argument("--presets", default=PRESETS_FILE, help="预设文件路径")
+    parser.add_argument("--profile", help="传输方案名称，覆盖任务文件和预设中的设置")
+    parser.add_argument("--profiles", default=PROFILES_FILE, help="传输方案文件路径")
+    parser.add_argument("--workers", type=int, default=DEFAULT_FANOUT_WORKERS, help="并行写入的目标数")
+    parser.add_argument("--hash", action="store_true", help="用内容哈希确认未变化的文件")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出结果摘要")
+    parser.add_argument("--in-place", action="store_true", help="原地同步目标，不使用暂存目录整体替换")
+    parser.add_argument("--verify", action="store_true", help="写入后逐个校验文件内容，不一致的文件自动重试")
+    parser.add_argument("--no-snapshot", action="store_true", help="覆盖目标前不自动拍快照")
+    parser.add_argument("--snapshot-dir", default=DEFAULT_SNAPSHOT_ROOT, help="快照仓库目录")
+    parser.add_argument("--export", metavar="BUNDLE", help="把 --role/--preset 指定的角色导出为配置包")
+    parser.add_argument("--import", dest="import_bundle", metavar="BUNDLE",
+                        help="把配置包中的角色导入到 --base-path（单个角色可用 --target 指定目标）")
+    parser.add_argument("--role", action="append", default=[], help="导出的角色（账号/大区/区服/角色），可重复")
+    parser.add_argument("--all-presets", action="store_true", help="导出 presets.json 中的全部预设及其源角色")
+    return parser
+
+def parse_role_parts(value):
+    return [part for part in value.replace('\\', '/').split('/') if part]
+
+def run_export(args):
+    roles = [(args.base_path, parse_role_parts(role)) for role in args.role]
+    if roles and not args.base_path:
+        raise JobError("使用 --role 时必须指定 --base-path")
+    presets = None
+    if args.all_presets or args.preset:
+        all_presets = load_presets(args.presets)
+        if args.preset and args.preset not in all_presets:
+            raise JobError(f"预设不存在: {args.preset}")
+        presets = all_presets if args.all_presets else {args.preset: all_presets[args.preset]}
+    if not roles and not presets:
+        raise JobError("导出时需要 --role、--preset 或 --all-presets")
+    return export_bundle(args.export, roles, presets)
+
+def run_import(args, snapshot_store):
+    if not args.base_path:
+        raise JobError("导入时必须指定 --base-path")
+    manifest = read_bundle_manifest(args.import_bundle)
+    targets = None
+    if args.target:
+        if len(manifest["roles"]) != 1 or len(args.target) != 1:
+            raise JobError("只有单个角色的配置包才能用 --target 指定导入目标")
+        targets = {role_key(manifest["roles"][0]["parts"]): resolve_job_path(args.base_path, args.target[0])}
+    before_import = None
+    if snapshot_store is not None:
+        before_import = lambda target: snapshot_store.take_snapshot(target, label="命令行导入前自动备份")
+    results = import_bundle(args.import_bundle, args.base_path, None, targets, before_import, not args.in_place)
+    presets = bundle_presets(manifest, args.base_path)
+    if presets:
+        writer = StateWriter()
+        store = PresetStore(writer, args.presets)
+        for name, preset in presets.items():
+            store[name] = preset
+        writer.close()
+    summary = {"ok": all(result["ok"] for result in results), "jobs": [{"source": args.import_bundle, "results": results}],
+               "targets": len(results), "failed": sum(1 for result in results if not result["ok"]),
+               "presets": len(presets)}
+    return summary
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.export or args.import_bundle:
+        try:
+            if args.export:
+                result = run_export(args)
+                ok = True
+            else:
+                result = run_import(args, None if args.no_snapshot else SnapshotStore(args.snapshot_dir))
+                ok = result["ok"]
+        except (OSError, ValueError, JobError, BundleError) as e:
+            print(f"错误: {e}", file=sys.stderr)
+            return EXIT_USAGE
+        if args.json:
+            json.dump(result, sys.stdout, ensure_ascii=False, indent=2)
+            print()
+        elif args.export:
+            print(f"已导出 {result['roles']} 个角色、{result['files']} 个文件，去重后 {result['objects']} 份内容，"
+                  f"配置包 {result['bundle_bytes']} 字节")
+        else:
+            print_summary(result, sys.stdout)
+        return EXIT_OK if ok else EXIT_FAILED
+
+    try:
+        if args.job_file:
+            spec = load_job_file(args.job_file)
+            if args.base_path and isinstance(spec, dict):
+                spec["base_path"] = args.base_path
+        elif args.preset and args.target:
+            spec = {"base_path": args.base_path, "jobs": [{"preset": args.preset, "targets": args.target}]}
+        else:
+            parser.print_usage(sys.stderr)
+            print("需要提供任务文件，或同时提供 --preset 和 --target", file=sys.stderr)
+            return EXIT_USAGE
+        jobs = normalize_jobs(spec, args.presets, args.profiles, args.profile)
+    except (OSError, ValueError, JobError) as e:
+        print(f"错误: {e}", file=sys.stderr)
+        return EXIT_USAGE
+
+    snapshot_store = None if args.no_snapshot else SnapshotStore(args.snapshot_dir)
+    summary = run_jobs(jobs, max(1, args.workers), args.hash, snapshot_store, not args.in_place, args.verify)
+    if args.json:
+        json.dump(summary, sys.stdout, ensure_ascii=False, indent=2)
+        print()
+    else:
+        print_summary(summary, sys.stdout)
+    return EXIT_OK if summary["ok"] else EXIT_FAILED
+
+if __name__ == "__main__":
+    sys.exit(main())
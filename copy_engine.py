@@ -0,0 +1,223 @@
+import os
+import sys
+import errno
+import shutil
+import hashlib
+import threading
+import stat as stat_module
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+SMALL_FILE_THRESHOLD = 1024 * 1024  # 小于此大小的文件并发复制以掩盖每个文件的打开/关闭延迟
+DEFAULT_COPY_WORKERS = 8
+TEMP_SUFFIX = '.jx3tmp'
+FICLONE = 0x40049409  # Linux ioctl：在 btrfs/xfs 等支持写时复制的文件系统上克隆文件
+
+# 内核/文件系统不支持时返回的错误码，遇到后回退到下一种复制方式
+FALLBACK_ERRNOS = {errno.EXDEV, errno.EINVAL, errno.ENOSYS, errno.EBADF, errno.EOPNOTSUPP,
+                   getattr(errno, 'ENOTSUP', errno.EOPNOTSUPP), errno.ENOTTY, errno.EPERM}
+
+# 整个进程内确认不可用的方式，避免每个文件都重试一次失败的系统调用
+unsupported_methods = set()
+
+class SyncCancelled(Exception):
+    pass
+
+def _try_reflink(src_fd, dst_fd, size):
+    if fcntl is None or not sys.platform.startswith('linux') or 'reflink' in unsupported_methods:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+        return True
+    except OSError as e:
+        if e.errno in (errno.ENOTTY, errno.ENOSYS):
+            unsupported_methods.add('reflink')
+        if e.errno in FALLBACK_ERRNOS:
+            return False
+        raise
+
+def _copy_with(call, name, src_fd, dst_fd, size):
+    # copy_file_range / sendfile：数据在内核内传输，不经过 Python 缓冲区
+    if name in unsupported_methods:
+        return False
+    copied = 0
+    try:
+        while copied < size:
+            sent = call(src_fd, dst_fd, copied, size - copied)
+            if sent == 0:
+                break
+            copied += sent
+        return True
+    except OSError as e:
+        if e.errno not in FALLBACK_ERRNOS:
+            raise
+        if e.errno == errno.ENOSYS:
+            unsupported_methods.add(name)
+        if copied:
+            # 部分写入后失败：回到开头由缓冲复制重写
+            os.lseek(dst_fd, 0, os.SEEK_SET)
+            os.ftruncate(dst_fd, 0)
+        return False
+
+def _copy_file_range(src_fd, dst_fd, offset, count):
+    return os.copy_file_range(src_fd, dst_fd, count, offset, offset)
+
+def _sendfile(src_fd, dst_fd, offset, count):
+    return os.sendfile(dst_fd, src_fd, offset, count)
+
+thread_buffers = threading.local()  # 每个复制线程复用一块大缓冲区，避免每个文件重新分配
+
+def _copy_buffered(src_file, dst_file, digest=None):
+    buffer = getattr(thread_buffers, 'buffer', None)
+    if buffer is None:
+        buffer = thread_buffers.buffer = bytearray(COPY_BUFFER_SIZE)
+    view = memoryview(buffer)
+    while True:
+        read = src_file.readinto(view)
+        if not read:
+            break
+        if digest is not None:
+            digest.update(view[:read])
+        written = 0
+        while written < read:  # 无缓冲写入可能只写入一部分
+            written += dst_file.write(view[written:read])
+
+def copy_file_data(src, dst, size, digest=None):
+    # 只复制内容，依次尝试 reflink、copy_file_range、sendfile，最后回退到大缓冲区复制
+    # 传入 digest（hashlib 对象）时直接缓冲复制，顺便计算源内容的哈希，校验时不必再读一遍源文件
+    with open(src, 'rb', buffering=0) as src_file, open(dst, 'wb', buffering=0) as dst_file:
+        src_fd, dst_fd = src_file.fileno(), dst_file.fileno()
+        if size > 0 and digest is None:
+            if _try_reflink(src_fd, dst_fd, size):
+                return 'reflink'
+            if hasattr(os, 'copy_file_range') and _copy_with(_copy_file_range, 'copy_file_range', src_fd, dst_fd, size):
+                return 'copy_file_range'
+            if hasattr(os, 'sendfile') and sys.platform.startswith('linux') and \
+                    _copy_with(_sendfile, 'sendfile', src_fd, dst_fd, size):
+                return 'sendfile'
+        _copy_buffered(src_file, dst_file, digest)
+        return 'buffered'
+
+def copy_file(src, dst, size, digest=None):
+    # 先写到同目录的临时文件再替换，目标文件要么是旧内容要么是完整的新内容
+    temp_path = dst + TEMP_SUFFIX
+    try:
+        copy_file_data(src, temp_path, size, digest)
+        os.replace(temp_path, dst)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def apply_metadata(batch):
+    # 所有数据写完后统一设置时间戳和权限位，减少与数据写入交错的元数据系统调用
+    for dst, src_stat in batch:
+        os.utime(dst, ns=(src_stat.st_atime_ns, src_stat.st_mtime_ns))
+        mode = stat_module.S_IMODE(src_stat.st_mode)
+        if mode != stat_module.S_IMODE(os.stat(dst).st_mode):
+            try:
+                os.chmod(dst, mode)
+            except OSError:
+                pass
+
+def copy_files(jobs, progress=None, cancel_event=None, workers=DEFAULT_COPY_WORKERS, hashes=None, errors=None):
+    # jobs 为 (源路径, 目标路径, 大小) 列表；大文件在当前线程顺序复制，小文件放入线程池并发复制
+    # progress(1, 大小) 在每个文件完成后调用；cancel_event 置位后不再开始新的文件
+    # hashes 为 源路径 -> sha256 的字典时，其中还没有的源文件在复制的同时计算哈希并写入
+    # errors 为字典时单个文件的 OSError（例如文件被占用）记入 目标路径 -> OSError 并继续复制其余文件，否则中止
+    metadata = []
+    failed = threading.Event()  # 任一文件出错后其余线程不再开始新的复制
+
+    def copy_one(job):
+        src, dst, size = job
+        if failed.is_set():
+            return
+        if cancel_event is not None and cancel_event.is_set():
+            raise SyncCancelled("操作已取消")
+        try:
+            src_stat = os.stat(src)
+            digest = hashlib.sha256() if hashes is not None and src not in hashes else None
+            copy_file(src, dst, size, digest)
+        except OSError as e:
+            if errors is None:
+                failed.set()
+                raise
+            errors[dst] = e
+            return
+        except BaseException:
+            failed.set()
+            raise
+        if digest is not None:
+            hashes[src] = digest.hexdigest()
+        metadata.append((dst, src_stat))
+        if progress is not None:
+            progress(1, size)
+
+    small = [job for job in jobs if job[2] < SMALL_FILE_THRESHOLD]
+    large = [job for job in jobs if job[2] >= SMALL_FILE_THRESHOLD]
+    try:
+        if len(small) > 1 and workers > 1:
+            with ThreadPoolExecutor(max_workers=min(workers, len(small))) as pool:
+                futures = [pool.submit(copy_one, job) for job in small]
+                for job in large:
+                    copy_one(job)
+                for future in futures:
+                    future.result()
+        else:
+            for job in small + large:
+                copy_one(job)
+    finally:
+        # 取消或出错时也为已写完的文件补上元数据，下次增量同步可以正确跳过它们
+        apply_metadata(metadata)
+
+def fsync_files(paths, workers=DEFAULT_COPY_WORKERS):
+    # 批量落盘：文件在线程池中并发 fsync，之后每个涉及的目录只 fsync 一次（使改名/新建的目录项持久化）
+    # 返回 路径 -> OSError，只包含 fsync 失败的文件
+    def sync_file(path):
+        try:
+            # Windows 的 fsync（_commit）需要可写的句柄
+            fd = os.open(path, os.O_RDWR if os.name == 'nt' else os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+        except OSError as e:
+            return path, e
+        return None
+
+    if len(paths) > 1 and workers > 1:
+        with ThreadPoolExecutor(max_workers=min(workers, len(paths))) as pool:
+            results = list(pool.map(sync_file, paths))
+    else:
+        results = [sync_file(path) for path in paths]
+    errors = dict(result for result in results if result is not None)
+    if os.name != 'nt':  # Windows 不能打开目录做 fsync
+        for directory in sorted({os.path.dirname(path) for path in paths}):
+            try:
+                fd = os.open(directory, os.O_RDONLY)
+                try:
+                    os.fsync(fd)
+                finally:
+                    os.close(fd)
+            except OSError:
+                pass  # 部分文件系统不支持对目录 fsync
+    return errors
+
+def copy_tree(src, dst, progress=None, cancel_event=None):
+    # 与 shutil.copytree 等价，但使用上面的复制引擎
+    jobs = []
+    for root, dirs, files in os.walk(src):
+        target_root = os.path.join(dst, os.path.relpath(root, src))
+        os.makedirs(target_root, exist_ok=True)
+        for name in files:
+            path = os.path.join(root, name)
+            jobs.append((path, os.path.join(target_root, name), os.path.getsize(path)))
+    copy_files(jobs, progress, cancel_event)
+    shutil.copystat(src, dst)
@@ -1,24 +1,67 @@
 import os
 import json
-import shutil
+import time
+import threading
 from PyQt5.QtWidgets import (QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-                             QComboBox, QListWidget, QPushButton, QFileDialog,
+                             QComboBox, QListWidget, QListWidgetItem, QPushButton, QFileDialog,
                              QMenuBar, QMessageBox, QInputDialog, QLabel,
-                             QGroupBox, QSizePolicy, QMenu, QAction, QDesktopWidget,
-                             QStyledItemDelegate, QApplication, QFrame)
-from PyQt5.QtCore import Qt, QSize
-from PyQt5.QtGui import QIcon, QPalette, QColor, QFont
-from file_operations import get_subdirectories
+                             QGroupBox, QSizePolicy, QMenu, QAction, QDesktopWidget, QProgressBar,
+                             QStyledItemDelegate, QApplication, QFrame, QLineEdit, QCompleter,
+                             QDialog, QDialogButtonBox, QTreeWidget, QTreeWidgetItem)
+from PyQt5.QtCore import Qt, QSize, QThreadPool, QStringListModel, QTimer, QUrl
+from PyQt5.QtGui import QIcon, QPalette, QColor, QFont, QStandardItemModel, QDesktopServices
+from file_operations import format_size, resolve_role_path, split_root
+from hierarchy_index import HierarchyIndex
+from hierarchy_model import HierarchyModel
+from hierarchy_watcher import HierarchyWatcher
+from snapshot_store import SnapshotStore
+from state_store import StateWriter, PresetStore, LAST_PATH_FILE
+from tree_diff import is_identical
+from transfer_filter import (PROFILES_FILE, FULL_PROFILE, ProfileError, load_profiles, save_default_profiles,
+                             compile_profile, preset_selections, preset_profile, make_preset)
+from workers import JobQueueSignals, DiffWorker, TaskWorker, HierarchyScanWorker, SearchIndexWorker
+from startup_trace import trace
+from telemetry import telemetry, TELEMETRY_LOG
+from job_queue import JobQueue, PENDING, RUNNING, DONE, FAILED, CANCELLED
 
 class FileManagerUI(QMainWindow):
     def __init__(self):
         super().__init__()
-        self.base_path = ""
+        telemetry.configure()  # 操作耗时、缓存命中等写入 telemetry.log（按大小轮转）
+        self.roots = []  # 登记的游戏数据文件夹（可以是多个客户端的 userdata），源和目标可以位于不同的数据文件夹
+        self.base_path = ""  # 源面板当前的数据文件夹
+        self.target_base_path = ""  # 目标面板当前的数据文件夹
         self.last_left_path = ""
-        self.presets = self.load_presets()
-        self.subdirs_cache = {}  # 添加缓存
+        self.state_writer = StateWriter()  # presets/last_path 的合并写入在后台线程完成
+        self.presets = PresetStore(self.state_writer)
+        self.last_path_file = os.path.abspath(LAST_PATH_FILE)
+        self.saved_last_path = None
+        self.transfer_profiles = load_profiles()  # 传输方案：只同步匹配规则的文件
+        self.subdirs_cache = HierarchyIndex()  # 持久化目录索引，按 mtime 失效
+        self.hash_cache = None  # 预览改动/导出时比较文件内容用，第一次使用时才打开
+        self.diff_worker = None
+        self.task_worker = None  # 导出/导入配置包
+        self.snapshot_store = SnapshotStore()
+        # 改键任务队列：任务持久化在 job_queue.json 中，同一目标的重复任务会合并
+        self.job_queue_signals = JobQueueSignals(self)
+        self.job_queue_signals.changed.connect(self.on_job_queue_changed)
+        self.job_queue = JobQueue(self.state_writer, snapshot_store=self.snapshot_store,
+                                  listener=self.job_queue_signals.changed.emit)
+        self.batch_job_ids = []  # 本轮提交的任务，队列空闲时汇总结果
+        self.batch_start = 0.0
+        self.hierarchy_model = HierarchyModel(self.subdirs_cache, self)  # 两个面板共用
+        self.empty_combo_model = QStandardItemModel(self)  # 上级没有选择时下拉框显示为空
+        self.path_search_indexes = {}  # 数据文件夹 -> 搜索索引，第一次在该数据文件夹中搜索时在后台建立，目录变化后重建
+        self.search_generations = {}  # 数据文件夹 -> 目录版本号，建立期间目录有变化时丢弃结果重建
+        self.search_builds = set()  # 正在后台建立索引的数据文件夹
+        self.pending_search = None  # 索引建好前输入的搜索：(数据文件夹, 补全器)
+        self.search_results = {}
+        self.scan_cancel = threading.Event()  # 关闭窗口时中止后台的索引预热
+        self.hierarchy_watcher = HierarchyWatcher(self)
+        self.hierarchy_watcher.directories_changed.connect(self.on_directories_changed)
         self.init_ui()
-        self.load_data()
+        # 窗口先显示，恢复上次的选择和校验目录索引放到事件循环开始之后
+        QTimer.singleShot(0, self.load_data)
 
     def init_ui(self):
         self.setWindowTitle("剑网3改键工具 by咕涌")
@@ -47,7 +90,7 @@ class FileManagerUI(QMainWindow):
         if os.path.exists(icon_path):
             self.setWindowIcon(QIcon(icon_path))
         else:
-            print(f"Icon file not found: {icon_path}")
+            telemetry.warn(f"Icon file not found: {icon_path}")
 
     def setup_main_layout(self):
         main_layout = QHBoxLayout()
@@ -65,26 +108,221 @@ class FileManagerUI(QMainWindow):
         layout.setSpacing(15)  # 增加间距
         layout.setContentsMargins(15, 25, 15, 15)  # 增加边距
 
+        root_combo = self.create_combo("数据文件夹")
+        layout.addWidget(root_combo)
+        root_combo = root_combo.findChild(QComboBox)
+        root_combo.setModel(self.hierarchy_model)  # 模型顶层即各个数据文件夹
+        root_combo.currentIndexChanged.connect(lambda _: self.on_root_changed(is_source))
+
+        layout.addWidget(self.create_search_box(is_source))
+
         combos = []
         for label_text in ["账号", "大区", "区服", "角色"]:
             combo = self.create_combo(label_text)
             combos.append(combo)
             layout.addWidget(combo)
+        for level, combo in enumerate(combos):
+            combo.findChild(QComboBox).currentIndexChanged.connect(
+                lambda _, level=level: self.on_combo_changed(self.root_for(combos), combos, level))
 
-        layout.addStretch(1)
+        if is_source:
+            layout.addStretch(1)
+        else:
+            layout.addWidget(self.create_target_list())
+            layout.addWidget(self.create_profile_selector())
+            self.preview_button = QPushButton("预览改动")
+            self.preview_button.clicked.connect(self.preview_change_key)
+            layout.addWidget(self.preview_button)
 
         button = QPushButton("保存预设" if is_source else "点击改键")
         button.setFixedHeight(40)  # 增加按钮高度
         button.clicked.connect(self.save_preset if is_source else self.change_key)
         layout.addWidget(button)
 
+        if not is_source:
+            layout.addWidget(self.create_progress_area())
+
         if is_source:
             self.source_combos = combos
+            self.source_root_combo = root_combo
         else:
             self.target_combos = combos
+            self.target_root_combo = root_combo
 
         return group_box
 
+    def create_search_box(self, is_source):
+        # 全局搜索：输入账号/大区/区服/角色的前缀、子串或拼音首字母，选中后直接跳转
+        search_box = QLineEdit()
+        search_box.setPlaceholderText("搜索角色（支持拼音首字母）")
+        search_box.setClearButtonEnabled(True)
+        completer = QCompleter(QStringListModel(self), search_box)
+        completer.setCompletionMode(QCompleter.UnfilteredPopupCompletion)
+        completer.setMaxVisibleItems(15)
+        search_box.setCompleter(completer)
+        search_box.textEdited.connect(lambda text: self.on_search_text_edited(text, completer, is_source))
+        completer.activated[str].connect(
+            lambda text: self.on_search_activated(text, search_box, is_source))
+        return search_box
+
+    def ensure_search_index(self, root):
+        # 只在面板当前的数据文件夹中搜索，各数据文件夹的索引分别按需建立；还没建好时在后台建立并返回 None
+        index = self.path_search_indexes.get(root)
+        if index is None:
+            self.build_search_index(root)
+        return index
+
+    def build_search_index(self, root):
+        if root in self.search_builds:
+            return
+        self.search_builds.add(root)
+        worker = SearchIndexWorker(root, self.subdirs_cache, self.search_generations.get(root, 0))
+        worker.signals.finished.connect(self.on_search_index_built)
+        QThreadPool.globalInstance().start(worker)
+
+    def on_search_index_built(self, root, generation, index):
+        self.search_builds.discard(root)
+        if root not in self.roots or index is None:
+            return
+        if generation != self.search_generations.get(root, 0):
+            self.build_search_index(root)  # 建立期间目录又有变化
+            return
+        self.path_search_indexes[root] = index
+        if self.pending_search is not None and self.pending_search[0] == root:
+            _, completer = self.pending_search
+            self.pending_search = None
+            self.show_search_results(index, completer.widget().text(), completer)
+
+    def invalidate_search_indexes(self, paths):
+        # 只重建可见目录确实有变化的数据文件夹的索引（已建立过的在后台立即重建）
+        for root in {split_root(self.roots, path)[0] for path in paths} - {None}:
+            self.search_generations[root] = self.search_generations.get(root, 0) + 1
+            if self.path_search_indexes.pop(root, None) is not None:
+                self.build_search_index(root)
+
+    def on_search_text_edited(self, text, completer, is_source):
+        root = self.base_path if is_source else self.target_base_path
+        if not root:
+            return
+        index = self.ensure_search_index(root)
+        if index is None:
+            self.pending_search = (root, completer)
+            return
+        self.pending_search = None
+        self.show_search_results(index, text, completer)
+
+    def show_search_results(self, index, text, completer):
+        results = index.search(text)
+        self.search_results = {"/".join(parts): parts for parts in results}
+        completer.model().setStringList(list(self.search_results))
+        if results:
+            completer.complete()
+
+    def on_search_activated(self, text, search_box, is_source):
+        parts = self.search_results.get(text)
+        if parts is None:
+            return
+        combos = self.source_combos if is_source else self.target_combos
+        self.set_combo_selections(combos, list(parts))
+        # 补全器会在 activated 之后回填文本，延迟清空搜索框
+        QTimer.singleShot(0, search_box.clear)
+
+    def create_target_list(self):
+        # 多目标列表：非空时点击改键会把源角色同时应用到列表中的所有目标
+        widget = QWidget()
+        layout = QVBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        label = QLabel("批量目标（为空时只改当前选择的目标）")
+        layout.addWidget(label)
+
+        self.target_list = QListWidget()
+        self.target_list.setSelectionMode(QListWidget.ExtendedSelection)
+        layout.addWidget(self.target_list)
+
+        button_layout = QHBoxLayout()
+        add_button = QPushButton("添加当前目标")
+        add_button.clicked.connect(self.add_target_to_list)
+        button_layout.addWidget(add_button)
+        remove_button = QPushButton("移除选中")
+        remove_button.clicked.connect(self.remove_selected_targets)
+        button_layout.addWidget(remove_button)
+        layout.addLayout(button_layout)
+        return widget
+
+    def create_profile_selector(self):
+        widget = QWidget()
+        layout = QHBoxLayout(widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(QLabel("传输方案"))
+        self.profile_combo = QComboBox()
+        self.profile_combo.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        self.profile_combo.addItems(list(self.transfer_profiles))
+        layout.addWidget(self.profile_combo)
+        return widget
+
+    def reload_transfer_profiles(self):
+        current = self.profile_combo.currentText()
+        self.transfer_profiles = load_profiles()
+        self.profile_combo.clear()
+        self.profile_combo.addItems(list(self.transfer_profiles))
+        self.set_current_profile(current)
+
+    def set_current_profile(self, name):
+        index = self.profile_combo.findText(name)
+        self.profile_combo.setCurrentIndex(index if index >= 0 else self.profile_combo.findText(FULL_PROFILE))
+
+    def edit_transfer_profiles(self):
+        if not os.path.exists(PROFILES_FILE):
+            save_default_profiles()
+        QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(PROFILES_FILE)))
+
+    def current_transfer_filter(self):
+        # 每次改键/预览时编译一次规则，整个传输过程共用
+        try:
+            return compile_profile(self.transfer_profiles, self.profile_combo.currentText()), None
+        except ProfileError as e:
+            return None, str(e)
+
+    def create_progress_area(self):
+        # 改键进度：后台执行时显示，完成后隐藏
+        self.progress_widget = QWidget()
+        layout = QVBoxLayout(self.progress_widget)
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.progress_bar = QProgressBar()
+        self.progress_bar.setRange(0, 1000)
+        layout.addWidget(self.progress_bar)
+
+        status_layout = QHBoxLayout()
+        self.progress_label = QLabel()
+        status_layout.addWidget(self.progress_label, 1)
+        self.cancel_button = QPushButton("取消")
+        self.cancel_button.clicked.connect(self.cancel_change_key)
+        status_layout.addWidget(self.cancel_button)
+        layout.addLayout(status_layout)
+
+        self.progress_widget.hide()
+        return self.progress_widget
+
+    def add_target_to_list(self):
+        target_path = self.get_selected_path(self.target_combos)
+        if not target_path or target_path == self.target_base_path:
+            QMessageBox.warning(self, "警告", "请先选择目标角色")
+            return
+        if target_path in self.get_target_list_paths():
+            return
+        item = QListWidgetItem(self.describe_path(target_path))
+        item.setData(Qt.UserRole, target_path)
+        self.target_list.addItem(item)
+
+    def remove_selected_targets(self):
+        for item in self.target_list.selectedItems():
+            self.target_list.takeItem(self.target_list.row(item))
+
+    def get_target_list_paths(self):
+        return [self.target_list.item(i).data(Qt.UserRole) for i in range(self.target_list.count())]
+
     def create_combo(self, label_text):
         layout = QVBoxLayout()
         label = QLabel(label_text)
@@ -112,6 +350,22 @@ class FileManagerUI(QMainWindow):
         layout.addWidget(self.preset_list)
 
         self.update_preset_list()
+
+        layout.addWidget(QLabel("改键队列"))
+        self.queue_list = QListWidget()
+        self.queue_list.setSelectionMode(QListWidget.ExtendedSelection)
+        layout.addWidget(self.queue_list)
+        button_layout = QHBoxLayout()
+        cancel_button = QPushButton("取消选中")
+        cancel_button.clicked.connect(self.cancel_selected_jobs)
+        button_layout.addWidget(cancel_button)
+        retry_button = QPushButton("重试选中")
+        retry_button.clicked.connect(self.retry_selected_jobs)
+        button_layout.addWidget(retry_button)
+        clear_button = QPushButton("清除已结束")
+        clear_button.clicked.connect(self.job_queue.clear_finished)
+        button_layout.addWidget(clear_button)
+        layout.addLayout(button_layout)
         return group_box
 
     def get_style_sheet(self):
@@ -224,13 +478,42 @@ class FileManagerUI(QMainWindow):
         """
 
     def load_data(self):
+        trace.mark("显示窗口")
         self.load_last_path()
+        QTimer.singleShot(0, self.resume_job_queue)  # 窗口显示后再询问是否继续上次的任务
 
-        if not self.base_path:
+        if not self.roots:
+            trace.report()
             self.first_time_setup()
         else:
+            # 先直接用持久化索引中的子目录填充下拉框（不访问磁盘），随后在后台校验
+            # 下拉框在模型重置后会自动选中第一项，这里不当作用户切换数据文件夹
+            for root_combo in (self.source_root_combo, self.target_root_combo):
+                root_combo.blockSignals(True)
+            self.hierarchy_model.set_roots(self.roots)
+            for root_combo in (self.source_root_combo, self.target_root_combo):
+                root_combo.blockSignals(False)
+            self.hierarchy_model.trust_cache = True
             self.update_source_combos()
             self.update_target_combos()
+            self.hierarchy_model.trust_cache = False
+            trace.mark("恢复路径")
+            self.start_hierarchy_scan(self.hierarchy_model.loaded_children(), self.roots)
+
+    def start_hierarchy_scan(self, loaded, roots):
+        worker = HierarchyScanWorker(self.subdirs_cache, loaded, roots, self.scan_cancel)
+        if loaded:
+            worker.signals.finished.connect(self.on_hierarchy_scanned)
+        QThreadPool.globalInstance().start(worker)
+
+    def on_hierarchy_scanned(self, changed_paths):
+        # 启动后台校验发现变化的目录：增量刷新模型，下拉框随之更新
+        changed = [path for path in changed_paths if self.hierarchy_model.refresh_path(path)]
+        if changed:
+            self.invalidate_search_indexes(changed)
+            self.update_watched_paths()
+        trace.mark("后台扫描")
+        trace.report()
 
     def first_time_setup(self):
         reply = QMessageBox.question(self, '首次设置', 
@@ -240,16 +523,76 @@ class FileManagerUI(QMainWindow):
             self.select_base_folder()
         else:
             QMessageBox.information(self, '提示', 
-                                    "您可以稍后通过菜单栏的'选择游戏数据文件夹'选项来设置。")
+                                    "您可以稍后通过菜单栏的'添加游戏数据文件夹'选项来设置。")
 
     def select_base_folder(self):
+        # 登记一个新的数据文件夹（例如另一个客户端的 userdata），并在源面板中切换到它
         folder = QFileDialog.getExistingDirectory(self, "选择游戏数据文件夹")
         if folder:
+            folder = self.add_root(folder)
             self.base_path = folder
             self.save_last_path()
             self.update_source_combos()
+            if not self.target_base_path:
+                self.target_base_path = folder
             self.update_target_combos()
 
+    def remove_base_folder(self):
+        if not self.roots:
+            return
+        root, ok = QInputDialog.getItem(self, "移除数据文件夹", "选择要移除的数据文件夹（不会删除任何文件）:",
+                                        self.roots, 0, False)
+        if not ok:
+            return
+        self.roots.remove(root)
+        self.path_search_indexes.pop(root, None)
+        self.hierarchy_model.remove_root(root)  # 选中它的面板会跟着切换到其他数据文件夹
+        self.save_last_path()
+
+    def add_root(self, path):
+        # 登记数据文件夹并在后台预热其索引；已登记时直接返回规范化后的路径
+        path = os.path.normpath(path)
+        if path not in self.roots:
+            self.roots.append(path)
+            self.hierarchy_model.add_root(path)
+            self.start_hierarchy_scan([], [path])
+        return path
+
+    def root_for(self, combos):
+        return self.base_path if combos is self.source_combos else self.target_base_path
+
+    def root_label(self, root):
+        # 多个数据文件夹通常都叫 userdata：取能与其他数据文件夹区分开的最短末尾路径作为简称
+        parts = root.split(os.sep)
+        others = [other.split(os.sep) for other in self.roots if other != root]
+        for n in range(1, len(parts) + 1):
+            if all(other[-n:] != parts[-n:] for other in others):
+                return os.sep.join(parts[-n:])
+        return root
+
+    def on_root_changed(self, is_source):
+        root_combo = self.source_root_combo if is_source else self.target_root_combo
+        combos = self.source_combos if is_source else self.target_combos
+        index = self.hierarchy_model.index(root_combo.currentIndex(), 0)
+        root = index.data(Qt.UserRole) if index.isValid() else ""
+        if is_source:
+            self.base_path = root
+        else:
+            self.target_base_path = root
+        self.populate_combo(root, combos, 0)
+        self.update_watched_paths()
+        self.save_last_path()
+
+    def set_panel_root(self, combos, root):
+        if combos is self.source_combos:
+            self.base_path, root_combo = root, self.source_root_combo
+        else:
+            self.target_base_path, root_combo = root, self.target_root_combo
+        index = self.hierarchy_model.root_index(root)
+        root_combo.blockSignals(True)
+        root_combo.setCurrentIndex(index.row() if index is not None else -1)
+        root_combo.blockSignals(False)
+
     def update_source_combos(self):
         if hasattr(self, 'source_combos'):
             self.update_combos(self.base_path, self.source_combos)
@@ -258,112 +601,355 @@ class FileManagerUI(QMainWindow):
 
     def update_target_combos(self):
         if hasattr(self, 'target_combos'):
-            self.update_combos(self.base_path, self.target_combos)
+            self.update_combos(self.target_base_path or self.base_path, self.target_combos)
 
     def update_combos(self, path, combos):
+        # path 为该面板要显示的数据文件夹（未登记时自动登记），两个面板可以各自位于不同的数据文件夹
         if not path:
             return
-        
-        for combo_widget in combos:
-            combo = combo_widget.findChild(QComboBox)
-            if combo:
-                combo.clear()
+        path = self.add_root(path)
+        self.set_panel_root(combos, path)
         self.populate_combo(path, combos, 0)
+        self.update_watched_paths()
 
     def populate_combo(self, path, combos, level):
+        # path 为第 level 级的父目录；从这一级开始逐级选中第一项
         if level >= len(combos):
             return
-        
-        if not os.path.exists(path):
-            print(f"路径不存在: {path}")
-            return
+        parent = self.hierarchy_model.index_for_path(path) if path else None
+        if parent is None and path:
+            telemetry.warn(f"路径不存在: {path}")
+        self.apply_combo_rows(combos, level, parent, [])
 
-        try:
-            subdirs = get_subdirectories(path, self.subdirs_cache)
-            combo = combos[level].findChild(QComboBox)
-            combo.clear()
-            combo.addItems(subdirs)
-            
-            try:
-                combo.currentIndexChanged.disconnect()
-            except TypeError:
-                pass
-            combo.currentIndexChanged.connect(lambda: self.on_combo_changed(self.base_path, combos, level))
-            
-            if level < len(combos) - 1 and subdirs:
-                next_path = os.path.join(path, subdirs[0])
-                self.populate_combo(next_path, combos, level + 1)
-        except Exception as e:
-            print(f"在填充下拉框时发生错误: {e}")
+    def apply_combo_rows(self, combos, level, parent, rows):
+        # 从第 level 级开始把下拉框挂到模型对应节点上，并依次选中 rows 中的行（缺省选第一项）
+        # 每级只做一次查找，不触发 on_combo_changed 的级联
+        for i in range(level, len(combos)):
+            combo = combos[i].findChild(QComboBox)
+            combo.blockSignals(True)
+            if parent is None:
+                combo.setModel(self.empty_combo_model)
+            else:
+                if combo.model() is not self.hierarchy_model:
+                    combo.setModel(self.hierarchy_model)
+                self.hierarchy_model.fetchMore(parent)
+                combo.setRootModelIndex(parent)
+                row = rows[i - level] if i - level < len(rows) else 0
+                combo.setCurrentIndex(row if row < combo.count() else -1)
+            combo.blockSignals(False)
+            if parent is not None:
+                child = self.hierarchy_model.index(combo.currentIndex(), 0, parent)
+                parent = child if child.isValid() else None
 
     def on_combo_changed(self, base_path, combos, level):
         if level >= len(combos) - 1:
             return
         
-        selected_path = base_path
-        for i in range(level + 1):
-            combo = combos[i].findChild(QComboBox)
-            if combo.currentText():
-                selected_path = os.path.join(selected_path, combo.currentText())
-            else:
-                break
+        combo = combos[level].findChild(QComboBox)
+        next_combo = combos[level + 1].findChild(QComboBox)
+        selected = None
+        if combo.model() is self.hierarchy_model and combo.currentIndex() >= 0:
+            selected = self.hierarchy_model.index(combo.currentIndex(), 0, combo.rootModelIndex())
+        if (selected is not None and next_combo.model() is self.hierarchy_model
+                and next_combo.rootModelIndex().internalPointer() is selected.internalPointer()):
+            return  # 仍是同一个目录（只是行号变化），下级无需重建
 
-        # 清空当前级别之后的所有下拉框
-        for combo in combos[level+1:]:
-            combo.findChild(QComboBox).clear()
-        
         # 更新下一级
-        if os.path.exists(selected_path):
-            self.populate_combo(selected_path, combos, level + 1)
-        else:
-            print(f"路径不存在: {selected_path}")
+        self.apply_combo_rows(combos, level + 1, selected, [])
+        self.update_watched_paths()
 
         if combos == self.source_combos:
             self.save_last_path()  # 每次更改时保存左侧路径
 
+    def get_level_parent_paths(self, combos):
+        # 每一级下拉框的内容来自其父目录：数据文件夹、账号目录、大区目录、区服目录
+        paths = [self.root_for(combos)]
+        for combo in combos[:-1]:
+            text = combo.findChild(QComboBox).currentText()
+            if not text:
+                break
+            paths.append(os.path.join(paths[-1], text))
+        return paths
+
+    def update_watched_paths(self):
+        if not self.roots or not hasattr(self, 'target_combos'):
+            return
+        paths = self.get_level_parent_paths(self.source_combos) + self.get_level_parent_paths(self.target_combos)
+        self.hierarchy_watcher.set_paths(paths)
+
+    def on_directories_changed(self, paths):
+        # 游戏客户端新建/删除角色目录时，只失效并增量刷新受影响的节点，绑定的下拉框自动更新
+        # 工具自己的暂存/回收目录造成的事件不会改变可见的子目录，搜索索引保持不变
+        changed = []
+        for path in paths:
+            self.subdirs_cache.invalidate(path)
+            if self.hierarchy_model.refresh_path(path):
+                changed.append(path)
+        if changed:
+            self.invalidate_search_indexes(changed)
+            self.update_watched_paths()
+
     def save_preset(self):
         name, ok = QInputDialog.getText(self, '保存预设', '请输入预设名称:')
         if ok and name:
             current_selections = self.get_current_selections()
-            self.presets[name] = current_selections
-            self.save_presets()
+            self.presets[name] = make_preset(current_selections, self.profile_combo.currentText())
             self.update_preset_list()
 
     def change_key(self):
         source_path = self.get_selected_path(self.source_combos)
-        target_path = self.get_selected_path(self.target_combos)
+        target_paths = self.get_target_list_paths()
+        if not target_paths:
+            target_paths = [self.get_selected_path(self.target_combos)]
 
-        if not source_path or not target_path:
+        if not source_path or not all(target_paths):
             QMessageBox.warning(self, "警告", "请确保源路径和目标路径都已选择")
             return
 
-        try:
-            # 删除原目标路径的内容，但保留文件夹
-            if os.path.exists(target_path):
-                for item in os.listdir(target_path):
-                    item_path = os.path.join(target_path, item)
-                    if os.path.isfile(item_path):
-                        os.unlink(item_path)
-                    elif os.path.isdir(item_path):
-                        shutil.rmtree(item_path)
+        if self.task_worker is not None:
+            QMessageBox.warning(self, "警告", "有操作正在进行中，请等待完成")
+            return
+
+        transfer_filter, error = self.current_transfer_filter()
+        if error:
+            QMessageBox.critical(self, "错误", error)
+            return
+
+        # 每个目标一个任务放入队列，在后台线程池中执行；选项随任务保存，重启后按原选项继续
+        options = {
+            "use_hash": self.hash_check_action.isChecked(),
+            "atomic": self.atomic_action.isChecked(),
+            "snapshot": self.snapshot_action.isChecked(),
+            "verify": self.verify_action.isChecked(),
+        }
+        if transfer_filter is not None:
+            rules = self.transfer_profiles[self.profile_combo.currentText()]
+            options.update(profile=self.profile_combo.currentText(),
+                           include=list(rules.get("include", [])), exclude=list(rules.get("exclude", [])))
+        jobs = self.job_queue.submit_many(source_path, target_paths, options)
+        added = [job for job in jobs if job is not None]
+        if not added:
+            QMessageBox.information(self, "提示", "相同的改键任务已在队列中")
+            return
+        self.track_jobs(added)
+
+    def track_jobs(self, added):
+        # 新提交的任务并入本轮进度显示，全部结束后统一汇总结果
+        if not self.batch_job_ids:
+            self.batch_start = time.monotonic()
+        self.batch_job_ids.extend(job["id"] for job in added)
+        self.cancel_button.setEnabled(True)
+        self.progress_widget.show()
+        self.on_job_queue_changed()
+
+    def preview_change_key(self):
+        source_path = self.get_selected_path(self.source_combos)
+        target_path = self.get_selected_path(self.target_combos)
+        if not source_path or not target_path or source_path == self.base_path or target_path == self.target_base_path:
+            QMessageBox.warning(self, "警告", "请确保源路径和目标路径都已选择")
+            return
+        if self.diff_worker is not None:
+            return
+        transfer_filter, error = self.current_transfer_filter()
+        if error:
+            QMessageBox.critical(self, "错误", error)
+            return
+        self.diff_worker = DiffWorker(source_path, target_path, self.get_hash_cache(), transfer_filter)
+        self.diff_worker.signals.finished.connect(
+            lambda diff: self.on_diff_finished(source_path, target_path, diff))
+        self.diff_worker.signals.failed.connect(self.on_diff_failed)
+        self.preview_button.setEnabled(False)
+        self.preview_button.setText("正在比较...")
+        QThreadPool.globalInstance().start(self.diff_worker)
+
+    def finish_diff(self):
+        self.diff_worker = None
+        self.preview_button.setEnabled(True)
+        self.preview_button.setText("预览改动")
+
+    def on_diff_failed(self, message):
+        self.finish_diff()
+        QMessageBox.critical(self, "错误", f"比较失败: {message}")
+
+    def on_diff_finished(self, source_path, target_path, diff):
+        self.finish_diff()
+        dialog = QDialog(self)
+        dialog.setWindowTitle("预览改动")
+        dialog.resize(600, 450)
+        layout = QVBoxLayout(dialog)
+        summary = (f"{self.describe_path(source_path)}  →  {self.describe_path(target_path)}\n"
+                   f"新增 {len(diff['added'])} 个，修改 {len(diff['changed'])} 个，删除 {len(diff['removed'])} 项，"
+                   f"需复制 {format_size(diff['copy_bytes'])}；未变化 {diff['unchanged'] + diff['touched']} 个")
+        if diff["touched"]:
+            summary += f"（其中 {diff['touched']} 个只有修改时间不同）"
+        layout.addWidget(QLabel(summary))
+
+        tree = QTreeWidget()
+        tree.setHeaderLabels(["文件", "大小"])
+        tree.setColumnWidth(0, 420)
+        groups = [
+            ("新增", [(rel_path, format_size(size)) for rel_path, size in diff["added"]]),
+            ("修改", [(rel_path, f"{format_size(old)} → {format_size(new)}" if old != new else format_size(new))
+                      for rel_path, new, old in diff["changed"]]),
+            ("删除", [(rel_path, "") for rel_path in diff["removed"]]),
+        ]
+        for title, rows in groups:
+            group = QTreeWidgetItem(tree, [f"{title} ({len(rows)})", ""])
+            for rel_path, size_text in rows:
+                QTreeWidgetItem(group, [rel_path, size_text])
+            group.setExpanded(len(rows) <= 200)
+        layout.addWidget(tree)
+
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        apply_button = buttons.addButton("点击改键", QDialogButtonBox.AcceptRole)
+        apply_button.setEnabled(not is_identical(diff))
+        buttons.accepted.connect(dialog.accept)
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        if dialog.exec_() == QDialog.Accepted:
+            self.change_key()
+
+    def cancel_change_key(self):
+        self.job_queue.cancel_all()
+        self.cancel_button.setEnabled(False)
+        self.progress_label.setText("正在取消...")
+
+    def cancel_selected_jobs(self):
+        for item in self.queue_list.selectedItems():
+            self.job_queue.cancel(item.data(Qt.UserRole))
+
+    def retry_selected_jobs(self):
+        # 只有写入后校验失败的任务可以重试（只重试不一致的文件）
+        jobs = [self.job_queue.retry_mismatches(item.data(Qt.UserRole)) for item in self.queue_list.selectedItems()]
+        added = [job for job in jobs if job is not None]
+        if added:
+            self.track_jobs(added)
+        else:
+            QMessageBox.information(self, "提示", "选中的任务中没有写入后校验失败的任务")
+
+    def resume_job_queue(self):
+        # 上次退出时未完成的任务：询问是否继续
+        pending = self.job_queue.pending_count()
+        if pending:
+            reply = QMessageBox.question(self, "继续改键", f"上次还有 {pending} 个改键任务没有完成，是否继续?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+            if reply == QMessageBox.Yes:
+                self.batch_start = time.monotonic()
+                self.batch_job_ids = [job["id"] for job in self.job_queue.snapshot() if job["status"] == PENDING]
+                self.cancel_button.setEnabled(True)
+                self.progress_widget.show()
             else:
-                os.makedirs(target_path)  # 如果目标路径不存在，创建它
-            
-            # 复制源路径的内容到目标路径
-            for item in os.listdir(source_path):
-                s = os.path.join(source_path, item)
-                d = os.path.join(target_path, item)
-                if os.path.isdir(s):
-                    shutil.copytree(s, d)
-                else:
-                    shutil.copy2(s, d)
-            
-            QMessageBox.information(self, "成功", "改键操作完成")
-            
-            # 更新目标面板
-            self.update_target_combos()
-        except Exception as e:
-            QMessageBox.critical(self, "错误", f"改键操作失败: {str(e)}")
+                self.job_queue.cancel_all()
+        self.job_queue.start()
+
+    def describe_path(self, path):
+        # 角色显示为相对所在数据文件夹的路径；登记了多个数据文件夹时加上数据文件夹的简称
+        root, parts = split_root(self.roots, path)
+        if root is None:
+            return path
+        relative = os.path.join(*parts) if parts else os.curdir
+        return f"[{self.root_label(root)}] {relative}" if len(self.roots) > 1 else relative
+
+    def on_job_queue_changed(self):
+        status_names = {PENDING: "排队", RUNNING: "进行中", DONE: "完成", FAILED: "失败", CANCELLED: "已取消"}
+        jobs = self.job_queue.snapshot()
+        selected = {item.data(Qt.UserRole) for item in self.queue_list.selectedItems()}
+        self.queue_list.clear()
+        for job in jobs:
+            text = f"[{status_names[job['status']]}] {self.describe_path(job['source'])} → {self.describe_path(job['target'])}"
+            if job["status"] == RUNNING and job["total_bytes"]:
+                text += f" {min(100, job['done_bytes'] * 100 // job['total_bytes'])}%"
+            elif job["status"] == FAILED:
+                text += f"：{job['error']}"
+            item = QListWidgetItem(text)
+            item.setData(Qt.UserRole, job["id"])
+            self.queue_list.addItem(item)
+            item.setSelected(job["id"] in selected)
+
+        if not self.batch_job_ids:
+            return
+        batch = [job for job in jobs if job["id"] in self.batch_job_ids]
+        if any(job["status"] in (PENDING, RUNNING) for job in batch):
+            done_bytes = sum(job["done_bytes"] for job in batch)
+            total_bytes = sum(job["total_bytes"] for job in batch)
+            finished = sum(1 for job in batch if job["status"] not in (PENDING, RUNNING))
+            if total_bytes:
+                self.progress_bar.setValue(min(1000, int(done_bytes * 1000 / total_bytes)))
+            if self.cancel_button.isEnabled():
+                elapsed = time.monotonic() - self.batch_start
+                throughput = done_bytes / elapsed if elapsed > 0 else 0.0
+                self.progress_label.setText(f"{finished}/{len(batch)} 个目标，"
+                                            f"{format_size(done_bytes)}/{format_size(total_bytes)}，"
+                                            f"{format_size(throughput)}/s")
+            return
+        self.batch_job_ids = []
+        self.finish_batch(batch)
+
+    def finish_batch(self, batch):
+        self.progress_widget.hide()
+        self.progress_bar.setValue(0)
+        self.progress_label.clear()
+        results = [{"target": job["target"], "ok": job["status"] == DONE, "stats": job["stats"],
+                    "error": job["error"] or "操作已取消"} for job in batch]
+        if batch and all(job["status"] == CANCELLED for job in batch):
+            QMessageBox.information(self, "已取消", "改键操作已取消，未开始的目标不会被修改")
+        elif len(results) == 1 and results[0]["ok"]:
+            QMessageBox.information(self, "成功", "改键操作完成\n" + self.format_sync_stats(results[0]["stats"]))
+        elif len(results) == 1 and not batch[0].get("mismatches"):
+            QMessageBox.critical(self, "错误", f"改键操作失败: {results[0]['error']}")
+        elif len(results) > 1:
+            self.show_fanout_results(results)
+
+        # 更新目标面板
+        self.update_target_combos()
+        self.offer_verify_retry(batch)
+
+    def offer_verify_retry(self, batch):
+        # 写入后校验失败的目标：逐个列出不一致的文件，询问是否重试（已写入的目标只重试这些文件）
+        failed = [job for job in batch if job["status"] == FAILED and job.get("mismatches")]
+        if not failed:
+            return
+        lines = []
+        for job in failed:
+            lines.append(self.describe_path(job["target"]) + ("" if job.get("partial") else "（目标未改动）"))
+            lines.extend(f"    {mismatch['path']}：{mismatch['reason']}" for mismatch in job["mismatches"])
+        if len(lines) > 30:
+            lines = lines[:30] + [f"……（共 {sum(len(job['mismatches']) for job in failed)} 个文件）"]
+        reply = QMessageBox.question(self, "校验失败",
+                                     f"{len(failed)} 个目标有文件写入后校验不一致，可能被杀毒软件或同步盘占用:\n\n"
+                                     + "\n".join(lines) + "\n\n是否重试?",
+                                     QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes)
+        if reply != QMessageBox.Yes:
+            return
+        jobs = [self.job_queue.retry_mismatches(job["id"]) for job in failed]
+        added = [job for job in jobs if job is not None]
+        if added:
+            self.track_jobs(added)
+
+    def show_fanout_results(self, results):
+        lines = []
+        for result in results:
+            name = self.describe_path(result["target"])
+            if result["ok"]:
+                lines.append(f"✔ {name}: {self.format_sync_stats(result['stats'])}")
+            else:
+                lines.append(f"✘ {name}: {result['error']}")
+        failed = sum(1 for result in results if not result["ok"])
+        summary = f"共 {len(results)} 个目标，成功 {len(results) - failed} 个，失败 {failed} 个"
+        if failed:
+            QMessageBox.warning(self, "部分失败", summary + "\n\n" + "\n".join(lines))
+        else:
+            QMessageBox.information(self, "成功", "改键操作完成\n" + summary + "\n\n" + "\n".join(lines))
+
+    def format_sync_stats(self, stats):
+        text = (f"复制 {stats['copied_files']} 个文件 ({format_size(stats['copied_bytes'])})，"
+                f"跳过 {stats['skipped_files']} 个未变化文件 ({format_size(stats['skipped_bytes'])})，"
+                f"删除 {stats['deleted']} 项")
+        if stats.get("verified_files"):
+            text += f"，校验 {stats['verified_files']} 个文件"
+            if stats.get("retried_files"):
+                text += f"（重试 {stats['retried_files']} 个）"
+        return text
 
     def get_current_selections(self):
         selections = [self.base_path]
@@ -373,18 +959,7 @@ class FileManagerUI(QMainWindow):
         return selections
 
     def get_selected_path(self, combos):
-        path = self.base_path
-        for combo in combos:
-            combo_widget = combo.findChild(QComboBox)
-            if combo_widget.currentText():
-                path = os.path.join(path, combo_widget.currentText())
-            else:
-                break
-        return path
-
-    def save_presets(self):
-        with open('presets.json', 'w') as f:
-            json.dump(self.presets, f)
+        return resolve_role_path(self.root_for(combos), [combo.findChild(QComboBox).currentText() for combo in combos])
 
     def update_preset_list(self):
         self.preset_list.clear()
@@ -394,68 +969,331 @@ class FileManagerUI(QMainWindow):
     def load_preset(self, item):
         preset_name = item.text()
         if preset_name in self.presets:
-            selections = self.presets[preset_name]
-            self.base_path = selections[0]
-            self.update_source_combos()
-            self.set_combo_selections(self.source_combos, selections[1:])
+            with telemetry.span("preset.load", preset=preset_name):
+                preset = self.presets[preset_name]
+                selections = preset_selections(preset)
+                self.set_current_profile(preset_profile(preset))
+                self.base_path = self.add_root(selections[0])  # 预设可以来自任意一个数据文件夹
+                self.update_source_combos()
+                self.set_combo_selections(self.source_combos, selections[1:])
 
     def set_combo_selections(self, combos, selections):
-        for combo, selection in zip(combos, selections):
-            combo_widget = combo.findChild(QComboBox)
-            index = combo_widget.findText(selection)
-            if index >= 0:
-                combo_widget.setCurrentIndex(index)
-                self.on_combo_changed(self.base_path, combos, combos.index(combo))
-            else:
+        # 每级按名称查一次模型，最后一次性应用到下拉框
+        root = self.hierarchy_model.root_index(self.root_for(combos))
+        if root is None:
+            return
+        rows = []
+        parent = root
+        for selection in selections[:len(combos)]:
+            index = self.hierarchy_model.child_index(parent, selection)
+            if not index.isValid():
                 break
-
-    def load_presets(self):
-        try:
-            with open('presets.json', 'r') as f:
-                return json.load(f)
-        except (FileNotFoundError, json.JSONDecodeError):
-            return {}
+            rows.append(index.row())
+            parent = index
+        self.apply_combo_rows(combos, 0, root, rows)
+        self.update_watched_paths()
+        if combos == self.source_combos:
+            self.save_last_path()
 
     def save_last_path(self):
         left_path = self.get_selected_path(self.source_combos)
         data = {
             "base_path": self.base_path,
-            "last_left_path": left_path
+            "last_left_path": left_path,
+            "target_base_path": self.target_base_path,
+            "roots": list(self.roots),
         }
-        with open('last_path.json', 'w') as f:
-            json.dump(data, f)
+        if data != self.saved_last_path:
+            self.saved_last_path = data
+            self.state_writer.write_json(self.last_path_file, data)
 
     def load_last_path(self):
         try:
-            with open('last_path.json', 'r') as f:
+            with open(self.last_path_file, 'r') as f:
                 data = json.load(f)
-                self.base_path = data.get("base_path", "")
+                self.saved_last_path = data
+                self.base_path = os.path.normpath(data["base_path"]) if data.get("base_path") else ""
                 self.last_left_path = data.get("last_left_path", self.base_path)
+                self.target_base_path = os.path.normpath(data.get("target_base_path") or self.base_path) \
+                    if self.base_path else ""
+                # 旧版本只记录了一个 base_path
+                roots = data.get("roots") or ([self.base_path] if self.base_path else [])
+                self.roots = list(dict.fromkeys(os.path.normpath(root) for root in roots))
+                for path in (self.base_path, self.target_base_path):
+                    if path and path not in self.roots:
+                        self.roots.append(path)
         except (FileNotFoundError, json.JSONDecodeError):
             self.base_path = ""
+            self.target_base_path = ""
             self.last_left_path = ""
 
     def set_path_in_combos(self, combos, path):
-        if not path or not path.startswith(self.base_path):
-            return
-        relative_path = os.path.relpath(path, self.base_path)
-        parts = relative_path.split(os.sep)
-        for i, part in enumerate(parts):
-            if i < len(combos):
-                combo_widget = combos[i].findChild(QComboBox)
-                index = combo_widget.findText(part)
-                if index >= 0:
-                    combo_widget.setCurrentIndex(index)
-                    self.on_combo_changed(self.base_path, combos, i)
-                else:
-                    break
+        root, parts = split_root([self.root_for(combos)], path) if path else (None, None)
+        if not parts:
+            return
+        self.set_combo_selections(combos, parts)
 
     def setup_menu_bar(self):
         menu_bar = self.menuBar()
         file_menu = menu_bar.addMenu("设置")
         
-        select_base = file_menu.addAction("选择游戏数据文件夹")
+        select_base = file_menu.addAction("添加游戏数据文件夹...")
         select_base.triggered.connect(self.select_base_folder)
+        remove_base = file_menu.addAction("移除游戏数据文件夹...")
+        remove_base.triggered.connect(self.remove_base_folder)
+
+        self.hash_check_action = file_menu.addAction("改键时校验文件内容")
+        self.hash_check_action.setCheckable(True)
+
+        self.atomic_action = file_menu.addAction("整体替换目标角色（中断不会留下半成品）")
+        self.atomic_action.setCheckable(True)
+        self.atomic_action.setChecked(True)
+
+        self.snapshot_action = file_menu.addAction("改键前自动备份目标角色")
+        self.snapshot_action.setCheckable(True)
+        self.snapshot_action.setChecked(True)
+
+        self.verify_action = file_menu.addAction("改键后校验写入的文件（较慢）")
+        self.verify_action.setCheckable(True)
+
+        restore_snapshot = file_menu.addAction("恢复目标角色的备份...")
+        restore_snapshot.triggered.connect(self.restore_target_snapshot)
+
+        export_bundle_action = file_menu.addAction("导出角色配置...")
+        export_bundle_action.triggered.connect(self.export_roles)
+        import_bundle_action = file_menu.addAction("导入角色配置...")
+        import_bundle_action.triggered.connect(self.import_roles)
+
+        edit_profiles = file_menu.addAction("编辑传输方案...")
+        edit_profiles.triggered.connect(self.edit_transfer_profiles)
+        reload_profiles = file_menu.addAction("重新载入传输方案")
+        reload_profiles.triggered.connect(self.reload_transfer_profiles)
+
+        show_stats = file_menu.addAction("性能统计...")
+        show_stats.triggered.connect(self.show_telemetry_stats)
+
+    def show_telemetry_stats(self):
+        # 最近各类操作的耗时分位数和吞吐量，以及缓存命中情况（完整记录见 telemetry.log）
+        labels = {
+            "sync": "改键（每个目标）", "diff": "预览改动", "manifest": "扫描角色目录", "hash": "计算哈希",
+            "hierarchy.scan": "扫描子目录", "search.build": "建立搜索索引", "preset.load": "载入预设",
+            "presets.read": "读取预设文件", "startup.scan": "启动后台校验",
+            "bundle.export": "导出配置包", "bundle.import": "导入角色",
+        }
+        phase_labels = {"manifest": "扫描源", "scan": "扫描目标", "delete": "删除", "compare": "比较",
+                        "copy": "复制", "swap": "换入", "snapshot": "备份", "hash": "哈希"}
+        dialog = QDialog(self)
+        dialog.setWindowTitle("性能统计")
+        dialog.resize(760, 460)
+        layout = QVBoxLayout(dialog)
+        tree = QTreeWidget()
+        tree.setHeaderLabels(["操作", "次数", "中位数", "P95", "P99", "文件", "吞吐量", "错误"])
+        tree.setColumnWidth(0, 200)
+        counters_label = QLabel()
+        counters_label.setWordWrap(True)
+
+        def ms(seconds):
+            return f"{seconds * 1000:.1f} ms"
+
+        def refresh():
+            tree.clear()
+            rows, counters = telemetry.stats()
+            items = {}
+            for row in rows:  # 按名称排序，各阶段（"sync.copy" 等）排在所属操作之后
+                name, _, phase = row["name"].rpartition(".")
+                values = [str(row["count"]), ms(row["p50"]), ms(row["p95"]), ms(row["p99"]),
+                          str(row["files"]) if row["files"] else "",
+                          f"{format_size(row['throughput'])}/s" if row["throughput"] else "",
+                          str(row["errors"]) if row["errors"] else ""]
+                if phase and name in items:
+                    QTreeWidgetItem(items[name], ["  " + phase_labels.get(phase, phase)] + values)
+                else:
+                    items[row["name"]] = QTreeWidgetItem(tree, [labels.get(row["name"], row["name"])] + values)
+            tree.expandAll()
+            lines = []
+            for kind, title in (("hierarchy", "目录索引"), ("hash", "哈希缓存")):
+                hits, misses = counters.get(f"{kind}.cache_hit", 0), counters.get(f"{kind}.cache_miss", 0)
+                if hits + misses:
+                    lines.append(f"{title}命中 {hits}/{hits + misses} ({hits * 100 // (hits + misses)}%)")
+            if counters.get("warnings"):
+                lines.append(f"警告 {counters['warnings']} 条")
+            counters_label.setText("；".join(lines) or "暂无缓存统计")
+
+        refresh()
+        layout.addWidget(tree)
+        layout.addWidget(counters_label)
+        buttons = QDialogButtonBox(QDialogButtonBox.Close)
+        buttons.addButton("刷新", QDialogButtonBox.ActionRole).clicked.connect(refresh)
+        buttons.addButton("打开日志", QDialogButtonBox.ActionRole).clicked.connect(
+            lambda: QDesktopServices.openUrl(QUrl.fromLocalFile(os.path.abspath(TELEMETRY_LOG))))
+        buttons.rejected.connect(dialog.reject)
+        layout.addWidget(buttons)
+        dialog.exec_()
+
+    def restore_target_snapshot(self):
+        if self.job_queue.is_busy() or self.task_worker is not None:
+            QMessageBox.warning(self, "警告", "有操作正在进行中，请等待完成")
+            return
+        target_path = self.get_selected_path(self.target_combos)
+        snapshots = self.snapshot_store.list_snapshots(target_path)
+        if not snapshots:
+            QMessageBox.information(self, "提示", "当前目标角色还没有备份")
+            return
+        labels = [time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(snapshot["created"]))
+                  + f"  {snapshot['label']}（{snapshot['file_count']} 个文件）" for snapshot in snapshots]
+        label, ok = QInputDialog.getItem(self, "恢复备份", f"选择要恢复的备份:\n{target_path}", labels, 0, False)
+        if not ok:
+            return
+        snapshot = snapshots[labels.index(label)]
+
+        def restore():
+            # 恢复前先备份当前状态，恢复操作本身也可以撤销
+            self.snapshot_store.take_snapshot(target_path, label="恢复备份前自动备份")
+            return self.snapshot_store.restore_snapshot(snapshot["id"], target_path)
+
+        self.start_task(restore, self.on_restore_finished)
+
+    def on_restore_finished(self, stats):
+        QMessageBox.information(self, "成功", "恢复备份完成\n" + self.format_sync_stats(stats))
+
+    def start_task(self, func, on_finished, *args, **kwargs):
+        if self.job_queue.is_busy() or self.task_worker is not None:
+            QMessageBox.warning(self, "警告", "有操作正在进行中，请等待完成")
+            return
+        self.task_worker = TaskWorker(func, *args, **kwargs)
+        self.task_worker.signals.finished.connect(lambda result: self.on_task_finished(on_finished, result))
+        self.task_worker.signals.failed.connect(self.on_task_failed)
+        QApplication.setOverrideCursor(Qt.BusyCursor)
+        QThreadPool.globalInstance().start(self.task_worker)
+
+    def on_task_finished(self, on_finished, result):
+        self.task_worker = None
+        QApplication.restoreOverrideCursor()
+        on_finished(result)
+
+    def on_task_failed(self, message):
+        self.task_worker = None
+        QApplication.restoreOverrideCursor()
+        QMessageBox.critical(self, "错误", f"操作失败: {message}")
+
+    def get_hash_cache(self):
+        if self.hash_cache is None:
+            from hash_cache import HashCache
+            self.hash_cache = HashCache()
+        return self.hash_cache
+
+    def export_roles(self):
+        # 把角色配置（或全部预设及其源角色）打包为一个压缩文件，相同内容只存一份
+        from bundle import BUNDLE_SUFFIX
+        choices = ["当前源角色", "全部预设"]
+        if self.target_list.count():
+            choices.insert(1, "批量目标列表中的角色")
+        choice, ok = QInputDialog.getItem(self, "导出角色配置", "选择要导出的内容:", choices, 0, False)
+        if not ok:
+            return
+        roles, presets = [], None
+        if choice == "当前源角色":
+            roles = [(self.base_path, [combo.findChild(QComboBox).currentText() for combo in self.source_combos])]
+        elif choice == "全部预设":
+            presets = dict(self.presets.items())
+        else:
+            roles = [split_root(self.roots, path) for path in self.get_target_list_paths()]
+        if not roles and not presets:
+            QMessageBox.information(self, "提示", "没有可导出的角色")
+            return
+        path, _ = QFileDialog.getSaveFileName(self, "导出角色配置", "角色配置" + BUNDLE_SUFFIX,
+                                              f"配置包 (*{BUNDLE_SUFFIX})")
+        if path:
+            from bundle import export_bundle
+            self.start_task(export_bundle, self.on_export_finished, path, roles, presets, self.get_hash_cache())
+
+    def on_export_finished(self, stats):
+        QMessageBox.information(self, "成功", f"已导出 {stats['roles']} 个角色、{stats['files']} 个文件 "
+                                              f"({format_size(stats['bytes'])})\n"
+                                              f"去重后 {stats['objects']} 份内容，配置包大小 {format_size(stats['bundle_bytes'])}")
+
+    def import_roles(self):
+        from bundle import BUNDLE_SUFFIX, BundleError, import_bundle, read_bundle_manifest, bundle_presets, role_key
+        if not self.base_path:
+            QMessageBox.warning(self, "警告", "请先选择游戏数据文件夹")
+            return
+        path, _ = QFileDialog.getOpenFileName(self, "导入角色配置", "", f"配置包 (*{BUNDLE_SUFFIX});;所有文件 (*)")
+        if not path:
+            return
+        try:
+            manifest = read_bundle_manifest(path)
+        except (OSError, BundleError) as e:
+            QMessageBox.critical(self, "错误", str(e))
+            return
+        keys = [role_key(role["parts"]) for role in manifest["roles"]]
+        root_paths = None
+        if len(manifest.get("roots", [])) > 1:
+            root_paths = self.choose_import_roots(manifest["roots"])
+            if root_paths is None:
+                return
+        targets = None
+        if len(keys) == 1:
+            target_path = self.get_selected_path(self.target_combos)
+            choices = [f"导入到原角色 {keys[0]}"]
+            if target_path != self.target_base_path:
+                choices.append(f"导入到当前目标角色 {self.describe_path(target_path)}")
+            choice, ok = QInputDialog.getItem(self, "导入角色配置", "配置包中的角色将覆盖目标角色:", choices, 0, False)
+            if not ok:
+                return
+            if choices.index(choice) == 1:
+                targets = {keys[0]: target_path}
+        else:
+            destinations = "、".join(dict.fromkeys(root_paths or [self.base_path]))
+            reply = QMessageBox.question(self, "导入角色配置",
+                                         f"将把 {len(keys)} 个角色导入到 {destinations}，覆盖同名角色，是否继续?",
+                                         QMessageBox.Yes | QMessageBox.No, QMessageBox.No)
+            if reply != QMessageBox.Yes:
+                return
+        before_import = None
+        if self.snapshot_action.isChecked():
+            before_import = lambda target: self.snapshot_store.take_snapshot(target, label="导入配置前自动备份")
+        presets = bundle_presets(manifest, self.base_path, root_paths)
+        self.start_task(import_bundle, lambda results: self.on_import_finished(results, presets),
+                        path, self.base_path, None, targets, before_import, self.atomic_action.isChecked(),
+                        root_paths)
+
+    def choose_import_roots(self, roots):
+        # 配置包中的角色来自多个数据文件夹（例如正式服和测试服）时，逐个选择导入到哪个数据文件夹
+        labels = [self.root_label(root) for root in self.roots]
+        known = [os.path.normcase(root) for root in self.roots]
+        root_paths = []
+        for source in roots:
+            normalized = os.path.normcase(os.path.normpath(source))
+            current = known.index(normalized) if normalized in known else self.roots.index(self.base_path)
+            label, ok = QInputDialog.getItem(self, "导入角色配置", f"来自 {source} 的角色导入到:",
+                                             labels, current, False)
+            if not ok:
+                return None
+            root_paths.append(self.roots[labels.index(label)])
+        return root_paths
+
+    def on_import_finished(self, results, presets):
+        for name, preset in presets.items():
+            self.presets[name] = preset
+        if presets:
+            self.update_preset_list()
+        # 导入可能新建了账号/大区/区服目录，刷新对应的层级（目标可能在另一个数据文件夹中）
+        changed = set()
+        for result in results:
+            parent, parts = split_root(self.roots, result["target"])
+            if parts:
+                changed.add(parent)
+                for part in parts[:-1]:
+                    parent = os.path.join(parent, part)
+                    changed.add(parent)
+        self.on_directories_changed(sorted(changed))
+        if len(results) == 1 and results[0]["ok"]:
+            QMessageBox.information(self, "成功", "导入完成\n" + self.format_sync_stats(results[0]["stats"])
+                                    + (f"\n导入预设 {len(presets)} 个" if presets else ""))
+        elif len(results) == 1:
+            QMessageBox.critical(self, "错误", f"导入失败: {results[0]['error']}")
+        else:
+            self.show_fanout_results(results)
 
     def show_preset_context_menu(self, position):
         item = self.preset_list.itemAt(position)
@@ -474,13 +1312,21 @@ class FileManagerUI(QMainWindow):
         if reply == QMessageBox.Yes:
             if preset_name in self.presets:
                 del self.presets[preset_name]
-                self.save_presets()
                 self.update_preset_list()
                 QMessageBox.information(self, "成功", f"预设 '{preset_name}' 已删除")
 
     def closeEvent(self, event):
-        # 在窗口关闭时保存左侧路径
+        # 关闭前中断正在进行的改键（未完成的任务留在队列中，下次启动继续），并等待后台线程在文件边界安全退出
+        self.job_queue.shutdown()
+        self.scan_cancel.set()
+        QThreadPool.globalInstance().waitForDone()
+        # 在窗口关闭时保存左侧路径，并把所有未写出的状态一次写盘
         self.save_last_path()
+        self.state_writer.close()
+        telemetry.close()
+        self.subdirs_cache.close()
+        if self.hash_cache is not None:
+            self.hash_cache.close()
         super().closeEvent(event)
 
 if __name__ == "__main__":
@@ -1,22 +1,434 @@
 import os
 import shutil
+import time
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from copy_engine import SyncCancelled, copy_files, copy_tree, fsync_files, TEMP_SUFFIX
+from trash_bin import (is_internal_name, move_to_trash, make_staging_dir, mark_ready, swap_in,
+                       discard_staging, recover_interrupted, SwapFailed)
+from telemetry import telemetry
 
-def get_subdirectories(path, cache=None):
-    if cache is not None and path in cache:
-        return cache[path]
+HASH_CHUNK_SIZE = 1024 * 1024
+DEFAULT_FANOUT_WORKERS = 4
+DEFAULT_VERIFY_WORKERS = 4
+VERIFY_RETRIES = 2  # 校验不一致的文件最多重新复制的次数
+
+class VerifyError(Exception):
+    # 写入后校验（含重试）仍不一致的文件；mismatches 为 [{"path": 相对路径, "reason": 原因}]
+    # partial 为 True 表示其余文件已写入目标（原地同步），只需重试这些文件；整体替换时目标保持原样
+    def __init__(self, mismatches, partial):
+        names = "、".join(mismatch["path"] for mismatch in mismatches[:3])
+        more = f" 等 {len(mismatches)} 个文件" if len(mismatches) > 3 else ""
+        super().__init__(f"写入后校验失败: {names}{more}" + ("" if partial else "，目标未改动"))
+        self.mismatches = mismatches
+        self.partial = partial
+
+def scan_subdirectories(path):
+    # os.scandir 在 Windows 上直接带回文件类型，无需对每一项再调用 isdir
     try:
-        subdirs = [d for d in os.listdir(path) if os.path.isdir(os.path.join(path, d))]
-        if cache is not None:
-            cache[path] = subdirs
-        return subdirs
-    except PermissionError:
+        with os.scandir(path) as it:
+            return [entry.name for entry in it if entry.is_dir() and not is_internal_name(entry.name)]
+    except (PermissionError, FileNotFoundError, NotADirectoryError):
         return []
 
+def get_subdirectories(path, cache=None):
+    if cache is not None:
+        if hasattr(cache, "get_children"):
+            return cache.get_children(path)
+        if path in cache:
+            telemetry.count("hierarchy.cache_hit")
+            return cache[path]
+        telemetry.count("hierarchy.cache_miss")
+    start = time.perf_counter()
+    subdirs = scan_subdirectories(path)
+    telemetry.observe("hierarchy.scan", time.perf_counter() - start)
+    if cache is not None:
+        cache[path] = subdirs
+    return subdirs
+
 def copy_folder(src, dst):
-    shutil.copytree(src, dst)
+    copy_tree(src, dst)
 
 def delete_folder(path):
     shutil.rmtree(path)
 
 def rename_folder(old_path, new_path):
     os.rename(old_path, new_path)
+
+def resolve_role_path(base_path, parts):
+    # 与界面选择一致：从 base_path 开始逐级拼接，遇到空的一级即停止
+    path = base_path
+    for part in parts:
+        if not part:
+            break
+        path = os.path.join(path, part)
+    return path
+
+def split_root(roots, path):
+    # 返回 path 所在的数据文件夹（嵌套时取最深的一个）和其下的各级目录名；不在任何数据文件夹中时返回 (None, None)
+    path = os.path.normpath(path)
+    best = (None, None)
+    for root in roots:
+        root = os.path.normpath(root)
+        try:
+            relative = os.path.relpath(path, root)
+        except ValueError:  # Windows 上不同盘符
+            continue
+        if relative == os.pardir or relative.startswith(os.pardir + os.sep):
+            continue
+        if best[0] is None or len(root) > len(best[0]):
+            best = (root, [] if relative == os.curdir else relative.split(os.sep))
+    return best
+
+def format_size(num_bytes):
+    for unit in ("B", "KB", "MB", "GB"):
+        if num_bytes < 1024 or unit == "GB":
+            return f"{num_bytes:.0f} {unit}" if unit == "B" else f"{num_bytes:.1f} {unit}"
+        num_bytes /= 1024
+
+def build_manifest(root, transfer_filter=None):
+    # 返回 (files, dirs)：files 为 相对路径 -> (大小, mtime_ns)，dirs 为相对路径集合
+    # 指定 transfer_filter 时只收录匹配的文件，整个被排除的目录不进入；dirs 只含匹配文件的上级目录
+    # 工具自己的回收/暂存目录和复制中断留下的临时文件不算角色内容
+    files = {}
+    dirs = set()
+    if not os.path.isdir(root):
+        return files, dirs
+    start = time.perf_counter()
+    stack = [""]
+    while stack:
+        rel_dir = stack.pop()
+        with os.scandir(os.path.join(root, rel_dir)) as it:
+            for entry in it:
+                if is_internal_name(entry.name) or entry.name.endswith(TEMP_SUFFIX):
+                    continue
+                rel_path = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+                if entry.is_dir(follow_symlinks=False):
+                    if transfer_filter is None:
+                        dirs.add(rel_path)
+                        stack.append(rel_path)
+                    elif transfer_filter.walk_dir(rel_path):
+                        stack.append(rel_path)
+                elif transfer_filter is None or transfer_filter.match_file(rel_path):
+                    st = entry.stat()
+                    files[rel_path] = (st.st_size, st.st_mtime_ns)
+    if transfer_filter is not None:
+        for rel_path in files:
+            parent = os.path.dirname(rel_path)
+            while parent and parent not in dirs:
+                dirs.add(parent)
+                parent = os.path.dirname(parent)
+    telemetry.observe("manifest", time.perf_counter() - start, files=len(files))
+    return files, dirs
+
+def hash_file(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def remove_path(path, trash_parent=None):
+    # 目录整体改名移入回收目录（O(1)），由后台线程慢慢删除；失败时退回直接删除
+    if os.path.isdir(path) and not os.path.islink(path):
+        try:
+            move_to_trash(path, trash_parent)
+        except OSError:
+            shutil.rmtree(path)
+    else:
+        os.unlink(path)
+
+def is_under_any(rel_path, parents):
+    # 判断 rel_path 是否位于 parents 中某个目录之下
+    parent = os.path.dirname(rel_path)
+    while parent:
+        if parent in parents:
+            return True
+        parent = os.path.dirname(parent)
+    return False
+
+def _check_cancel(cancel_event):
+    if cancel_event is not None and cancel_event.is_set():
+        raise SyncCancelled("操作已取消")
+
+def _cached_hash(path, hash_cache):
+    if hash_cache is None:
+        return hash_file(path)
+    digest = hash_cache.get(path)
+    if digest is None:
+        digest = hash_file(path)
+        hash_cache[path] = digest
+    return digest
+
+def _is_unchanged(s, d, size, mtime_ns, current, use_hash, src_hashes):
+    if current is None or current[0] != size:
+        return False
+    if not use_hash:
+        return current[1] == mtime_ns
+    if _cached_hash(s, src_hashes) != hash_file(d):
+        return False
+    if current[1] != mtime_ns:
+        shutil.copystat(s, d)  # 内容一致时只同步时间戳，下次可直接跳过
+    return True
+
+def _verify_copies(copies, src_hashes, span, copy_errors):
+    # copies 为 [(相对路径, 源路径, 目标路径, 大小)]：先批量 fsync，再并行比较目标文件与源文件的哈希
+    # 源文件的哈希优先使用复制时顺便算出的（src_hashes），只有目标文件需要重新读取
+    # copy_errors 为复制时就失败的文件（目标路径 -> OSError），直接算作不一致
+    with span.phase("fsync"):
+        sync_errors = fsync_files([d for _, _, d, _ in copies if d not in copy_errors])
+
+    def check(copy):
+        rel_path, s, d, _ = copy
+        if d in copy_errors:
+            return {"path": rel_path, "reason": f"无法写入: {copy_errors[d]}"}
+        if d in sync_errors:
+            return {"path": rel_path, "reason": f"无法写入磁盘: {sync_errors[d]}"}
+        try:
+            expected = _cached_hash(s, src_hashes)
+            actual = hash_file(d)
+        except OSError as e:
+            return {"path": rel_path, "reason": f"无法读取: {e}"}
+        if actual != expected:
+            return {"path": rel_path, "reason": "内容与源文件不一致"}
+        return None
+
+    with span.phase("verify"):
+        if len(copies) > 1:
+            with ThreadPoolExecutor(max_workers=min(DEFAULT_VERIFY_WORKERS, len(copies))) as pool:
+                results = list(pool.map(check, copies))
+        else:
+            results = [check(copy) for copy in copies]
+    return [result for result in results if result is not None]
+
+def _verify_and_retry(copies, src_hashes, stats, cancel_event, span, partial, copy_errors):
+    # 只重新复制复制失败或校验失败的文件（重新计算源哈希，防止源在第一次复制期间被改动），不重做整个角色
+    mismatches = _verify_copies(copies, src_hashes, span, copy_errors)
+    for _ in range(VERIFY_RETRIES):
+        if not mismatches:
+            break
+        _check_cancel(cancel_event)
+        failed = {mismatch["path"] for mismatch in mismatches}
+        retry = [copy for copy in copies if copy[0] in failed]
+        for _, s, _, _ in retry:
+            src_hashes.pop(s, None)
+        stats["retried_files"] += len(retry)
+        copy_errors = {}
+        with span.phase("copy"):
+            copy_files([(s, d, size) for _, s, d, size in retry], None, cancel_event, hashes=src_hashes,
+                       errors=copy_errors)
+        mismatches = _verify_copies(retry, src_hashes, span, copy_errors)
+    stats["verified_files"] = len(copies)
+    if mismatches:
+        span.fields["mismatches"] = len(mismatches)
+        raise VerifyError(mismatches, partial)
+
+def _link_or_copy(existing, new_path):
+    # 未变化的文件用硬链接放进暂存目录，不支持硬链接时返回 False 由调用方复制
+    try:
+        os.link(existing, new_path)
+        return True
+    except OSError:
+        return False
+
+def sync_folder(src, dst, use_hash=False, src_manifest=None, src_hashes=None,
+                progress=None, cancel_event=None, atomic=False, transfer_filter=None, span=None, verify=False):
+    # 增量同步：只复制新增或变化的文件，只删除源中已不存在的文件
+    # src_manifest / src_hashes 用于一对多同步时共享源目录的扫描和哈希结果
+    # progress(文件数增量, 字节数增量) 每处理完一个源文件调用一次；cancel_event 置位后在文件之间中止
+    # atomic=True 时在同级暂存目录中生成新内容再整体换入，中途失败或崩溃都不会留下写了一半的目标
+    # transfer_filter 只同步匹配的文件：不匹配的文件在目标中保持原样，因此这时总是原地同步
+    # span 为记录各阶段耗时的 telemetry span，未指定时自己创建一个
+    # verify=True 时复制完成后批量 fsync 并比较哈希，不一致的文件单独重试，最终仍不一致时抛出 VerifyError
+    # （整体替换模式下校验在换入之前进行，失败时目标保持原样）
+    if span is None:
+        with telemetry.span("sync", source=src, target=dst) as span:
+            return sync_folder(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event,
+                               atomic, transfer_filter, span, verify)
+    if src_manifest is None:
+        with span.phase("manifest"):
+            src_manifest = build_manifest(src, transfer_filter)
+    if verify and src_hashes is None:
+        src_hashes = {}  # 复制时算出的源哈希留给校验使用
+    if transfer_filter is not None:
+        span.fields["mode"] = "filtered"
+        stats = _sync_in_place(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event, span,
+                               verify, transfer_filter)
+    elif atomic and os.path.isdir(dst):
+        try:
+            span.fields["mode"] = "atomic"
+            stats = _replace_folder(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event, span,
+                                    verify)
+        except SwapFailed as e:
+            # 进度已在暂存阶段汇报过，原地同步时不再重复汇报
+            telemetry.warn(f"无法整体替换 {dst}，改为原地同步: {e}")
+            span.fields["mode"] = "in_place_fallback"
+            stats = _sync_in_place(src, dst, use_hash, src_manifest, src_hashes, None, cancel_event, span, verify)
+    else:
+        span.fields["mode"] = "in_place"
+        stats = _sync_in_place(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event, span, verify)
+    span.add(files=stats["copied_files"], num_bytes=stats["copied_bytes"])
+    span.fields.update(skipped_files=stats["skipped_files"], deleted=stats["deleted"])
+    return stats
+
+def new_stats():
+    return {
+        "copied_files": 0,
+        "copied_bytes": 0,
+        "skipped_files": 0,
+        "skipped_bytes": 0,
+        "deleted": 0,
+        "verified_files": 0,
+        "retried_files": 0,
+    }
+
+def _sync_in_place(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event, span, verify=False,
+                   transfer_filter=None):
+    stats = new_stats()
+    src_files, src_dirs = src_manifest
+    with span.phase("scan"):
+        if os.path.isdir(dst):
+            dst_files, dst_dirs = build_manifest(dst, transfer_filter)
+        else:
+            os.makedirs(dst)
+            dst_files, dst_dirs = {}, set()
+    trash_parent = os.path.dirname(os.path.normpath(dst))  # 回收目录放在角色目录之外
+
+    # 先删除源中不存在的目录（只删最上层）和文件，同时处理文件/目录类型冲突
+    # 有过滤规则时目录里可能还有不匹配的文件，只逐个删除匹配的文件
+    stale_dirs = sorted(dst_dirs - src_dirs) if transfer_filter is None else []
+    removed_dirs = set()
+    with span.phase("delete"):
+        for rel_dir in stale_dirs:
+            if is_under_any(rel_dir, removed_dirs):
+                continue
+            _check_cancel(cancel_event)
+            remove_path(os.path.join(dst, rel_dir), trash_parent)
+            removed_dirs.add(rel_dir)
+            stats["deleted"] += 1
+        for rel_path in dst_files:
+            if rel_path in src_files or is_under_any(rel_path, removed_dirs):
+                continue
+            _check_cancel(cancel_event)
+            remove_path(os.path.join(dst, rel_path), trash_parent)
+            stats["deleted"] += 1
+
+    for rel_dir in sorted(src_dirs - dst_dirs):
+        os.makedirs(os.path.join(dst, rel_dir), exist_ok=True)
+
+    copy_jobs = []
+    with span.phase("compare"):
+        for rel_path, (size, mtime_ns) in src_files.items():
+            _check_cancel(cancel_event)
+            s = os.path.join(src, rel_path)
+            d = os.path.join(dst, rel_path)
+            if _is_unchanged(s, d, size, mtime_ns, dst_files.get(rel_path), use_hash, src_hashes):
+                stats["skipped_files"] += 1
+                stats["skipped_bytes"] += size
+                if progress is not None:
+                    progress(1, size)
+                continue
+            copy_jobs.append((rel_path, s, d, size))
+
+    # 需要复制的文件交给复制引擎（零拷贝系统调用 + 小文件并发 + 元数据批量设置）
+    # 校验模式下单个文件复制失败（被占用等）不中止整个目标，交给校验后的重试处理
+    copy_errors = {} if verify else None
+    with span.phase("copy"):
+        copy_files([job[1:] for job in copy_jobs], progress, cancel_event, hashes=src_hashes if verify else None,
+                   errors=copy_errors)
+    stats["copied_files"] = len(copy_jobs)
+    stats["copied_bytes"] = sum(job[3] for job in copy_jobs)
+    if verify:
+        _verify_and_retry(copy_jobs, src_hashes, stats, cancel_event, span, True, copy_errors)
+    return stats
+
+def _replace_folder(src, dst, use_hash, src_manifest, src_hashes, progress, cancel_event, span, verify=False):
+    # 暂存目录：未变化的文件从旧目标硬链接过来，变化的文件从源复制；
+    # 完成后两次 rename 换入，旧目标进回收目录由后台删除
+    stats = new_stats()
+    src_files, src_dirs = src_manifest
+    dst = os.path.normpath(dst)
+    parent = os.path.dirname(dst)
+    with span.phase("scan"):
+        recover_interrupted(parent)
+        dst_files, dst_dirs = build_manifest(dst)
+    staging = make_staging_dir(parent)
+    try:
+        for rel_dir in sorted(src_dirs):
+            os.makedirs(os.path.join(staging, rel_dir), exist_ok=True)
+
+        copy_jobs = []
+        with span.phase("compare"):
+            for rel_path, (size, mtime_ns) in src_files.items():
+                _check_cancel(cancel_event)
+                s = os.path.join(src, rel_path)
+                d = os.path.join(dst, rel_path)
+                staged = os.path.join(staging, rel_path)
+                if _is_unchanged(s, d, size, mtime_ns, dst_files.get(rel_path), use_hash, src_hashes) \
+                        and _link_or_copy(d, staged):
+                    stats["skipped_files"] += 1
+                    stats["skipped_bytes"] += size
+                    if progress is not None:
+                        progress(1, size)
+                    continue
+                copy_jobs.append((rel_path, s, staged, size))
+        copy_errors = {} if verify else None
+        with span.phase("copy"):
+            copy_files([job[1:] for job in copy_jobs], progress, cancel_event,
+                       hashes=src_hashes if verify else None, errors=copy_errors)
+        stats["copied_files"] = len(copy_jobs)
+        stats["copied_bytes"] = sum(job[3] for job in copy_jobs)
+        if verify:
+            _verify_and_retry(copy_jobs, src_hashes, stats, cancel_event, span, False, copy_errors)
+        removed_dirs = set()
+        for rel_dir in sorted(dst_dirs - src_dirs):
+            if not is_under_any(rel_dir, removed_dirs):
+                removed_dirs.add(rel_dir)
+        stats["deleted"] = len(removed_dirs) + sum(
+            1 for rel_path in dst_files if rel_path not in src_files and not is_under_any(rel_path, removed_dirs))
+
+        _check_cancel(cancel_event)
+        with span.phase("swap"):
+            staging = mark_ready(staging, os.path.basename(dst))
+            swap_in(staging, dst)
+    except BaseException:
+        discard_staging(staging)
+        raise
+    return stats
+
+def sync_to_targets(src, targets, use_hash=False, max_workers=DEFAULT_FANOUT_WORKERS,
+                    src_manifest=None, progress=None, cancel_event=None, before_sync=None, atomic=False,
+                    transfer_filter=None, verify=False, src_hashes=None):
+    # 一对多同步：源目录只扫描一次，写入各目标在有界线程池中并行执行
+    # before_sync(target) 在写入每个目标之前调用（例如为目标拍快照），抛出异常则跳过该目标
+    # 返回每个目标的结果 {"target", "ok", "stats", "error"}，目标去重后保持原顺序；
+    # 校验失败的结果另有 "mismatches"（见 VerifyError）
+    # 源文件的哈希（包括校验时复制过程中算出的）在各目标之间共享，每个源文件最多读一次；
+    # src_hashes 可由调用方传入，在多次调用之间共享（例如改键队列中同一源的多个任务）
+    targets = list(dict.fromkeys(os.path.normpath(t) for t in targets))
+    if src_manifest is None:
+        src_manifest = build_manifest(src, transfer_filter)
+    if src_hashes is None:
+        src_hashes = {}
+
+    def run(target):
+        if os.path.normcase(target) == os.path.normcase(os.path.normpath(src)):
+            return {"target": target, "ok": False, "stats": None, "error": "目标与源路径相同"}
+        try:
+            with telemetry.span("sync", source=src, target=target) as span:
+                if before_sync is not None:
+                    with span.phase("snapshot"):
+                        before_sync(target)
+                stats = sync_folder(src, target, use_hash, src_manifest, src_hashes,
+                                    progress, cancel_event, atomic, transfer_filter, span, verify)
+            return {"target": target, "ok": True, "stats": stats, "error": None}
+        except VerifyError as e:
+            return {"target": target, "ok": False, "stats": None, "error": str(e), "mismatches": e.mismatches,
+                    "partial": e.partial}
+        except Exception as e:
+            return {"target": target, "ok": False, "stats": None, "error": str(e)}
+
+    if not targets:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(targets)))) as pool:
+        return list(pool.map(run, targets))
@@ -0,0 +1,121 @@
+import os
+import time
+import sqlite3
+import threading
+from file_operations import hash_file
+from telemetry import telemetry
+
+DEFAULT_CACHE_PATH = 'hash_cache.db'
+PROCESS_POOL_MIN_BYTES = 8 * 1024 * 1024  # 待哈希内容少于此时直接在当前进程计算，省去进程间传递的开销
+DEFAULT_HASH_PROCESSES = max(1, min(4, (os.cpu_count() or 1)))
+
+def file_key(path):
+    # 缓存键：大小、mtime_ns、inode 都没变才认为内容没变（inode 变化说明文件被整体替换过）
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+class HashCache:
+    # 文件内容哈希的持久化缓存，按 (路径, 大小, mtime, inode) 命中；未命中的文件在进程池中并行计算
+    def __init__(self, db_path=DEFAULT_CACHE_PATH, processes=DEFAULT_HASH_PROCESSES):
+        self.db_path = db_path
+        self.processes = processes
+        self.lock = threading.Lock()
+        self.entries = {}  # 进程内缓存：路径 -> (大小, mtime_ns, inode, 哈希)
+        self.pool = None
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER NOT NULL, "
+                              "mtime_ns INTEGER NOT NULL, inode INTEGER NOT NULL, digest TEXT NOT NULL)")
+            self.conn.commit()
+            self.load()
+        except sqlite3.Error as e:
+            telemetry.warn(f"无法打开哈希缓存 {db_path}: {e}")
+            self.conn = None
+
+    def load(self):
+        for path, size, mtime_ns, inode, digest in self.conn.execute(
+                "SELECT path, size, mtime_ns, inode, digest FROM hashes"):
+            self.entries[path] = (size, mtime_ns, inode, digest)
+
+    def lookup(self, path, key):
+        entry = self.entries.get(path)
+        if entry is not None and entry[:3] == key:
+            return entry[3]
+        return None
+
+    def get_hash(self, path):
+        return self.get_hashes([path])[path]
+
+    def get_hashes(self, paths):
+        # 返回 路径 -> sha256；只有键变化或从未见过的文件才会重新计算
+        digests = {}
+        missing = []
+        for path in paths:
+            path = os.path.normpath(path)
+            key = file_key(path)
+            digest = self.lookup(path, key)
+            if digest is None:
+                missing.append((path, key))
+            else:
+                digests[path] = digest
+        telemetry.count("hash.cache_hit", len(digests))
+        if missing:
+            telemetry.count("hash.cache_miss", len(missing))
+            start = time.perf_counter()
+            computed = self.compute(missing)
+            telemetry.observe("hash", time.perf_counter() - start, files=len(missing),
+                              num_bytes=sum(key[0] for _, key in missing))
+            self.store([(path, key, computed[path]) for path, key in missing])
+            digests.update(computed)
+        return digests
+
+    def compute(self, missing):
+        paths = [path for path, _ in missing]
+        total_bytes = sum(key[0] for _, key in missing)
+        if len(paths) > 1 and total_bytes >= PROCESS_POOL_MIN_BYTES and self.processes > 1:
+            from concurrent.futures.process import BrokenProcessPool  # 用到时才加载 multiprocessing
+            try:
+                pool = self.get_pool()
+                chunksize = max(1, len(paths) // (self.processes * 4))
+                return dict(zip(paths, pool.map(hash_file, paths, chunksize=chunksize)))
+            except (OSError, BrokenProcessPool) as e:
+                telemetry.warn(f"哈希进程池不可用，改为单进程计算: {e}")
+                self.shutdown_pool()
+        return {path: hash_file(path) for path in paths}
+
+    def get_pool(self):
+        with self.lock:
+            if self.pool is None:
+                from concurrent.futures import ProcessPoolExecutor
+                self.pool = ProcessPoolExecutor(max_workers=self.processes)
+            return self.pool
+
+    def shutdown_pool(self):
+        with self.lock:
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def store(self, items):
+        with self.lock:
+            rows = []
+            for path, key, digest in items:
+                self.entries[path] = key + (digest,)
+                rows.append((path,) + key + (digest,))
+            if self.conn is not None:
+                try:
+                    self.conn.executemany("INSERT OR REPLACE INTO hashes (path, size, mtime_ns, inode, digest) "
+                                          "VALUES (?, ?, ?, ?, ?)", rows)
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    telemetry.warn(f"写入哈希缓存失败: {e}")
+
+    def close(self):
+        self.shutdown_pool()
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
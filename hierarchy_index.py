@@ -0,0 +1,105 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from file_operations import scan_subdirectories
+from telemetry import telemetry
+
+DEFAULT_INDEX_PATH = 'hierarchy_index.db'
+DEFAULT_SCAN_WORKERS = 8
+SCAN_DEPTH = 4  # 扫描 数据文件夹、账号、大区、区服 四级的子目录（角色目录本身的内容不需要）
+
+class HierarchyIndex:
+    # 账号→大区→区服→角色 目录层级的持久化索引
+    # 每个目录记录其 mtime_ns 与子目录列表；读取时只对 mtime 变化的目录重新扫描
+    def __init__(self, db_path=DEFAULT_INDEX_PATH):
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        self.entries = {}  # 进程内缓存：路径 -> (mtime_ns, 子目录列表)
+        self.conn = None
+        try:
+            self.conn = sqlite3.connect(db_path, check_same_thread=False)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute("PRAGMA synchronous=NORMAL")
+            self.conn.execute("CREATE TABLE IF NOT EXISTS dirs ("
+                              "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, children TEXT NOT NULL)")
+            self.conn.commit()
+            self.load()
+        except sqlite3.Error as e:
+            # 索引文件损坏或不可写时退化为纯内存缓存
+            telemetry.warn(f"无法打开目录索引 {db_path}: {e}")
+            self.conn = None
+
+    def load(self):
+        for path, mtime_ns, children in self.conn.execute("SELECT path, mtime_ns, children FROM dirs"):
+            self.entries[path] = (mtime_ns, json.loads(children))
+
+    def cached_children(self, path):
+        # 不做校验，直接返回索引中的子目录（用于启动时快速显示）
+        entry = self.entries.get(os.path.normpath(path))
+        return list(entry[1]) if entry else None
+
+    def get_children(self, path):
+        path = os.path.normpath(path)
+        try:
+            mtime_ns = os.stat(path).st_mtime_ns
+        except OSError:
+            self.invalidate(path)
+            return []
+        entry = self.entries.get(path)
+        if entry is not None and entry[0] == mtime_ns:
+            telemetry.count("hierarchy.cache_hit")
+            return list(entry[1])
+        telemetry.count("hierarchy.cache_miss")
+        start = time.perf_counter()
+        children = scan_subdirectories(path)
+        telemetry.observe("hierarchy.scan", time.perf_counter() - start)
+        self.store(path, mtime_ns, children)
+        return list(children)
+
+    def scan_roots(self, roots, max_workers=DEFAULT_SCAN_WORKERS, cancel_event=None):
+        # 并发预热多个数据文件夹的索引：逐层推进，同一层的所有目录（跨数据文件夹）一起交给线程池，
+        # os.scandir 期间不占 GIL；mtime 未变的目录直接命中。返回检查的目录数
+        frontier = [os.path.normpath(root) for root in roots]
+        checked = 0
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="IndexScan") as pool:
+            for _ in range(SCAN_DEPTH):
+                if not frontier or (cancel_event is not None and cancel_event.is_set()):
+                    break
+                next_frontier = []
+                for path, names in zip(frontier, pool.map(self.get_children, frontier)):
+                    next_frontier.extend(os.path.join(path, name) for name in names)
+                checked += len(frontier)
+                frontier = next_frontier
+        return checked
+
+    def store(self, path, mtime_ns, children):
+        with self.lock:
+            self.entries[path] = (mtime_ns, children)
+            if self.conn is not None:
+                try:
+                    self.conn.execute("INSERT OR REPLACE INTO dirs (path, mtime_ns, children) VALUES (?, ?, ?)",
+                                      (path, mtime_ns, json.dumps(children, ensure_ascii=False)))
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    telemetry.warn(f"写入目录索引失败: {e}")
+
+    def invalidate(self, path):
+        path = os.path.normpath(path)
+        with self.lock:
+            if self.entries.pop(path, None) is None:
+                return
+            if self.conn is not None:
+                try:
+                    self.conn.execute("DELETE FROM dirs WHERE path = ?", (path,))
+                    self.conn.commit()
+                except sqlite3.Error as e:
+                    telemetry.warn(f"写入目录索引失败: {e}")
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
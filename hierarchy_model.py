@@ -0,0 +1,211 @@
+import os
+from PyQt5.QtCore import Qt, QAbstractItemModel, QModelIndex
+from file_operations import split_root
+
+HIERARCHY_DEPTH = 4  # 账号、大区、区服、角色
+
+class HierarchyNode:
+    __slots__ = ("name", "path", "parent", "depth", "children", "rows")
+
+    def __init__(self, name, path, parent, depth):
+        self.name = name
+        self.path = path
+        self.parent = parent
+        self.depth = depth
+        self.children = None  # None 表示尚未加载
+        self.rows = {}  # 子目录名 -> 行号
+
+    def set_children(self, names):
+        self.children = [HierarchyNode(name, os.path.join(self.path, name), self, self.depth + 1)
+                         for name in names]
+        self.reindex()
+
+    def reindex(self):
+        self.rows = {child.name: row for row, child in enumerate(self.children)}
+
+class HierarchyModel(QAbstractItemModel):
+    # 源面板、目标面板和预设共用的层级模型，子目录在第一次展开时才从目录索引读取
+    # 顶层（不显示的 root 节点之下）是登记的各个数据文件夹，其下依次为 账号、大区、区服、角色；
+    # 每个数据文件夹只在某个面板选中它时才开始加载
+    def __init__(self, hierarchy_index, parent=None):
+        super().__init__(parent)
+        self.hierarchy_index = hierarchy_index
+        self.root = HierarchyNode("", "", None, -1)
+        self.root.set_children([])
+        self.trust_cache = False  # 启动时为 True：直接使用索引中的子目录，不检查 mtime
+
+    def set_roots(self, paths):
+        self.beginResetModel()
+        self.root = HierarchyNode("", "", None, -1)
+        self.root.children = [self.new_root_node(path) for path in dict.fromkeys(map(os.path.normpath, paths))]
+        self.root.reindex()
+        self.endResetModel()
+
+    def new_root_node(self, path):
+        return HierarchyNode(path, path, self.root, 0)
+
+    def root_paths(self):
+        return [node.path for node in self.root.children]
+
+    def add_root(self, path):
+        path = os.path.normpath(path)
+        if path not in self.root.rows:
+            row = len(self.root.children)
+            self.beginInsertRows(QModelIndex(), row, row)
+            self.root.children.append(self.new_root_node(path))
+            self.root.reindex()
+            self.endInsertRows()
+        return self.root_index(path)
+
+    def remove_root(self, path):
+        row = self.root.rows.get(os.path.normpath(path))
+        if row is None:
+            return
+        self.beginRemoveRows(QModelIndex(), row, row)
+        del self.root.children[row]
+        self.root.reindex()
+        self.endRemoveRows()
+
+    def root_index(self, path):
+        # 数据文件夹对应的索引；未登记时返回 None
+        row = self.root.rows.get(os.path.normpath(path)) if path else None
+        if row is None:
+            return None
+        return self.createIndex(row, 0, self.root.children[row])
+
+    def node_from_index(self, index):
+        return index.internalPointer() if index.isValid() else self.root
+
+    def index_for_node(self, node):
+        if node is self.root or node is None:
+            return QModelIndex()
+        return self.createIndex(node.parent.rows[node.name], 0, node)
+
+    def index(self, row, column, parent=QModelIndex()):
+        node = self.node_from_index(parent)
+        if column != 0 or node.children is None or not 0 <= row < len(node.children):
+            return QModelIndex()
+        return self.createIndex(row, column, node.children[row])
+
+    def parent(self, index):
+        if not index.isValid():
+            return QModelIndex()
+        return self.index_for_node(index.internalPointer().parent)
+
+    def rowCount(self, parent=QModelIndex()):
+        node = self.node_from_index(parent)
+        return len(node.children) if node.children is not None else 0
+
+    def columnCount(self, parent=QModelIndex()):
+        return 1
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        node = index.internalPointer()
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return node.name
+        if role in (Qt.UserRole, Qt.ToolTipRole):
+            return node.path
+        return None
+
+    def hasChildren(self, parent=QModelIndex()):
+        node = self.node_from_index(parent)
+        if node is self.root:
+            return bool(node.children)
+        if node.depth >= HIERARCHY_DEPTH or not node.path:
+            return False
+        return node.children is None or bool(node.children)
+
+    def canFetchMore(self, parent):
+        node = self.node_from_index(parent)
+        return bool(node.path) and node.depth < HIERARCHY_DEPTH and node.children is None
+
+    def fetchMore(self, parent):
+        self.fetch_node(self.node_from_index(parent))
+
+    def fetch_node(self, node):
+        if node.children is not None or node.depth >= HIERARCHY_DEPTH or not node.path:
+            return
+        names = self.hierarchy_index.cached_children(node.path) if self.trust_cache else None
+        if names is None:
+            names = self.hierarchy_index.get_children(node.path)
+        if not names:
+            node.set_children([])
+            return
+        self.beginInsertRows(self.index_for_node(node), 0, len(names) - 1)
+        node.set_children(names)
+        self.endInsertRows()
+
+    def child_index(self, parent, name):
+        # 在 parent 下按名称查找子项，必要时先加载；找不到返回无效索引
+        node = self.node_from_index(parent)
+        self.fetch_node(node)
+        row = node.rows.get(name)
+        if row is None:
+            return QModelIndex()
+        return self.createIndex(row, 0, node.children[row])
+
+    def index_for_path(self, path):
+        # 先确定所在的数据文件夹，再逐级按名称查找（每级一次字典查询）；找不到返回 None
+        root, parts = split_root(self.root_paths(), path)
+        if root is None:
+            return None
+        index = self.root_index(root)
+        for part in parts:
+            index = self.child_index(index, part)
+            if not index.isValid():
+                return None
+        return index
+
+    def find_loaded_node(self, path):
+        # 只在已加载的部分中查找，不触发扫描
+        root, parts = split_root(self.root_paths(), path)
+        if root is None:
+            return None
+        node = self.root.children[self.root.rows[root]]
+        for part in parts:
+            if node.children is None or part not in node.rows:
+                return None
+            node = node.children[node.rows[part]]
+        return node
+
+    def loaded_children(self):
+        # 所有已加载节点的 (路径, 子目录名列表)，供后台校验使用
+        result = []
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node.children is None or not node.path:
+                continue
+            result.append((node.path, [child.name for child in node.children]))
+            stack.extend(node.children)
+        return result
+
+    def refresh_path(self, path):
+        # 目录内容变化后只对该节点做增量的删除/插入，绑定在该节点上的下拉框会自动更新
+        # 返回子目录是否真的有变化（工具自己的暂存/回收目录不算）
+        node = self.find_loaded_node(path)
+        if node is None or node.children is None:
+            return False
+        names = self.hierarchy_index.get_children(node.path)
+        current = [child.name for child in node.children]
+        if names == current:
+            return False
+        parent = self.index_for_node(node)
+        wanted = set(names)
+        for row in reversed(range(len(node.children))):
+            if node.children[row].name not in wanted:
+                self.beginRemoveRows(parent, row, row)
+                del node.children[row]
+                node.reindex()
+                self.endRemoveRows()
+        added = [name for name in names if name not in node.rows]
+        if added:
+            first = len(node.children)
+            self.beginInsertRows(parent, first, first + len(added) - 1)
+            node.children.extend(HierarchyNode(name, os.path.join(node.path, name), node, node.depth + 1)
+                                 for name in added)
+            node.reindex()
+            self.endInsertRows()
+        return True
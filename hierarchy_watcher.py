@@ -0,0 +1,40 @@
+import os
+from PyQt5.QtCore import QObject, QFileSystemWatcher, QTimer, pyqtSignal
+
+DEFAULT_COALESCE_MS = 300
+
+class HierarchyWatcher(QObject):
+    # 监视层级目录的变化；一段时间内的多次事件合并为一次 directories_changed 信号
+    directories_changed = pyqtSignal(list)
+
+    def __init__(self, parent=None, coalesce_ms=DEFAULT_COALESCE_MS):
+        super().__init__(parent)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.on_directory_changed)
+        self.pending = set()
+        self.timer = QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(coalesce_ms)
+        self.timer.timeout.connect(self.flush)
+
+    def set_paths(self, paths):
+        # 只增删差异部分，避免反复重建系统监视句柄
+        wanted = {os.path.normpath(p) for p in paths if p and os.path.isdir(p)}
+        current = {os.path.normpath(p) for p in self.watcher.directories()}
+        removed = current - wanted
+        added = wanted - current
+        if removed:
+            self.watcher.removePaths(sorted(removed))
+        if added:
+            self.watcher.addPaths(sorted(added))
+
+    def on_directory_changed(self, path):
+        self.pending.add(os.path.normpath(path))
+        self.timer.start()  # 重新计时，事件停止后才统一处理
+
+    def flush(self):
+        if not self.pending:
+            return
+        changed = sorted(self.pending)
+        self.pending.clear()
+        self.directories_changed.emit(changed)
@@ -0,0 +1,274 @@
+import os
+import json
+import time
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from file_operations import build_manifest, sync_to_targets, DEFAULT_FANOUT_WORKERS
+from transfer_filter import TransferFilter, PathListFilter, ProfileError
+from telemetry import telemetry
+
+JOB_QUEUE_FILE = 'job_queue.json'
+DEFAULT_QUEUE_WORKERS = DEFAULT_FANOUT_WORKERS  # 同时写入的目标数，与一对多同步的线程池一致
+MAX_FINISHED_JOBS = 100  # 保留的已结束任务数，供队列面板显示
+PROGRESS_INTERVAL = 0.2  # 运行中任务的进度通知最短间隔（秒）
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+CANCELLED = 'cancelled'
+ACTIVE_STATES = (PENDING, RUNNING)
+
+def _target_key(path):
+    return os.path.normcase(os.path.normpath(path))
+
+class JobQueue:
+    # 改键任务队列：每个任务为 一个源 -> 一个目标 及其选项，保存在 job_queue.json 中，重启后继续未完成的任务
+    # 同一目标的任务会合并：完全相同的任务不会重复加入，尚未开始的旧任务被新任务取代；
+    # 任务在有界线程池中执行，同一目标同时只运行一个任务；
+    # 同一源的任务共享源目录的扫描结果和文件哈希，一次改键到多个目标时源只扫描一次、每个文件最多读一次
+    # listener() 在任务状态或进度变化时从任意线程调用
+    def __init__(self, writer, path=JOB_QUEUE_FILE, snapshot_store=None, max_workers=DEFAULT_QUEUE_WORKERS,
+                 listener=None):
+        self.writer = writer
+        self.path = os.path.abspath(path)
+        self.snapshot_store = snapshot_store
+        self.max_workers = max_workers
+        self.listener = listener
+        self.lock = threading.RLock()
+        self.jobs = []
+        self.cancel_events = {}  # 运行中任务的 id -> Event
+        self.sources = {}  # 源 -> {"lock", "manifests": 过滤规则 -> 扫描结果, "hashes": 源文件 -> sha256}，该源没有排队或运行的任务时丢弃
+        self.executor = None
+        self.paused = True  # 调用 start() 后才开始执行
+        self.stopping = False
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                jobs = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            telemetry.warn(f"无法读取改键队列 {self.path}: {e}")
+            return
+        for job in jobs if isinstance(jobs, list) else []:
+            if job.get("status") == RUNNING:
+                job["status"] = PENDING  # 上次退出时中断的任务重新执行
+            job["done_bytes"] = 0
+            self.jobs.append(job)
+
+    def save(self):
+        with self.lock:
+            self.writer.write_json(self.path, [dict(job) for job in self.jobs])
+
+    def notify(self):
+        if self.listener is not None:
+            self.listener()
+
+    def snapshot(self):
+        # 供界面显示的任务列表副本
+        with self.lock:
+            return [dict(job) for job in self.jobs]
+
+    def pending_count(self):
+        with self.lock:
+            return sum(1 for job in self.jobs if job["status"] == PENDING)
+
+    def is_busy(self):
+        with self.lock:
+            return any(job["status"] in ACTIVE_STATES for job in self.jobs)
+
+    def submit(self, source, target, options):
+        # 返回新任务；与正在排队或运行的任务完全相同时返回 None
+        return self.submit_many(source, [target], options)[0]
+
+    def submit_many(self, source, targets, options):
+        # 一次改键到多个目标：所有任务一起加入后才开始执行，保证它们共享同一份源扫描结果
+        with self.lock:
+            jobs = [self.add_job(source, target, options) for target in targets]
+            self.save()
+        self.notify()
+        self.dispatch()
+        return jobs
+
+    def add_job(self, source, target, options):
+        source = os.path.normpath(source)
+        target = os.path.normpath(target)
+        key = _target_key(target)
+        with self.lock:
+            for job in list(self.jobs):
+                if job["status"] not in ACTIVE_STATES or _target_key(job["target"]) != key:
+                    continue
+                if job["source"] == source and job["options"] == options:
+                    return None
+                if job["status"] == PENDING:
+                    self.jobs.remove(job)  # 被新任务取代
+            job = {
+                "id": uuid.uuid4().hex[:12],
+                "source": source,
+                "target": target,
+                "options": dict(options),
+                "status": PENDING,
+                "error": None,
+                "mismatches": None,  # 写入后校验失败的文件
+                "partial": False,  # 校验失败时其余文件是否已写入目标
+                "stats": None,
+                "created": time.time(),
+                "finished": None,
+                "done_bytes": 0,
+                "total_bytes": 0,
+            }
+            self.jobs.append(job)
+        return job
+
+    def start(self):
+        with self.lock:
+            self.paused = False
+        self.dispatch()
+
+    def dispatch(self):
+        with self.lock:
+            if self.paused or self.stopping:
+                return
+            running_targets = {_target_key(job["target"]) for job in self.jobs if job["status"] == RUNNING}
+            for job in self.jobs:
+                if len(running_targets) >= self.max_workers:
+                    break
+                key = _target_key(job["target"])
+                if job["status"] != PENDING or key in running_targets:
+                    continue
+                if self.executor is None:
+                    self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="JobQueue")
+                job["status"] = RUNNING
+                self.cancel_events[job["id"]] = threading.Event()
+                running_targets.add(key)
+                self.executor.submit(self.run_job, job)
+            self.save()
+        self.notify()
+
+    def run_job(self, job):
+        cancel_event = self.cancel_events[job["id"]]
+        options = job["options"]
+        last_notify = [0.0]
+
+        def progress(files, num_bytes):
+            with self.lock:
+                job["done_bytes"] += num_bytes
+            now = time.monotonic()
+            if now - last_notify[0] >= PROGRESS_INTERVAL:
+                last_notify[0] = now
+                self.notify()
+
+        def before_sync(target):
+            if options.get("snapshot") and self.snapshot_store is not None:
+                self.snapshot_store.take_snapshot(target, label="改键前自动备份")
+
+        try:
+            transfer_filter = None
+            if options.get("files"):
+                transfer_filter = PathListFilter(options["files"])  # 只重试上次校验失败的文件
+            elif options.get("include") or options.get("exclude"):
+                transfer_filter = TransferFilter(options.get("include", []), options.get("exclude", []))
+            if not os.path.isdir(job["source"]):
+                raise FileNotFoundError(f"源路径不存在: {job['source']}")
+            source = self.source_entry(job["source"])
+            filter_key = json.dumps([options.get("files"), options.get("include"), options.get("exclude")])
+            with source["lock"]:
+                src_manifest = source["manifests"].get(filter_key)
+                if src_manifest is None:
+                    src_manifest = source["manifests"][filter_key] = build_manifest(job["source"], transfer_filter)
+            with self.lock:
+                job["total_bytes"] = sum(size for size, _ in src_manifest[0].values())
+            result = sync_to_targets(job["source"], [job["target"]], options.get("use_hash", False), 1,
+                                     src_manifest, progress, cancel_event, before_sync,
+                                     options.get("atomic", True), transfer_filter, options.get("verify", False),
+                                     source["hashes"])[0]
+        except (OSError, ProfileError) as e:
+            result = {"ok": False, "stats": None, "error": str(e)}
+        with self.lock:
+            del self.cancel_events[job["id"]]
+            if result["ok"]:
+                job["status"] = DONE
+            elif cancel_event.is_set():
+                # 退出程序时被中断的任务保持排队状态，下次启动继续
+                job["status"] = PENDING if self.stopping else CANCELLED
+            else:
+                job["status"] = FAILED
+            job["stats"] = result["stats"]
+            job["error"] = result["error"]
+            job["mismatches"] = result.get("mismatches")
+            job["partial"] = result.get("partial", False)
+            job["finished"] = time.time()
+            source_key = _target_key(job["source"])
+            if not any(_target_key(other["source"]) == source_key for other in self.jobs
+                       if other["status"] in ACTIVE_STATES):
+                self.sources.pop(source_key, None)
+            self.trim()
+            self.save()
+        self.notify()
+        self.dispatch()
+
+    def source_entry(self, source):
+        with self.lock:
+            return self.sources.setdefault(_target_key(source),
+                                           {"lock": threading.Lock(), "manifests": {}, "hashes": {}})
+
+    def trim(self):
+        finished = [job for job in self.jobs if job["status"] not in ACTIVE_STATES]
+        for job in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            self.jobs.remove(job)
+
+    def retry_mismatches(self, job_id):
+        # 重试校验失败的任务：其余文件已写入目标时只同步失败的文件，整体替换未换入时按原选项重做；
+        # 返回新任务，任务不是校验失败或已在排队时返回 None
+        with self.lock:
+            job = next((job for job in self.jobs if job["id"] == job_id), None)
+            if job is None or job["status"] != FAILED or not job.get("mismatches"):
+                return None
+            options = dict(job["options"])
+            if job.get("partial"):
+                options["files"] = [mismatch["path"] for mismatch in job["mismatches"]]
+                # 失败文件的列表已经确定，不再叠加传输方案的规则
+                for key in ("profile", "include", "exclude"):
+                    options.pop(key, None)
+        return self.submit(job["source"], job["target"], options)
+
+    def cancel(self, job_id):
+        with self.lock:
+            for job in self.jobs:
+                if job["id"] != job_id:
+                    continue
+                if job["status"] == PENDING:
+                    job["status"] = CANCELLED
+                    job["finished"] = time.time()
+                    self.save()
+                elif job["status"] == RUNNING:
+                    self.cancel_events[job_id].set()
+                break
+        self.notify()
+
+    def cancel_all(self):
+        with self.lock:
+            ids = [job["id"] for job in self.jobs if job["status"] in ACTIVE_STATES]
+        for job_id in ids:
+            self.cancel(job_id)
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job["status"] in ACTIVE_STATES]
+            self.save()
+        self.notify()
+
+    def shutdown(self):
+        # 中断运行中的任务（目标保持原样或已整体换入），排队状态写入文件供下次继续
+        with self.lock:
+            self.stopping = True
+            for event in self.cancel_events.values():
+                event.set()
+            executor, self.executor = self.executor, None
+        if executor is not None:
+            executor.shutdown(wait=True)
+        self.save()
@@ -1,24 +1,34 @@
+from startup_trace import trace, enable_from_argv
 import sys
 import os
-from PyQt5.QtWidgets import QApplication
-from PyQt5.QtGui import QIcon
-from file_manager_ui import FileManagerUI
+import multiprocessing
 
 def main():
-    app = QApplication(sys.argv)
-    
+    argv = enable_from_argv(sys.argv)
+    # 界面模块在这里才导入：哈希进程池的子进程会重新导入本文件，不需要加载 PyQt
+    from PyQt5.QtWidgets import QApplication
+    from PyQt5.QtGui import QIcon
+    from file_manager_ui import FileManagerUI
+    from telemetry import telemetry
+    trace.mark("导入模块")
+
+    app = QApplication(argv)
+
     # 设置应用图标
     icon_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'anymm-x2yaz-001.ico')
     if os.path.exists(icon_path):
         app_icon = QIcon(icon_path)
         app.setWindowIcon(app_icon)
     else:
-        print(f"Icon file not found: {icon_path}")
-    
+        telemetry.warn(f"Icon file not found: {icon_path}")
+    trace.mark("创建应用")
+
     window = FileManagerUI()
     window.setWindowIcon(app.windowIcon())  # 确保主窗口也使用相同的图标
-    window.show()
+    trace.mark("构建窗口")
+    window.show()  # 层级恢复和目录校验在事件循环开始后进行
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    multiprocessing.freeze_support()  # 打包后的 exe 中哈希进程池需要
+    main()
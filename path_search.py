@@ -0,0 +1,119 @@
+import os
+from bisect import bisect_right
+
+_pinyin = None  # 第一次需要拼音时才导入 pypinyin（词库较大，导入需要一段时间）；False 表示未安装
+
+DEFAULT_SEARCH_LIMIT = 50
+MAX_CANDIDATES = 2000  # 单次搜索最多检查的匹配数，保证短查询也能在一次按键内返回
+HIERARCHY_DEPTH = 4
+
+# GB2312 一级汉字按拼音排序，可由区位码区间得到声母（未安装 pypinyin 时使用）
+GB2312_INITIALS = [
+    (0xB0A1, 'a'), (0xB0C5, 'b'), (0xB2C1, 'c'), (0xB4EE, 'd'), (0xB6EA, 'e'),
+    (0xB7A2, 'f'), (0xB8C1, 'g'), (0xB9FE, 'h'), (0xBBF7, 'j'), (0xBFA6, 'k'),
+    (0xC0AC, 'l'), (0xC2E8, 'm'), (0xC4C3, 'n'), (0xC5B6, 'o'), (0xC5BE, 'p'),
+    (0xC6DA, 'q'), (0xC8BB, 'r'), (0xC8F6, 's'), (0xCBFA, 't'), (0xCDDA, 'w'),
+    (0xCEF4, 'x'), (0xD1B9, 'y'), (0xD4D1, 'z'),
+]
+GB2312_CODES = [code for code, _ in GB2312_INITIALS]
+GB2312_LEVEL1_END = 0xD7F9
+
+def _char_initial(char):
+    if char.isascii():
+        return char.lower()
+    try:
+        raw = char.encode('gb2312')
+    except UnicodeEncodeError:
+        return char
+    if len(raw) != 2:
+        return char
+    code = (raw[0] << 8) | raw[1]
+    if code < GB2312_CODES[0] or code > GB2312_LEVEL1_END:
+        return char
+    return GB2312_INITIALS[bisect_right(GB2312_CODES, code) - 1][1]
+
+def _load_pinyin():
+    global _pinyin
+    if _pinyin is None:
+        try:
+            from pypinyin import lazy_pinyin, Style
+            _pinyin = (lazy_pinyin, Style.FIRST_LETTER)
+        except ImportError:
+            _pinyin = False
+    return _pinyin
+
+def pinyin_initials(text):
+    pinyin = _load_pinyin()
+    if pinyin:
+        lazy_pinyin, style = pinyin
+        return "".join(lazy_pinyin(text, style=style, errors=lambda s: s)).lower()
+    return "".join(_char_initial(char) for char in text)
+
+class PathSearchIndex:
+    # 所有 账号/大区/区服/角色 路径的内存索引，支持前缀、子串和拼音首字母匹配
+    # 所有键拼成一个大字符串，用 str.find 在 C 层完成扫描，再用 bisect 映射回条目
+    def __init__(self):
+        self.entries = []  # 每项为 (账号, 大区, 区服, 角色)
+        self.text_haystack = ""
+        self.text_offsets = []
+        self.initials_haystack = ""
+        self.initials_offsets = []
+
+    def build(self, base_path, hierarchy_index):
+        entries = []
+        stack = [(base_path, ())]
+        while stack:
+            path, parts = stack.pop()
+            for name in hierarchy_index.get_children(path):
+                child_parts = parts + (name,)
+                if len(child_parts) == HIERARCHY_DEPTH:
+                    entries.append(child_parts)
+                else:
+                    stack.append((os.path.join(path, name), child_parts))
+        entries.sort()
+        self.set_entries(entries)
+
+    def set_entries(self, entries):
+        self.entries = list(entries)
+        texts = ["/".join(parts).lower() for parts in self.entries]
+        initials = ["/".join(pinyin_initials(part) for part in parts) for parts in self.entries]
+        self.text_haystack, self.text_offsets = self._join(texts)
+        self.initials_haystack, self.initials_offsets = self._join(initials)
+
+    @staticmethod
+    def _join(keys):
+        offsets = []
+        position = 0
+        for key in keys:
+            offsets.append(position)
+            position += len(key) + 1
+        return "\n".join(keys), offsets
+
+    @staticmethod
+    def _rank(parts, query):
+        if parts[-1].startswith(query):
+            return 0
+        if any(part.startswith(query) for part in parts):
+            return 1
+        return 2
+
+    def search(self, query, limit=DEFAULT_SEARCH_LIMIT):
+        # 排序：角色名前缀 < 任意一级前缀 < 子串 < 拼音首字母匹配
+        query = query.strip().lower()
+        if not query or not self.entries:
+            return []
+        ranks = {}
+        for haystack, offsets, rank_base in ((self.text_haystack, self.text_offsets, 0),
+                                             (self.initials_haystack, self.initials_offsets, 3)):
+            checked = 0
+            position = haystack.find(query)
+            while position != -1 and checked < MAX_CANDIDATES:
+                checked += 1
+                entry = bisect_right(offsets, position) - 1
+                end = offsets[entry + 1] - 1 if entry + 1 < len(offsets) else len(haystack)
+                rank = rank_base + self._rank(haystack[offsets[entry]:end].split("/"), query)
+                if rank < ranks.get(entry, rank + 1):
+                    ranks[entry] = rank
+                position = haystack.find(query, end)
+        ordered = sorted(ranks, key=lambda entry: (ranks[entry], self.entries[entry]))
+        return [self.entries[entry] for entry in ordered[:limit]]
@@ -0,0 +1,187 @@
+import os
+import json
+import time
+import uuid
+import threading
+from copy_engine import copy_file, TEMP_SUFFIX
+from file_operations import build_manifest, hash_file, remove_path, is_under_any
+
+DEFAULT_SNAPSHOT_ROOT = 'snapshots'
+DEFAULT_KEEP_PER_ROLE = 20
+
+class SnapshotError(Exception):
+    pass
+
+class SnapshotStore:
+    # 内容寻址的快照仓库：objects/ 下按 sha256 存放文件内容（相同内容只存一份），
+    # manifests/ 下每个快照是一个记录 相对路径 -> 哈希 的小 JSON 文件
+    def __init__(self, root=DEFAULT_SNAPSHOT_ROOT, keep_per_role=DEFAULT_KEEP_PER_ROLE):
+        self.root = os.path.abspath(root)
+        self.objects_dir = os.path.join(self.root, 'objects')
+        self.manifests_dir = os.path.join(self.root, 'manifests')
+        self.keep_per_role = keep_per_role
+        self.lock = threading.Lock()
+        self.active = 0  # 正在进行的快照数；有快照在写入时不做垃圾回收，以免删掉刚被复用的对象
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest[2:])
+
+    def store_object(self, path, digest, size):
+        # 已存在的内容直接复用；新内容经复制引擎写入（支持时为 reflink 克隆）
+        target = self.object_path(digest)
+        if os.path.exists(target):
+            return False
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        temp_path = f"{target}.{uuid.uuid4().hex}"
+        copy_file(path, temp_path, size)
+        os.replace(temp_path, target)
+        return True
+
+    def take_snapshot(self, role_path, label=""):
+        # 代价约为对角色目录做一次哈希，只有仓库里没有的内容才会被复制
+        role_path = os.path.normpath(role_path)
+        if not os.path.isdir(role_path):
+            return None
+        with self.lock:
+            self.active += 1
+        try:
+            snapshot = self._write_snapshot(role_path, label)
+        finally:
+            with self.lock:
+                self.active -= 1
+        if self.prune(role_path):
+            self.collect_garbage()
+        return snapshot
+
+    def _write_snapshot(self, role_path, label):
+        files, dirs = build_manifest(role_path)
+        entries = {}
+        stored_bytes = 0
+        for rel_path, (size, mtime_ns) in files.items():
+            path = os.path.join(role_path, rel_path)
+            digest = hash_file(path)
+            if self.store_object(path, digest, size):
+                stored_bytes += size
+            entries[rel_path.replace(os.sep, '/')] = [digest, size, mtime_ns]
+        snapshot = {
+            "id": time.strftime('%Y%m%d-%H%M%S') + '-' + uuid.uuid4().hex[:6],
+            "role_path": role_path,
+            "created": time.time(),
+            "label": label,
+            "files": entries,
+            "dirs": sorted(d.replace(os.sep, '/') for d in dirs),
+            "stored_bytes": stored_bytes,
+        }
+        os.makedirs(self.manifests_dir, exist_ok=True)
+        manifest_path = os.path.join(self.manifests_dir, snapshot["id"] + '.json')
+        with open(manifest_path + TEMP_SUFFIX, 'w', encoding='utf-8') as f:
+            json.dump(snapshot, f, ensure_ascii=False)
+        os.replace(manifest_path + TEMP_SUFFIX, manifest_path)
+        return snapshot
+
+    def load_snapshot(self, snapshot_id):
+        try:
+            with open(os.path.join(self.manifests_dir, snapshot_id + '.json'), 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            raise SnapshotError(f"无法读取快照 {snapshot_id}: {e}")
+
+    def list_snapshots(self, role_path=None):
+        # 按时间从新到旧返回快照（不含文件列表）
+        if not os.path.isdir(self.manifests_dir):
+            return []
+        wanted = os.path.normcase(os.path.normpath(role_path)) if role_path else None
+        snapshots = []
+        for name in os.listdir(self.manifests_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                snapshot = self.load_snapshot(name[:-len('.json')])
+            except SnapshotError:
+                continue
+            if wanted and os.path.normcase(snapshot["role_path"]) != wanted:
+                continue
+            snapshot["file_count"] = len(snapshot.pop("files"))
+            snapshot.pop("dirs", None)
+            snapshots.append(snapshot)
+        snapshots.sort(key=lambda s: s["created"], reverse=True)
+        return snapshots
+
+    def restore_snapshot(self, snapshot_id, role_path=None):
+        # 只重新写入与快照不同的文件，删除快照中不存在的文件
+        snapshot = self.load_snapshot(snapshot_id)
+        role_path = os.path.normpath(role_path or snapshot["role_path"])
+        stats = {"copied_files": 0, "copied_bytes": 0, "skipped_files": 0, "skipped_bytes": 0, "deleted": 0}
+        wanted_files = {rel.replace('/', os.sep): entry for rel, entry in snapshot["files"].items()}
+        wanted_dirs = {rel.replace('/', os.sep) for rel in snapshot["dirs"]}
+        for digest, _, _ in wanted_files.values():
+            if not os.path.exists(self.object_path(digest)):
+                raise SnapshotError(f"快照 {snapshot_id} 的内容已丢失: {digest}")
+
+        os.makedirs(role_path, exist_ok=True)
+        current_files, current_dirs = build_manifest(role_path)
+        trash_parent = os.path.dirname(role_path)  # 回收目录放在角色目录之外
+        removed_dirs = set()
+        for rel_dir in sorted(current_dirs - wanted_dirs):
+            if not is_under_any(rel_dir, removed_dirs):
+                remove_path(os.path.join(role_path, rel_dir), trash_parent)
+                removed_dirs.add(rel_dir)
+                stats["deleted"] += 1
+        for rel_path in current_files:
+            if rel_path not in wanted_files and not is_under_any(rel_path, removed_dirs):
+                remove_path(os.path.join(role_path, rel_path), trash_parent)
+                stats["deleted"] += 1
+        for rel_dir in sorted(wanted_dirs - current_dirs):
+            os.makedirs(os.path.join(role_path, rel_dir), exist_ok=True)
+
+        for rel_path, (digest, size, mtime_ns) in wanted_files.items():
+            path = os.path.join(role_path, rel_path)
+            current = current_files.get(rel_path)
+            if current is not None and current[0] == size and \
+                    (current[1] == mtime_ns or hash_file(path) == digest):
+                stats["skipped_files"] += 1
+                stats["skipped_bytes"] += size
+                continue
+            copy_file(self.object_path(digest), path, size)
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+            stats["copied_files"] += 1
+            stats["copied_bytes"] += size
+        return stats
+
+    def delete_snapshot(self, snapshot_id):
+        try:
+            os.unlink(os.path.join(self.manifests_dir, snapshot_id + '.json'))
+        except FileNotFoundError:
+            pass
+
+    def prune(self, role_path):
+        # 每个角色只保留最近 keep_per_role 个快照，返回删除的快照数
+        expired = self.list_snapshots(role_path)[self.keep_per_role:]
+        for snapshot in expired:
+            self.delete_snapshot(snapshot["id"])
+        return len(expired)
+
+    def collect_garbage(self):
+        # 删除不再被任何快照引用的对象，返回释放的字节数
+        with self.lock:
+            if self.active:
+                return 0
+            referenced = set()
+            if os.path.isdir(self.manifests_dir):
+                for name in os.listdir(self.manifests_dir):
+                    if name.endswith('.json'):
+                        snapshot = self.load_snapshot(name[:-len('.json')])
+                        referenced.update(entry[0] for entry in snapshot["files"].values())
+            freed = 0
+            if not os.path.isdir(self.objects_dir):
+                return freed
+            for prefix in os.listdir(self.objects_dir):
+                prefix_dir = os.path.join(self.objects_dir, prefix)
+                for name in os.listdir(prefix_dir):
+                    if '.' in name:
+                        continue  # 写入中的临时文件
+                    if prefix + name not in referenced:
+                        path = os.path.join(prefix_dir, name)
+                        freed += os.path.getsize(path)
+                        os.unlink(path)
+            return freed
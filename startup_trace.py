@@ -0,0 +1,47 @@
+import os
+import sys
+import time
+
+START = time.perf_counter()  # main.py 第一行导入本模块，从这里开始计时
+TRACE_ENV = 'JX3_TRACE_STARTUP'
+TRACE_ARG = '--trace-startup'
+TRACE_LOG = 'startup_trace.log'
+
+class StartupTrace:
+    # 记录启动各阶段耗时；打包为无控制台的 exe 时写入 startup_trace.log
+    def __init__(self):
+        self.enabled = False
+        self.marks = []
+        self.last = START
+        self.reported = False
+
+    def enable(self):
+        self.enabled = True
+
+    def mark(self, phase):
+        if not self.enabled:
+            return
+        now = time.perf_counter()
+        self.marks.append((phase, now - self.last))
+        self.last = now
+
+    def report(self):
+        if not self.enabled or self.reported:
+            return
+        self.reported = True
+        lines = [f"{phase:12s} {seconds * 1000:9.1f} ms" for phase, seconds in self.marks]
+        lines.append(f"{'总计':12s} {(self.last - START) * 1000:9.1f} ms")
+        text = "启动耗时:\n" + "\n".join(lines) + "\n"
+        if sys.stderr is not None:
+            sys.stderr.write(text)
+        else:
+            with open(TRACE_LOG, 'a', encoding='utf-8') as f:
+                f.write(time.strftime('%Y-%m-%d %H:%M:%S ') + text)
+
+trace = StartupTrace()
+
+def enable_from_argv(argv):
+    # 命令行 --trace-startup 或环境变量 JX3_TRACE_STARTUP=1 时开启，返回去掉该参数的 argv
+    if TRACE_ARG in argv or os.environ.get(TRACE_ENV) == '1':
+        trace.enable()
+    return [arg for arg in argv if arg != TRACE_ARG]
@@ -0,0 +1,248 @@
+import os
+import json
+import time
+import threading
+from telemetry import telemetry
+
+PRESETS_FILE = 'presets.json'
+LAST_PATH_FILE = 'last_path.json'
+JOURNAL_SUFFIX = '.journal'
+WRITE_DELAY = 0.5  # 最后一次修改后静止这么久才写盘，连续修改合并为一次
+MAX_WRITE_DELAY = 3.0  # 持续修改时最迟多久写一次
+JOURNAL_COMPACT_MIN = 256  # 日志条数超过 max(此值, 预设数) 时才整体重写 presets.json
+
+def atomic_write_text(path, text):
+    # 先写同目录临时文件再替换，进程崩溃或断电时文件要么是旧内容要么是新内容
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.unlink(temp_path)
+        except OSError:
+            pass
+        raise
+
+def _append_text(path, text):
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write(text)
+
+def _compact(journal_path, json_path, data, lines):
+    # json 写入失败（例如文件被杀毒软件占用）时保留日志，只追加新行，重放结果不变
+    try:
+        atomic_write_text(json_path, json.dumps(data))
+    except OSError:
+        if lines:
+            _append_text(journal_path, ''.join(lines))
+        raise
+    atomic_write_text(journal_path, ''.join(lines))
+
+class StateWriter:
+    # 状态文件的后台写入线程：同一文件的多次保存合并为一次，写入不占用界面线程
+    # pending 中每个文件对应 ('json', 数据) / ('text', 文本) / ('append', [行]) /
+    # ('compact', (json 路径, 数据, [之后追加的行]))，按加入顺序写出
+    def __init__(self, delay=WRITE_DELAY):
+        self.delay = delay
+        self.cond = threading.Condition()
+        self.write_lock = threading.Lock()  # flush() 与后台线程不会同时写同一个文件
+        self.pending = {}
+        self.first_change = 0.0
+        self.last_change = 0.0
+        self.thread = None
+        self.closing = False
+
+    def schedule(self, path, kind, value):
+        with self.cond:
+            now = time.monotonic()
+            if not self.pending:
+                self.first_change = now
+            self.last_change = now
+            current = self.pending.get(path)
+            if kind == 'append' and current is not None and current[0] in ('append', 'text', 'compact'):
+                if current[0] == 'append':
+                    current[1].extend(value)
+                elif current[0] == 'compact':
+                    current[1][2].extend(value)
+                else:
+                    self.pending[path] = ('text', current[1] + ''.join(value))
+            else:
+                # 覆盖写入时移到队尾，保证写出顺序与调用顺序一致
+                self.pending.pop(path, None)
+                self.pending[path] = (kind, list(value) if kind == 'append' else value)
+            if self.thread is None and not self.closing:
+                self.thread = threading.Thread(target=self.run, name="StateWriter", daemon=True)
+                self.thread.start()
+            self.cond.notify()
+
+    def write_json(self, path, data):
+        # data 由调用方保证之后不再原地修改（例如传入字典的浅拷贝）
+        self.schedule(path, 'json', data)
+
+    def write_text(self, path, text):
+        self.schedule(path, 'text', text)
+
+    def append_lines(self, path, lines):
+        self.schedule(path, 'append', lines)
+
+    def compact_journal(self, journal_path, json_path, data):
+        # 用完整数据重写 json_path，成功后才清空日志；之前未写出的日志行已包含在 data 中
+        self.schedule(journal_path, 'compact', (json_path, data, []))
+
+    def run(self):
+        while True:
+            with self.cond:
+                while not self.pending and not self.closing:
+                    self.cond.wait()
+                if self.closing and not self.pending:
+                    return
+                while not self.closing:
+                    now = time.monotonic()
+                    remaining = min(self.last_change + self.delay, self.first_change + MAX_WRITE_DELAY) - now
+                    if remaining <= 0:
+                        break
+                    self.cond.wait(remaining)
+            self.flush()
+
+    def flush(self):
+        # 立即写出所有待写内容（在调用线程中执行）
+        with self.write_lock:
+            with self.cond:
+                tasks, self.pending = self.pending, {}
+            for path, (kind, value) in tasks.items():
+                try:
+                    if kind == 'append':
+                        _append_text(path, ''.join(value))
+                    elif kind == 'compact':
+                        _compact(path, *value)
+                    elif kind == 'text':
+                        atomic_write_text(path, value)
+                    else:
+                        atomic_write_text(path, json.dumps(value))
+                except OSError as e:
+                    telemetry.warn(f"保存 {path} 失败: {e}")
+
+    def close(self):
+        with self.cond:
+            self.closing = True
+            thread = self.thread
+            self.cond.notify()
+        if thread is not None:
+            thread.join()
+        self.flush()
+
+def _read_journal(journal_path, presets):
+    # 依次重放日志中的修改，返回条数；最后一行写了一半（崩溃）时忽略
+    count = 0
+    try:
+        with open(journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    op = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if op.get("op") == "set":
+                    presets[op["name"]] = op["value"]
+                elif op.get("op") == "delete":
+                    presets.pop(op["name"], None)
+                count += 1
+    except FileNotFoundError:
+        pass
+    return count
+
+def _trim_torn_tail(journal_path):
+    # 崩溃时写了一半的最后一行读取时会被忽略，但必须截掉，否则之后追加的修改会接在它后面一起被忽略
+    try:
+        with open(journal_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+    except FileNotFoundError:
+        pass
+    except OSError as e:
+        telemetry.warn(f"无法修复预设日志 {journal_path}: {e}")
+
+def read_presets(path=PRESETS_FILE):
+    # 读取 presets.json 并重放其修改日志；两者都不存在时抛出 FileNotFoundError
+    presets, _ = _load_presets(path)
+    return presets
+
+def _load_presets(path):
+    presets = {}
+    found = False
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            presets = json.load(f)
+        found = True
+    except FileNotFoundError:
+        pass
+    if not isinstance(presets, dict):
+        raise ValueError(f"{path} 格式错误")
+    journal_path = path + JOURNAL_SUFFIX
+    found = found or os.path.exists(journal_path)
+    if not found:
+        raise FileNotFoundError(path)
+    return presets, _read_journal(journal_path, presets)
+
+class PresetStore:
+    # 预设集合：用法同字典；每次修改只向日志追加一行，日志足够长时才整体重写 presets.json
+    def __init__(self, writer, path=PRESETS_FILE):
+        self.writer = writer
+        self.path = os.path.abspath(path)
+        self.journal_path = self.path + JOURNAL_SUFFIX
+        with telemetry.span("presets.read", path=self.path) as span:
+            try:
+                self.presets, self.journal_entries = _load_presets(self.path)
+                _trim_torn_tail(self.journal_path)
+            except FileNotFoundError:
+                self.presets, self.journal_entries = {}, 0
+            except (OSError, ValueError) as e:
+                telemetry.warn(f"无法读取预设 {self.path}: {e}")
+                self.presets, self.journal_entries = {}, 0
+                span.add(errors=1)
+            span.add(files=len(self.presets))
+            span.fields["journal_entries"] = self.journal_entries
+
+    def __contains__(self, name):
+        return name in self.presets
+
+    def __getitem__(self, name):
+        return self.presets[name]
+
+    def __iter__(self):
+        return iter(self.presets)
+
+    def __len__(self):
+        return len(self.presets)
+
+    def items(self):
+        return self.presets.items()
+
+    def __setitem__(self, name, value):
+        self.presets[name] = value
+        self.record({"op": "set", "name": name, "value": value})
+
+    def __delitem__(self, name):
+        del self.presets[name]
+        self.record({"op": "delete", "name": name})
+
+    def record(self, op):
+        self.journal_entries += 1
+        if self.journal_entries > max(JOURNAL_COMPACT_MIN, len(self.presets)):
+            self.compact()
+        else:
+            self.writer.append_lines(self.journal_path, [json.dumps(op) + '\n'])
+
+    def compact(self):
+        # 先写完整的 presets.json，成功后再清空日志；两步之间崩溃或写入失败时重放日志结果不变
+        self.writer.compact_journal(self.journal_path, self.path, dict(self.presets))
+        self.journal_entries = 0
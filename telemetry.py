@@ -0,0 +1,155 @@
+import sys
+import json
+import time
+import threading
+from collections import deque, defaultdict
+from contextlib import contextmanager
+
+TELEMETRY_LOG = 'telemetry.log'
+MAX_LOG_BYTES = 1024 * 1024
+LOG_BACKUPS = 3  # telemetry.log.1 ~ .3
+RECENT_SAMPLES = 500  # 每种操作在内存中保留的最近样本数，供统计面板计算分位数
+
+# 性能记录：
+#   span(名称, 字段...)   一次完整的操作（改键的一个目标、预览、导出等），结束时写入一行 JSON 日志
+#   observe(名称, 秒数)   高频的小操作（扫描一个目录、哈希一批文件），只保留在内存中
+#   count(名称)           计数器（缓存命中/未命中等）
+#   warn(消息)            代替 print 输出错误，同时写入日志
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(p / 100 * (len(sorted_values) - 1))))]
+
+class Span:
+    def __init__(self, telemetry, name, fields):
+        self.telemetry = telemetry
+        self.name = name
+        self.fields = fields
+        self.files = 0
+        self.bytes = 0
+        self.errors = 0
+        self.phases = {}
+        self.start = time.perf_counter()
+
+    def add(self, files=0, num_bytes=0, errors=0):
+        self.files += files
+        self.bytes += num_bytes
+        self.errors += errors
+
+    @contextmanager
+    def phase(self, name):
+        # 同名阶段多次进入时累加
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.perf_counter() - start
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self.errors += 1
+            self.fields["error"] = f"{exc_type.__name__}: {exc}"
+        self.telemetry.finish(self, time.perf_counter() - self.start)
+        return False
+
+class Telemetry:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(lambda: deque(maxlen=RECENT_SAMPLES))  # 名称 -> (结束时间, 秒, 文件, 字节, 错误)
+        self.counters = defaultdict(int)
+        self.logger = None  # 调用 configure() 之后才写日志文件
+
+    def configure(self, path=TELEMETRY_LOG, max_bytes=MAX_LOG_BYTES, backups=LOG_BACKUPS):
+        import logging
+        from logging.handlers import RotatingFileHandler
+        handler = RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backups, encoding='utf-8', delay=True)
+        handler.setFormatter(logging.Formatter('%(message)s'))
+        logger = logging.getLogger('jx3.telemetry')
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        for old in list(logger.handlers):
+            logger.removeHandler(old)
+            old.close()
+        logger.addHandler(handler)
+        self.logger = logger
+
+    def write(self, record):
+        if self.logger is None:
+            return
+        record = dict(record, ts=round(time.time(), 3))
+        try:
+            self.logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        except (TypeError, ValueError):
+            pass
+
+    def span(self, name, **fields):
+        return Span(self, name, fields)
+
+    def finish(self, span, seconds):
+        now = time.time()
+        with self.lock:
+            self.samples[span.name].append((now, seconds, span.files, span.bytes, span.errors))
+            for phase, phase_seconds in span.phases.items():
+                self.samples[f"{span.name}.{phase}"].append((now, phase_seconds, 0, 0, 0))
+        record = {"event": span.name, "seconds": round(seconds, 6), "files": span.files,
+                  "bytes": span.bytes, "errors": span.errors}
+        if span.phases:
+            record["phases"] = {phase: round(value, 6) for phase, value in span.phases.items()}
+        record.update(span.fields)
+        self.write(record)
+
+    def observe(self, name, seconds, files=0, num_bytes=0, errors=0):
+        with self.lock:
+            self.samples[name].append((time.time(), seconds, files, num_bytes, errors))
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def warn(self, message, **fields):
+        with self.lock:
+            self.counters["warnings"] += 1
+        if sys.stderr is not None:
+            print(message, file=sys.stderr)
+        self.write(dict({"event": "warning", "message": message}, **fields))
+
+    def stats(self):
+        # 每种操作最近样本的统计：次数、中位数/P95/P99 耗时（秒）、文件数、字节数、吞吐量（字节/秒）、错误数
+        with self.lock:
+            items = [(name, list(samples)) for name, samples in self.samples.items()]
+            counters = dict(self.counters)
+        rows = []
+        for name, samples in sorted(items):
+            durations = sorted(sample[1] for sample in samples)
+            total_seconds = sum(durations)
+            total_bytes = sum(sample[3] for sample in samples)
+            rows.append({
+                "name": name,
+                "count": len(samples),
+                "p50": percentile(durations, 50),
+                "p95": percentile(durations, 95),
+                "p99": percentile(durations, 99),
+                "files": sum(sample[2] for sample in samples),
+                "bytes": total_bytes,
+                "throughput": total_bytes / total_seconds if total_bytes and total_seconds > 0 else 0.0,
+                "errors": sum(sample[4] for sample in samples),
+            })
+        return rows, counters
+
+    def close(self):
+        # 退出时把本次运行的计数器写入日志
+        with self.lock:
+            counters = dict(self.counters)
+        if counters:
+            self.write({"event": "session", "counters": counters})
+        if self.logger is not None:
+            for handler in list(self.logger.handlers):
+                self.logger.removeHandler(handler)
+                handler.close()
+            self.logger = None
+
+telemetry = Telemetry()
@@ -0,0 +1,77 @@
+import os
+import json
+import zipfile
+import pytest
+from bundle import (export_bundle, import_bundle, read_bundle_manifest, bundle_presets, BundleError,
+                    BUNDLE_FORMAT, MANIFEST_NAME)
+from transfer_filter import make_preset
+
+PARTS = ["acct", "电信区", "服", "角色"]
+
+def write_role(base_path, text):
+    role = os.path.join(base_path, *PARTS)
+    os.makedirs(role, exist_ok=True)
+    with open(os.path.join(role, "hotkey.ini"), 'w', encoding='utf-8') as f:
+        f.write(text)
+    return role
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def write_bundle(path, manifest):
+    with zipfile.ZipFile(path, 'w') as zf:
+        zf.writestr(MANIFEST_NAME, json.dumps(manifest))
+
+@pytest.mark.parametrize("role", [
+    {"parts": PARTS, "files": {}},
+    {"parts": PARTS, "files": [], "dirs": []},
+    {"parts": "acct", "files": {}, "dirs": []},
+    {"parts": PARTS, "files": {"a.ini": ["0" * 64, "1", 0]}, "dirs": []},
+    {"parts": PARTS, "files": {"a.ini": ["../x", 1, 0]}, "dirs": []},
+    {"parts": PARTS, "files": {"../x": ["0" * 64, 1, 0]}, "dirs": []},
+    {"parts": PARTS, "files": {"..\\..\\evil.dll": ["0" * 64, 1, 0]}, "dirs": []},
+    {"parts": PARTS, "files": {"sub/C:evil.dll": ["0" * 64, 1, 0]}, "dirs": []},
+    {"parts": PARTS, "files": {}, "dirs": ["..\\.."]},
+    {"parts": ["acct", "C:", "服", "角色"], "files": {}, "dirs": []},
+])
+def test_malformed_manifest_raises_bundle_error(tmp_path, role):
+    path = str(tmp_path / "bad.jx3bundle")
+    write_bundle(path, {"format": BUNDLE_FORMAT, "roles": [role]})
+    with pytest.raises(BundleError):
+        read_bundle_manifest(path)
+    with pytest.raises(BundleError):
+        import_bundle(path, str(tmp_path / "userdata"))
+
+def test_same_role_in_two_data_folders_is_kept_apart(tmp_path):
+    retail = str(tmp_path / "zhcn_hd" / "userdata")
+    test = str(tmp_path / "zhcn_exp" / "userdata")
+    write_role(retail, "retail")
+    write_role(test, "test")
+    path = str(tmp_path / "roles.jx3bundle")
+    presets = {"正式服": make_preset([retail] + PARTS), "测试服": make_preset([test] + PARTS)}
+    stats = export_bundle(path, [], presets)
+    assert stats["roles"] == 2
+
+    manifest = read_bundle_manifest(path)
+    new_retail = str(tmp_path / "new_hd")
+    new_test = str(tmp_path / "new_exp")
+    results = import_bundle(path, new_retail, root_paths=[new_retail, new_test])
+    assert all(result["ok"] for result in results)
+    assert read(os.path.join(new_retail, *PARTS, "hotkey.ini")) == "retail"
+    assert read(os.path.join(new_test, *PARTS, "hotkey.ini")) == "test"
+    imported = bundle_presets(manifest, new_retail, [new_retail, new_test])
+    assert imported["正式服"] == [new_retail] + PARTS
+    assert imported["测试服"] == [new_test] + PARTS
+
+def test_same_role_imported_into_one_folder_is_not_overwritten(tmp_path):
+    retail = str(tmp_path / "zhcn_hd" / "userdata")
+    test = str(tmp_path / "zhcn_exp" / "userdata")
+    write_role(retail, "retail")
+    write_role(test, "test")
+    path = str(tmp_path / "roles.jx3bundle")
+    export_bundle(path, [(retail, PARTS), (test, PARTS)])
+    target = str(tmp_path / "new")
+    results = import_bundle(path, target)
+    assert [result["ok"] for result in results] == [True, False]
+    assert read(os.path.join(target, *PARTS, "hotkey.ini")) == "retail"
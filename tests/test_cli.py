@@ -0,0 +1,77 @@
+import os
+import json
+import pytest
+from cli import main, normalize_jobs, resolve_job_path, JobError, EXIT_OK, EXIT_USAGE
+from transfer_filter import TransferFilter, make_preset
+
+ROLE = ["acct", "电信区", "服", "角色"]
+
+def make_userdata(tmp_path):
+    base_path = str(tmp_path / "userdata")
+    for role in ("角色", "小号"):
+        path = os.path.join(base_path, "acct", "电信区", "服", role)
+        os.makedirs(path)
+        with open(os.path.join(path, "hotkey.ini"), 'w', encoding='utf-8') as f:
+            f.write(role)
+    return base_path
+
+def run(tmp_path, spec, *args):
+    job_file = tmp_path / "jobs.json"
+    job_file.write_text(json.dumps(spec, ensure_ascii=False), encoding='utf-8')
+    return main([str(job_file), "--no-snapshot", "--profiles", str(tmp_path / "profiles.json"),
+                 "--presets", str(tmp_path / "presets.json"), *args])
+
+def test_resolves_relative_list_and_absolute_paths(tmp_path):
+    base_path = str(tmp_path / "userdata")
+    expected = os.path.join(base_path, *ROLE)
+    assert resolve_job_path(base_path, "acct/电信区/服/角色") == expected
+    assert resolve_job_path(base_path, "acct\\电信区\\服\\角色\\") == expected
+    assert resolve_job_path(base_path, ROLE) == expected
+    assert resolve_job_path(base_path, expected) == expected
+    assert resolve_job_path("", str(tmp_path / "elsewhere")) == str(tmp_path / "elsewhere")
+
+@pytest.mark.parametrize("value", ["", "acct", "acct/电信区/服", "nope/x", "acct/电信区/服/角色/sub",
+                                   "acct/../服/角色", ["acct", "", "服", "角色"]])
+def test_rejects_paths_that_are_not_a_role(tmp_path, value):
+    with pytest.raises(JobError):
+        resolve_job_path(str(tmp_path / "userdata"), value)
+
+def test_rejects_absolute_data_folder_or_its_parents(tmp_path):
+    base_path = str(tmp_path / "userdata")
+    for value in (base_path, str(tmp_path), os.path.join(base_path, "acct")):
+        with pytest.raises(JobError):
+            resolve_job_path(base_path, value)
+
+def test_normalize_jobs_resolves_presets_and_profiles(tmp_path):
+    base_path = str(tmp_path / "userdata")
+    presets_path = tmp_path / "presets.json"
+    presets_path.write_text(json.dumps({"主号": make_preset([base_path] + ROLE, "仅快捷键")}), encoding='utf-8')
+    spec = {"jobs": [{"preset": "主号", "targets": ["acct/电信区/服/小号"]},
+                     {"source": ROLE, "targets": "acct/电信区/服/小号", "base_path": base_path,
+                      "profile": "全部文件", "use_hash": True}]}
+    jobs = normalize_jobs(spec, str(presets_path), str(tmp_path / "profiles.json"))
+    assert jobs[0]["source"] == os.path.join(base_path, *ROLE)
+    assert jobs[0]["targets"] == [os.path.join(base_path, "acct", "电信区", "服", "小号")]
+    assert isinstance(jobs[0]["transfer_filter"], TransferFilter) and not jobs[0]["use_hash"]
+    assert jobs[1]["transfer_filter"] is None and jobs[1]["use_hash"]
+
+def test_normalize_jobs_rejects_incomplete_preset(tmp_path):
+    presets_path = tmp_path / "presets.json"
+    presets_path.write_text(json.dumps({"半截": [str(tmp_path), "acct", "电信区", "", ""]}), encoding='utf-8')
+    with pytest.raises(JobError):
+        normalize_jobs({"jobs": [{"preset": "半截", "targets": ["acct/电信区/服/小号"]}]}, str(presets_path),
+                       str(tmp_path / "profiles.json"))
+
+def test_account_as_target_is_refused_without_touching_disk(tmp_path):
+    base_path = make_userdata(tmp_path)
+    before = sorted(os.walk(base_path))
+    spec = {"base_path": base_path, "jobs": [{"source": "acct/电信区/服/角色", "targets": ["acct"]}]}
+    assert run(tmp_path, spec) == EXIT_USAGE
+    assert sorted(os.walk(base_path)) == before
+
+def test_role_to_role_job_runs(tmp_path):
+    base_path = make_userdata(tmp_path)
+    spec = {"base_path": base_path, "jobs": [{"source": "acct/电信区/服/角色", "targets": ["acct/电信区/服/小号"]}]}
+    assert run(tmp_path, spec) == EXIT_OK
+    with open(os.path.join(base_path, "acct", "电信区", "服", "小号", "hotkey.ini"), encoding='utf-8') as f:
+        assert f.read() == "角色"
@@ -0,0 +1,101 @@
+import os
+import trash_bin
+import copy_engine
+from file_operations import build_manifest, sync_folder, sync_to_targets, VERIFY_RETRIES
+from snapshot_store import SnapshotStore
+from copy_engine import TEMP_SUFFIX
+from trash_bin import TRASH_DIR_NAME
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def test_manifest_skips_internal_entries(tmp_path):
+    role = tmp_path / "角色"
+    write(str(role / "hotkey.ini"), "a")
+    write(str(role / TRASH_DIR_NAME / "0-old" / "q"), "x")
+    write(str(role / ("layout.ini" + TEMP_SUFFIX)), "partial")
+    files, dirs = build_manifest(str(role))
+    assert list(files) == ["hotkey.ini"]
+    assert dirs == set()
+
+def test_restore_keeps_trash_outside_role(tmp_path):
+    role = str(tmp_path / "服" / "角色")
+    write(os.path.join(role, "hotkey.ini"), "a")
+    store = SnapshotStore(str(tmp_path / "snapshots"))
+    snapshot = store.take_snapshot(role)
+    write(os.path.join(role, "newdir", "q"), "b")
+    store.restore_snapshot(snapshot["id"])
+    assert os.listdir(role) == ["hotkey.ini"]
+
+def test_atomic_sync_falls_back_to_in_place_when_target_is_locked(tmp_path, monkeypatch):
+    src = str(tmp_path / "src")
+    dst = str(tmp_path / "dst")
+    write(os.path.join(src, "hotkey.ini"), "new")
+    write(os.path.join(src, "ui", "layout.ini"), "layout")
+    write(os.path.join(dst, "hotkey.ini"), "old!")
+    write(os.path.join(dst, "stale.ini"), "x")
+
+    def locked(path, trash_parent=None):
+        raise PermissionError(13, "locked")
+
+    monkeypatch.setattr(trash_bin, '_rename_aside', locked)
+    stats = sync_folder(src, dst, atomic=True)
+    assert build_manifest(dst)[0].keys() == build_manifest(src)[0].keys()
+    assert read(os.path.join(dst, "hotkey.ini")) == "new"
+    assert stats["deleted"] == 1
+    assert [name for name in os.listdir(tmp_path) if name.startswith(".jx3")] in ([], [TRASH_DIR_NAME])
+
+def make_roles(tmp_path, count=5):
+    src = str(tmp_path / "src")
+    dst = str(tmp_path / "dst")
+    for i in range(count):
+        write(os.path.join(src, f"f{i}.ini"), f"new {i}")
+        write(os.path.join(dst, f"f{i}.ini"), f"old{i}")
+    return src, dst
+
+def lock_file(monkeypatch, name, times):
+    # 模拟文件在复制时被杀毒软件或同步盘占用
+    real_copy = copy_engine.copy_file_data
+    attempts = []
+
+    def copy_file_data(src, dst, size, digest=None):
+        if os.path.basename(src) == name and len(attempts) < times:
+            attempts.append(dst)
+            raise PermissionError(13, "locked")
+        return real_copy(src, dst, size, digest)
+
+    monkeypatch.setattr(copy_engine, 'copy_file_data', copy_file_data)
+
+def read(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read()
+
+def contents(root):
+    return {name: read(os.path.join(root, name)) for name in sorted(os.listdir(root))}
+
+def test_verify_retries_file_locked_during_copy(tmp_path, monkeypatch):
+    src, dst = make_roles(tmp_path)
+    lock_file(monkeypatch, "f2.ini", 1)
+    stats = sync_folder(src, dst, verify=True)
+    assert contents(dst) == contents(src)
+    assert stats["verified_files"] == 5 and stats["retried_files"] == 1
+
+def test_verify_reports_file_that_stays_locked(tmp_path, monkeypatch):
+    src, dst = make_roles(tmp_path)
+    lock_file(monkeypatch, "f2.ini", VERIFY_RETRIES + 1)
+    results = sync_to_targets(src, [dst], verify=True)
+    assert not results[0]["ok"] and results[0]["partial"]
+    assert [mismatch["path"] for mismatch in results[0]["mismatches"]] == ["f2.ini"]
+    expected = contents(src)
+    expected["f2.ini"] = "old2"
+    assert contents(dst) == expected
+
+def test_atomic_verify_failure_leaves_target_untouched(tmp_path, monkeypatch):
+    src, dst = make_roles(tmp_path)
+    before = contents(dst)
+    lock_file(monkeypatch, "f2.ini", VERIFY_RETRIES + 1)
+    results = sync_to_targets(src, [dst], atomic=True, verify=True)
+    assert not results[0]["ok"] and not results[0]["partial"]
+    assert contents(dst) == before
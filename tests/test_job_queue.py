@@ -0,0 +1,120 @@
+import os
+import time
+import threading
+import job_queue
+import file_operations
+from job_queue import JobQueue, DONE
+from state_store import StateWriter
+
+def write(path, text):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
+
+def make_queue(tmp_path, **kwargs):
+    return JobQueue(StateWriter(delay=0), str(tmp_path / "job_queue.json"), **kwargs)
+
+def wait_idle(queue, timeout=10):
+    deadline = time.monotonic() + timeout
+    while queue.is_busy() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not queue.is_busy()
+
+def test_fan_out_scans_and_reads_source_once(tmp_path, monkeypatch):
+    src = str(tmp_path / "src")
+    for i in range(3):
+        write(os.path.join(src, f"f{i}.ini"), f"content {i}")
+    targets = [str(tmp_path / f"dst{i}") for i in range(6)]
+    scans = []
+    reads = []
+    real_build = job_queue.build_manifest
+    real_hash = file_operations.hash_file
+    monkeypatch.setattr(job_queue, 'build_manifest', lambda path, *a: scans.append(path) or real_build(path, *a))
+    monkeypatch.setattr(file_operations, 'hash_file', lambda path: reads.append(path) or real_hash(path))
+
+    queue = make_queue(tmp_path)
+    queue.start()
+    queue.submit_many(src, targets, {"verify": True, "atomic": True})
+    wait_idle(queue)
+    assert [job["status"] for job in queue.snapshot()] == [DONE] * 6
+    assert scans == [src]
+    assert not [path for path in reads if path.startswith(src)]
+    assert queue.sources == {}
+    queue.shutdown()
+
+def test_identical_job_is_not_added_twice(tmp_path):
+    queue = make_queue(tmp_path)
+    job = queue.submit(str(tmp_path / "src"), str(tmp_path / "dst"), {"verify": True})
+    assert job is not None
+    assert queue.submit(str(tmp_path / "src") + os.sep, str(tmp_path / "dst"), {"verify": True}) is None
+    assert [other["id"] for other in queue.snapshot()] == [job["id"]]
+
+def test_pending_job_is_superseded_by_newer_job_for_same_target(tmp_path):
+    queue = make_queue(tmp_path)
+    target = str(tmp_path / "dst")
+    queue.submit(str(tmp_path / "src"), target, {"verify": False})
+    queue.submit(str(tmp_path / "src"), str(tmp_path / "other"), {"verify": False})
+    newer_options = queue.submit(str(tmp_path / "src"), target, {"verify": True})
+    newer_source = queue.submit(str(tmp_path / "src2"), target, {"verify": True})
+    jobs = queue.snapshot()
+    assert [job["target"] for job in jobs] == [str(tmp_path / "other"), target]
+    assert jobs[-1]["id"] == newer_source["id"] != newer_options["id"]
+
+def test_jobs_for_same_target_do_not_run_concurrently(tmp_path, monkeypatch):
+    running = {}
+    overlaps = []
+    first_started = threading.Event()
+    release = threading.Event()
+
+    def fake_sync(source, targets, *args):
+        key = targets[0]
+        running[key] = running.get(key, 0) + 1
+        if running[key] > 1:
+            overlaps.append(key)
+        first_started.set()
+        release.wait(5)
+        running[key] -= 1
+        return [{"ok": True, "stats": None, "error": None}]
+
+    monkeypatch.setattr(job_queue, 'sync_to_targets', fake_sync)
+    src = str(tmp_path / "src")
+    write(os.path.join(src, "hotkey.ini"), "a")
+    target = str(tmp_path / "dst")
+    queue = make_queue(tmp_path)
+    queue.start()
+    first = queue.submit(src, target, {"verify": False})
+    assert first_started.wait(5)
+    # 运行中的相同任务不重复加入；选项不同的新任务排在后面，不取代运行中的任务
+    assert queue.submit(src, target, {"verify": False}) is None
+    second = queue.submit(src, target, {"verify": True})
+    assert {job["id"]: job["status"] for job in queue.snapshot()} == {first["id"]: "running", second["id"]: "pending"}
+    release.set()
+    wait_idle(queue)
+    assert [job["status"] for job in queue.snapshot()] == [DONE, DONE]
+    assert overlaps == []
+    queue.shutdown()
+
+def test_retry_mismatches_only_resends_failed_files(tmp_path, monkeypatch):
+    calls = []
+    release = threading.Event()
+
+    def fake_sync(source, targets, *args):
+        calls.append(source)
+        if len(calls) > 1:
+            release.wait(5)  # 重试任务保持运行，检查重复重试
+        return [{"ok": False, "stats": None, "error": "校验失败", "partial": True,
+                 "mismatches": [{"path": "hotkey.ini"}]}]
+
+    monkeypatch.setattr(job_queue, 'sync_to_targets', fake_sync)
+    src = str(tmp_path / "src")
+    write(os.path.join(src, "hotkey.ini"), "a")
+    queue = make_queue(tmp_path)
+    queue.start()
+    job = queue.submit(src, str(tmp_path / "dst"), {"verify": True, "include": ["*.ini"], "profile": "p"})
+    wait_idle(queue)
+    retry = queue.retry_mismatches(job["id"])
+    assert retry["options"] == {"verify": True, "files": ["hotkey.ini"]}
+    assert queue.retry_mismatches(job["id"]) is None  # 已在排队
+    release.set()
+    wait_idle(queue)
+    queue.shutdown()
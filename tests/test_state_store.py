@@ -0,0 +1,71 @@
+import os
+import json
+import state_store
+from state_store import StateWriter, PresetStore, read_presets, JOURNAL_SUFFIX
+
+def make_store(tmp_path):
+    writer = StateWriter(delay=0)
+    return writer, PresetStore(writer, str(tmp_path / 'presets.json'))
+
+def test_journal_replay_ignores_torn_last_line(tmp_path):
+    path = tmp_path / 'presets.json'
+    path.write_text(json.dumps({"a": 1, "b": 2}), encoding='utf-8')
+    (tmp_path / ('presets.json' + JOURNAL_SUFFIX)).write_text(
+        json.dumps({"op": "set", "name": "c", "value": 3}) + '\n'
+        + json.dumps({"op": "delete", "name": "a"}) + '\n'
+        + '{"op": "set", "name": "d"', encoding='utf-8')
+    assert read_presets(str(path)) == {"b": 2, "c": 3}
+
+def test_changes_survive_restart_through_journal(tmp_path):
+    writer, store = make_store(tmp_path)
+    store["a"] = [1]
+    store["b"] = [2]
+    del store["a"]
+    writer.close()
+    assert not (tmp_path / 'presets.json').exists()
+    assert read_presets(str(tmp_path / 'presets.json')) == {"b": [2]}
+
+def test_compact_rewrites_presets_and_clears_journal(tmp_path):
+    writer, store = make_store(tmp_path)
+    store["a"] = 1
+    store.compact()
+    store["b"] = 2  # 压缩还在队列中时追加的修改
+    writer.close()
+    path = tmp_path / 'presets.json'
+    assert json.loads(path.read_text(encoding='utf-8')) == {"a": 1}
+    assert read_presets(str(path)) == {"a": 1, "b": 2}
+    journal = (tmp_path / ('presets.json' + JOURNAL_SUFFIX)).read_text(encoding='utf-8')
+    assert journal.count('\n') == 1
+
+def test_failed_compaction_keeps_journal(tmp_path, monkeypatch):
+    writer, store = make_store(tmp_path)
+    store["a"] = 1
+    store["b"] = 2
+    writer.flush()
+    path = str(tmp_path / 'presets.json')
+    real_replace = os.replace
+
+    def locked_replace(src, dst):
+        if dst == path:
+            raise PermissionError(13, "locked")
+        return real_replace(src, dst)
+
+    monkeypatch.setattr(state_store.os, 'replace', locked_replace)
+    store.compact()
+    store["c"] = 3
+    writer.close()
+    assert not os.path.exists(path)
+    assert read_presets(path) == {"a": 1, "b": 2, "c": 3}
+    monkeypatch.setattr(state_store.os, 'replace', real_replace)
+    assert PresetStore(StateWriter(), path).presets == {"a": 1, "b": 2, "c": 3}
+
+def test_change_after_torn_journal_line_survives_restart(tmp_path):
+    path = str(tmp_path / 'presets.json')
+    with open(path + JOURNAL_SUFFIX, 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"op": "set", "name": "a", "value": 1}) + '\n' + '{"op": "set", "na')
+    writer = StateWriter(delay=0)
+    store = PresetStore(writer, path)
+    assert store.presets == {"a": 1}
+    store["b"] = 2
+    writer.close()
+    assert read_presets(path) == {"a": 1, "b": 2}
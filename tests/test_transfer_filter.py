@@ -0,0 +1,73 @@
+import os
+import re
+import pytest
+from transfer_filter import (_glob_to_regex, TransferFilter, PathListFilter, ProfileError,
+                             compile_profile, load_profiles, FULL_PROFILE)
+
+@pytest.mark.parametrize("pattern, path, matched", [
+    ("*.ini", "hotkey.ini", True),
+    ("*.ini", "ui/hotkey.ini", False),
+    ("?.dat", "a.dat", True),
+    ("?.dat", "ab.dat", False),
+    ("?.dat", "/.dat", False),
+    ("interface/**/*.dat", "interface/a.dat", True),
+    ("interface/**/*.dat", "interface/x/y/a.dat", True),
+    ("interface/**/*.dat", "interfacex/a.dat", False),
+    ("log[0-9].txt", "log3.txt", True),
+    ("log[!0-9].txt", "log3.txt", False),
+    ("log[!0-9].txt", "logx.txt", True),
+    ("a+b(1).ini", "a+b(1).ini", True),
+])
+def test_glob_to_regex(pattern, path, matched):
+    assert bool(re.fullmatch(_glob_to_regex(pattern), path)) == matched
+
+def test_match_file_include_exclude_and_case():
+    f = TransferFilter(include=["*hotkey*", "interface/"], exclude=["*.log", "Interface/Cache/"])
+    assert f.match_file("HotKey.ini")
+    assert f.match_file("sub/hotkey.dat")
+    assert f.match_file(os.path.join("interface", "layout.ini"))
+    assert not f.match_file("hotkey.log")
+    assert not f.match_file("interface/cache/a.dat")
+    assert not f.match_file("other.ini")
+
+def test_regex_rules_match_whole_relative_path():
+    f = TransferFilter(include=[r"re:ui/\d+\.dat"])
+    assert f.match_file("ui/12.dat")
+    assert not f.match_file("ui/12.dat.bak")
+    assert not f.match_file("x/ui/12.dat")
+    assert f.walk_dir("anything")  # 正则规则不能按目录剪枝
+
+def test_walk_dir_prunes_excluded_and_unreachable_dirs():
+    f = TransferFilter(include=["interface/layout/*.dat"], exclude=["cache/"])
+    assert f.walk_dir("interface")
+    assert f.walk_dir("Interface/Layout")
+    assert f.walk_dir("interface/layout/deeper")
+    assert not f.walk_dir("userdata")
+    assert not f.walk_dir("interface/cache")
+
+    unanchored = TransferFilter(include=["*.ini"], exclude=["re:cache/.*"])
+    assert unanchored.walk_dir("any/dir")
+    assert unanchored.walk_dir("cache")  # 正则排除只按文件判断
+    assert not unanchored.match_file("cache/a.ini")
+
+def test_compile_profile(tmp_path):
+    profiles = load_profiles(str(tmp_path / "missing.json"))
+    assert compile_profile(profiles, FULL_PROFILE) is None
+    assert compile_profile(profiles, "") is None
+    assert compile_profile(profiles, "跳过缓存").match_file("hotkey.ini")
+    with pytest.raises(ProfileError):
+        compile_profile(profiles, "不存在")
+    profiles["坏规则"] = {"include": ["re:(unclosed"], "exclude": []}
+    with pytest.raises(ProfileError):
+        compile_profile(profiles, "坏规则")
+    profiles["空规则"] = {"include": ["  "], "exclude": []}
+    assert compile_profile(profiles, "空规则") is None
+
+def test_path_list_filter():
+    f = PathListFilter([os.path.join("ui", "layout", "a.dat"), "hotkey.ini"])
+    assert f.match_file("hotkey.ini")
+    assert f.match_file(os.path.join("ui", "layout", "a.dat"))
+    assert not f.match_file(os.path.join("ui", "layout", "b.dat"))
+    assert f.walk_dir("ui")
+    assert f.walk_dir(os.path.join("ui", "layout"))
+    assert not f.walk_dir("cache")
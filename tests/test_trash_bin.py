@@ -0,0 +1,110 @@
+import os
+import sys
+import time
+import subprocess
+import pytest
+import trash_bin
+from trash_bin import (recover_interrupted, make_staging_dir, mark_ready, swap_in, release_staging,
+                       SwapFailed, STAGING_PREFIX, READY_PREFIX, TRASH_DIR_NAME)
+
+def exited_pid():
+    process = subprocess.Popen([sys.executable, '-c', 'pass'])
+    process.wait()
+    return process.pid
+
+def make_dir(path, files=("a.txt",)):
+    os.makedirs(path)
+    for name in files:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(name)
+    return str(path)
+
+def visible(parent):
+    return sorted(name for name in os.listdir(parent) if name != TRASH_DIR_NAME)
+
+def test_recover_reclaims_staging_of_exited_process(tmp_path):
+    make_dir(tmp_path / f"{STAGING_PREFIX}{exited_pid()}-{'0' * 32}")
+    recover_interrupted(str(tmp_path))
+    assert visible(tmp_path) == []
+
+def test_recover_keeps_staging_of_running_process(tmp_path):
+    # 例如计划任务中的命令行正在同一区服目录下改键
+    other = os.getppid()
+    staging = make_dir(tmp_path / f"{STAGING_PREFIX}{other}-{'0' * 32}")
+    ready = make_dir(tmp_path / f"{READY_PREFIX}{other}-{'1' * 32}-角色")
+    recover_interrupted(str(tmp_path))
+    assert os.path.isdir(staging) and os.path.isdir(ready)
+    assert not os.path.exists(tmp_path / "角色")
+
+def test_recover_keeps_own_active_staging(tmp_path):
+    staging = make_staging_dir(str(tmp_path))
+    try:
+        recover_interrupted(str(tmp_path))
+        assert os.path.isdir(staging)
+    finally:
+        release_staging(staging)
+
+def test_recover_swaps_in_complete_ready_dir(tmp_path):
+    make_dir(tmp_path / f"{READY_PREFIX}{exited_pid()}-{'1' * 32}-角色-1")
+    recover_interrupted(str(tmp_path))
+    assert visible(tmp_path) == ["角色-1"]
+    assert os.listdir(tmp_path / "角色-1") == ["a.txt"]
+
+def test_recover_legacy_names_only_when_stale(tmp_path):
+    staging = make_dir(tmp_path / f"{STAGING_PREFIX}{'2' * 32}")
+    recover_interrupted(str(tmp_path))
+    assert os.path.isdir(staging)
+    old = time.time() - trash_bin.STALE_AGE - 60
+    os.utime(staging, (old, old))
+    recover_interrupted(str(tmp_path))
+    assert visible(tmp_path) == []
+
+def test_swap_in_replaces_target(tmp_path):
+    target = make_dir(tmp_path / "角色", ("old.txt",))
+    staging = make_staging_dir(str(tmp_path))
+    make_dir(os.path.join(staging, "sub"), ("new.txt",))
+    ready = mark_ready(staging, "角色")
+    swap_in(ready, target)
+    assert os.listdir(target) == ["sub"]
+    assert visible(tmp_path) == ["角色"]
+
+def test_swap_in_reports_locked_target(tmp_path, monkeypatch):
+    target = make_dir(tmp_path / "角色", ("old.txt",))
+    ready = mark_ready(make_staging_dir(str(tmp_path)), "角色")
+
+    def locked(path, trash_parent=None):
+        raise PermissionError(13, "locked")
+
+    monkeypatch.setattr(trash_bin, '_rename_aside', locked)
+    with pytest.raises(SwapFailed):
+        swap_in(ready, target)
+    assert os.listdir(target) == ["old.txt"]
+    release_staging(ready)
+
+def test_swap_in_restores_target_when_ready_is_missing(tmp_path):
+    target = make_dir(tmp_path / "角色", ("old.txt",))
+    with pytest.raises(OSError):
+        swap_in(str(tmp_path / f"{READY_PREFIX}{os.getpid()}-{'3' * 32}-角色"), target)
+    assert os.listdir(target) == ["old.txt"]
+
+def test_collector_does_not_drop_work_scheduled_while_going_idle(tmp_path):
+    # schedule() 在回收线程等待超时、即将退出的瞬间放入内容：看到线程仍在运行，不会启动新线程
+    trash_dir = make_dir(tmp_path / TRASH_DIR_NAME, ("old.txt",))
+    collector = trash_bin.TrashCollector()
+
+    class RacingQueue(trash_bin.queue.Queue):
+        raced = False
+
+        def get(self, block=True, timeout=None):
+            if not self.raced:
+                self.raced = True
+                self.put(trash_dir)
+                raise trash_bin.queue.Empty
+            return super().get(block, 0.05)
+
+    collector.pending = RacingQueue()
+    collector.thread = trash_bin.threading.Thread(target=collector.run)
+    collector.thread.start()
+    collector.thread.join(5)
+    assert not os.path.exists(trash_dir)
+    assert collector.thread is None
@@ -0,0 +1,184 @@
+import os
+import re
+import json
+from telemetry import telemetry
+
+PROFILES_FILE = 'transfer_profiles.json'
+FULL_PROFILE = "全部文件"
+
+# 规则写法（相对角色目录，用 / 分隔，不区分大小写）：
+#   不含 / 的通配符匹配任意一级的文件或目录名，如 "*.ini"、"cache"
+#   含 / 的通配符从角色目录开始匹配，如 "interface/layout/*.dat"；** 匹配任意多级目录
+#   匹配到目录时，目录下的所有内容都算匹配；以 / 结尾只是强调它是目录
+#   以 "re:" 开头的是正则表达式，需要完整匹配相对路径
+BUILTIN_PROFILES = {
+    FULL_PROFILE: {"include": [], "exclude": []},
+    "仅快捷键": {"include": ["*hotkey*", "*shortcut*", "*keybind*"], "exclude": []},
+    "仅界面布局": {"include": ["interface/", "*layout*"], "exclude": []},
+    "跳过缓存": {"include": [], "exclude": ["cache/", "*.log", "*.tmp"]},
+}
+
+class ProfileError(Exception):
+    pass
+
+def _glob_to_regex(pattern):
+    out = []
+    i = 0
+    while i < len(pattern):
+        if pattern.startswith('**/', i):
+            out.append('(?:.*/)?')
+            i += 3
+        elif pattern.startswith('**', i):
+            out.append('.*')
+            i += 2
+        elif pattern[i] == '*':
+            out.append('[^/]*')
+            i += 1
+        elif pattern[i] == '?':
+            out.append('[^/]')
+            i += 1
+        elif pattern[i] == '[' and ']' in pattern[i + 2:]:
+            end = pattern.index(']', i + 2)
+            body = pattern[i + 1:end]
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            out.append('[' + body.replace('\\', '\\\\') + ']')
+            i = end + 1
+        else:
+            out.append(re.escape(pattern[i]))
+            i += 1
+    return ''.join(out)
+
+def _literal_prefix(pattern):
+    # 通配符之前的目录层级，用于判断某个目录下是否可能有匹配的文件
+    parts = []
+    for part in pattern.split('/'):
+        if any(c in part for c in '*?['):
+            break
+        parts.append(part.lower())
+    return parts
+
+class TransferFilter:
+    # 把一个传输方案的包含/排除规则编译成两条正则，对每个相对路径只做一次匹配
+    def __init__(self, include=(), exclude=()):
+        self.include_re, self.include_prefixes = self.compile(include, 'include')
+        self.exclude_re, _ = self.compile(exclude, 'exclude')
+        # 只有通配符规则保证"匹配目录即匹配其下所有内容"，可以在遍历时直接跳过整个目录
+        self.exclude_dir_re, _ = self.compile([rule for rule in exclude if not rule.startswith('re:')], 'exclude')
+
+    @staticmethod
+    def compile(rules, kind):
+        # 返回 (合并后的正则或 None, 锚定规则的字面前缀列表；含不锚定规则时为 None 表示不能按目录剪枝)
+        patterns = []
+        prefixes = []
+        for rule in rules:
+            rule = rule.strip()
+            if not rule:
+                continue
+            if rule.startswith('re:'):
+                patterns.append(rule[3:])
+                prefixes = None
+                continue
+            glob = rule.replace('\\', '/').strip('/')
+            if '/' in glob:
+                patterns.append(_glob_to_regex(glob) + '(?:/.*)?')
+                if prefixes is not None:
+                    prefixes.append(_literal_prefix(glob))
+            else:
+                patterns.append('(?:.*/)?' + _glob_to_regex(glob) + '(?:/.*)?')
+                prefixes = None
+        if not patterns:
+            return None, None
+        try:
+            return re.compile('|'.join(f'(?:{p})' for p in patterns), re.IGNORECASE), prefixes
+        except re.error as e:
+            raise ProfileError(f"{kind} 规则有误: {e}")
+
+    def is_active(self):
+        return self.include_re is not None or self.exclude_re is not None
+
+    def match_file(self, rel_path):
+        rel_path = rel_path.replace(os.sep, '/')
+        if self.include_re is not None and not self.include_re.fullmatch(rel_path):
+            return False
+        return self.exclude_re is None or not self.exclude_re.fullmatch(rel_path)
+
+    def walk_dir(self, rel_dir):
+        # 返回 False 表示整个目录都被排除，遍历时不必进入
+        rel_dir = rel_dir.replace(os.sep, '/')
+        if self.exclude_dir_re is not None and self.exclude_dir_re.fullmatch(rel_dir):
+            return False
+        if self.include_prefixes is None:
+            return True
+        parts = rel_dir.lower().split('/')
+        for prefix in self.include_prefixes:
+            n = min(len(prefix), len(parts))
+            if prefix[:n] == parts[:n]:
+                return True
+        return False
+
+class PathListFilter:
+    # 只传输列出的文件（相对角色目录的路径），用于只重试写入后校验失败的文件；接口与 TransferFilter 相同
+    def __init__(self, paths):
+        self.files = {os.path.normcase(os.path.normpath(path)) for path in paths}
+        self.dirs = set()
+        for path in self.files:
+            parent = os.path.dirname(path)
+            while parent and parent not in self.dirs:
+                self.dirs.add(parent)
+                parent = os.path.dirname(parent)
+
+    def is_active(self):
+        return True
+
+    def match_file(self, rel_path):
+        return os.path.normcase(rel_path) in self.files
+
+    def walk_dir(self, rel_dir):
+        return os.path.normcase(rel_dir) in self.dirs
+
+def load_profiles(path=PROFILES_FILE):
+    # 内置方案 + 用户在 transfer_profiles.json 中定义（或覆盖）的方案
+    profiles = {name: dict(rules) for name, rules in BUILTIN_PROFILES.items()}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return profiles
+    except (OSError, json.JSONDecodeError) as e:
+        telemetry.warn(f"无法读取传输方案 {path}: {e}")
+        return profiles
+    if isinstance(data, dict):
+        for name, rules in data.items():
+            if isinstance(rules, dict):
+                profiles[name] = {"include": list(rules.get("include", [])), "exclude": list(rules.get("exclude", []))}
+    return profiles
+
+def save_default_profiles(path=PROFILES_FILE):
+    # 写出内置方案作为编辑模板
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(BUILTIN_PROFILES, f, ensure_ascii=False, indent=2)
+
+def compile_profile(profiles, name):
+    # 返回编译好的 TransferFilter；完整复制时返回 None
+    if not name or name == FULL_PROFILE:
+        return None
+    if name not in profiles:
+        raise ProfileError(f"传输方案不存在: {name}")
+    rules = profiles[name]
+    transfer_filter = TransferFilter(rules.get("include", []), rules.get("exclude", []))
+    return transfer_filter if transfer_filter.is_active() else None
+
+# presets.json 中的预设：旧格式为 [base_path, 账号, 大区, 区服, 角色]，
+# 指定了传输方案的预设为 {"selections": [...], "profile": 方案名}
+def preset_selections(preset):
+    return preset["selections"] if isinstance(preset, dict) else preset
+
+def preset_profile(preset):
+    return preset.get("profile", FULL_PROFILE) if isinstance(preset, dict) else FULL_PROFILE
+
+def make_preset(selections, profile=FULL_PROFILE):
+    # 完整复制的预设仍按旧格式保存，旧版本工具也能读取
+    if not profile or profile == FULL_PROFILE:
+        return list(selections)
+    return {"selections": list(selections), "profile": profile}
@@ -0,0 +1,235 @@
+import os
+import sys
+import time
+import uuid
+import queue
+import shutil
+import threading
+
+INTERNAL_PREFIX = '.jx3'  # 工具自己的临时目录前缀，层级扫描时需要忽略
+TRASH_DIR_NAME = '.jx3trash'
+STAGING_PREFIX = '.jx3staging-'
+READY_PREFIX = '.jx3ready-'
+PURGE_PAUSE = 0.005  # 每删除一项后让出磁盘的时间（秒）
+IDLE_TIMEOUT = 5  # 回收线程空闲这么久（秒）后退出，之后有新内容时重新启动
+STALE_AGE = 24 * 3600  # 无法确认所属进程已退出时，暂存目录超过这么久未变化才视为中断留下的
+
+def is_internal_name(name):
+    return name.startswith(INTERNAL_PREFIX)
+
+def _lower_thread_priority():
+    # 回收线程使用最低优先级，不和改键/界面抢 CPU
+    try:
+        if sys.platform.startswith('linux'):
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 19)
+        elif sys.platform == 'win32':
+            import ctypes
+            kernel32 = ctypes.windll.kernel32
+            kernel32.SetThreadPriority(kernel32.GetCurrentThread(), -2)  # THREAD_PRIORITY_LOWEST
+    except (OSError, AttributeError):
+        pass
+
+class TrashCollector:
+    # 后台清空 .jx3trash 目录；进程退出时未删完的内容在下次同目录改键时继续删除
+    def __init__(self):
+        self.pending = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def schedule(self, trash_dir):
+        self.pending.put(trash_dir)
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="TrashCollector", daemon=True)
+                self.thread.start()
+
+    def run(self):
+        _lower_thread_priority()
+        while True:
+            try:
+                trash_dir = self.pending.get(timeout=IDLE_TIMEOUT)
+            except queue.Empty:
+                # 在锁内确认没有新内容再退出：schedule() 放入内容后若看到线程仍在，就不会再启动新线程
+                with self.lock:
+                    if self.pending.empty():
+                        self.thread = None
+                        return
+                continue
+            self.purge(trash_dir)
+
+    def purge(self, trash_dir):
+        try:
+            names = os.listdir(trash_dir)
+        except OSError:
+            return
+        for name in names:
+            path = os.path.join(trash_dir, name)
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path, ignore_errors=True)
+                else:
+                    os.unlink(path)
+            except OSError:
+                pass
+            time.sleep(PURGE_PAUSE)
+        try:
+            os.rmdir(trash_dir)
+        except OSError:
+            pass  # 删除期间又有新内容移入，或仍有文件被占用
+
+    def wait_idle(self, timeout=None):
+        thread = self.thread
+        if thread is not None:
+            thread.join(timeout)
+
+collector = TrashCollector()
+
+# 本进程正在使用的暂存目录，崩溃恢复时不能动（一对多同步时多个线程可能在同一父目录下暂存）
+# 暂存目录名带有所属进程号，其他进程（例如计划任务运行的命令行）正在使用的暂存目录同样不能动
+active_staging = set()
+active_lock = threading.Lock()
+
+def _split_owner(rest):
+    # rest 为去掉前缀后的名字："进程号-uuid[-目标名]"；旧版本为 "uuid[-目标名]"，返回 (进程号或 None, 目标名)
+    parts = rest.split('-', 2)
+    if len(parts) >= 2 and parts[0].isdigit() and len(parts[0]) < 32:
+        return int(parts[0]), parts[2] if len(parts) == 3 else ''
+    return None, rest.split('-', 1)[-1]
+
+def _process_alive(pid):
+    if sys.platform == 'win32':
+        import ctypes
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return kernel32.GetLastError() == 5  # ERROR_ACCESS_DENIED：进程存在但无权查询
+        exit_code = ctypes.c_ulong()
+        try:
+            return bool(kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))) and exit_code.value == 259  # STILL_ACTIVE
+        finally:
+            kernel32.CloseHandle(handle)
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
+
+def _is_abandoned(path, pid):
+    with active_lock:
+        if path in active_staging:
+            return False
+    if pid == os.getpid():
+        return True  # 本进程之前出错未清理的
+    if pid is not None and not _process_alive(pid):
+        return True
+    # 所属进程仍在运行（也可能是进程号被复用）或是旧版本留下的，只回收长时间未变化的
+    try:
+        return time.time() - os.lstat(path).st_mtime > STALE_AGE
+    except OSError:
+        return False
+
+def _rename_aside(path, trash_parent=None):
+    trash_dir = os.path.join(trash_parent or os.path.dirname(path), TRASH_DIR_NAME)
+    aside = os.path.join(trash_dir, f"{uuid.uuid4().hex}-{os.path.basename(path)}")
+    for attempt in range(2):
+        os.makedirs(trash_dir, exist_ok=True)
+        try:
+            os.rename(path, aside)
+            return trash_dir, aside
+        except FileNotFoundError:
+            # 回收线程可能刚好删掉了空的回收目录，重建后再试一次
+            if attempt or not os.path.lexists(path):
+                raise
+    return trash_dir, aside
+
+def move_to_trash(path, trash_parent=None):
+    # 一次 rename 把文件或整个目录移到同一卷上的回收目录，真正的删除在后台进行
+    # trash_parent 指定回收目录所在位置（默认与 path 同级）
+    trash_dir, _ = _rename_aside(path, trash_parent)
+    collector.schedule(trash_dir)
+
+def make_staging_dir(parent):
+    staging = os.path.join(parent, f"{STAGING_PREFIX}{os.getpid()}-{uuid.uuid4().hex}")
+    with active_lock:
+        active_staging.add(staging)
+    try:
+        os.makedirs(staging)
+    except BaseException:
+        release_staging(staging)
+        raise
+    return staging
+
+def mark_ready(staging, name):
+    # 暂存目录写完后改名为 ready，崩溃恢复时据此判断内容是否完整
+    ready = os.path.join(os.path.dirname(staging), f"{READY_PREFIX}{os.getpid()}-{uuid.uuid4().hex}-{name}")
+    with active_lock:
+        active_staging.add(ready)
+    os.rename(staging, ready)
+    release_staging(staging)
+    return ready
+
+def release_staging(path):
+    with active_lock:
+        active_staging.discard(path)
+
+def discard_staging(path):
+    # 出错或取消时丢弃暂存内容
+    release_staging(path)
+    if os.path.lexists(path):
+        try:
+            move_to_trash(path)
+        except OSError:
+            shutil.rmtree(path, ignore_errors=True)
+
+def recover_interrupted(parent):
+    # 处理上次中断的替换：完整的 ready 目录在目标缺失时换入，其余暂存内容移到回收目录
+    # 只处理所属进程已退出（或长时间未变化）的暂存目录
+    try:
+        names = os.listdir(parent)
+    except OSError:
+        return
+    for name in names:
+        path = os.path.join(parent, name)
+        if name.startswith(READY_PREFIX):
+            pid, target_name = _split_owner(name[len(READY_PREFIX):])
+            if not _is_abandoned(path, pid):
+                continue
+            target = os.path.join(parent, target_name)
+            if not os.path.exists(target):
+                try:
+                    os.rename(path, target)
+                    continue
+                except OSError:
+                    pass
+            move_to_trash(path)
+        elif name.startswith(STAGING_PREFIX):
+            pid, _ = _split_owner(name[len(STAGING_PREFIX):])
+            if _is_abandoned(path, pid):
+                move_to_trash(path)
+        elif name == TRASH_DIR_NAME:
+            collector.schedule(path)
+
+class SwapFailed(OSError):
+    pass
+
+def swap_in(ready, target):
+    # 两次 rename 完成替换：旧目录进回收站，新目录换到原位置
+    if os.path.exists(target):
+        try:
+            trash_dir, aside = _rename_aside(target)
+        except OSError as e:
+            # 目标中有文件被占用（例如游戏正在运行），调用方可改用原地同步
+            raise SwapFailed(e.errno, f"无法移走目标目录: {e}")
+        try:
+            os.rename(ready, target)
+        except OSError:
+            os.rename(aside, target)
+            raise
+        collector.schedule(trash_dir)
+    else:
+        os.rename(ready, target)
+    release_staging(ready)
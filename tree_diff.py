@@ -0,0 +1,75 @@
+import os
+from file_operations import build_manifest, hash_file, is_under_any
+from telemetry import telemetry
+
+def diff_trees(src, dst, hash_cache=None, transfer_filter=None):
+    # 预览改键会对目标做的改动：新增、内容变化、删除的文件
+    # 大小和 mtime 都相同的文件与同步时一样直接视为未变化，不读内容；
+    # 只有大小相同而 mtime 不同的文件才比较哈希（由 hash_cache 缓存，未改动的树再次预览无需读文件）
+    with telemetry.span("diff", source=src, target=dst) as span:
+        diff = _diff_trees(src, dst, hash_cache, transfer_filter, span)
+        span.add(files=len(diff["added"]) + len(diff["changed"]), num_bytes=diff["copy_bytes"])
+        return diff
+
+def _diff_trees(src, dst, hash_cache, transfer_filter, span):
+    src = os.path.normpath(src)
+    dst = os.path.normpath(dst)
+    with span.phase("scan"):
+        src_files, src_dirs = build_manifest(src, transfer_filter)
+        dst_files, dst_dirs = build_manifest(dst, transfer_filter)
+    diff = {
+        "added": [],  # (相对路径, 大小)
+        "changed": [],  # (相对路径, 源大小, 目标大小)
+        "removed": [],  # 相对路径；整个被删除的目录以分隔符结尾
+        "touched": 0,  # 内容相同、只有修改时间不同的文件数
+        "unchanged": 0,
+        "copy_bytes": 0,
+    }
+
+    suspects = []
+    for rel_path, (size, mtime_ns) in src_files.items():
+        current = dst_files.get(rel_path)
+        if current is None:
+            diff["added"].append((rel_path, size))
+            diff["copy_bytes"] += size
+        elif current[0] != size:
+            diff["changed"].append((rel_path, size, current[0]))
+            diff["copy_bytes"] += size
+        elif current[1] != mtime_ns:
+            suspects.append(rel_path)
+        else:
+            diff["unchanged"] += 1
+
+    if suspects:
+        paths = [os.path.join(root, rel_path) for rel_path in suspects for root in (src, dst)]
+        with span.phase("hash"):
+            if hash_cache is not None:
+                digests = hash_cache.get_hashes(paths)
+            else:
+                digests = {path: hash_file(path) for path in paths}
+        for rel_path in suspects:
+            size = src_files[rel_path][0]
+            if digests[os.path.join(src, rel_path)] == digests[os.path.join(dst, rel_path)]:
+                diff["touched"] += 1
+            else:
+                diff["changed"].append((rel_path, size, size))
+                diff["copy_bytes"] += size
+
+    # 与同步一致：只列出最上层被删除的目录；有过滤规则时不整目录删除
+    stale_dirs = sorted(dst_dirs - src_dirs) if transfer_filter is None else []
+    removed_dirs = set()
+    for rel_dir in stale_dirs:
+        if not is_under_any(rel_dir, removed_dirs):
+            removed_dirs.add(rel_dir)
+            diff["removed"].append(rel_dir + os.sep)
+    for rel_path in sorted(dst_files):
+        if rel_path not in src_files and not is_under_any(rel_path, removed_dirs):
+            diff["removed"].append(rel_path)
+
+    diff["added"].sort()
+    diff["changed"].sort()
+    diff["removed"].sort()
+    return diff
+
+def is_identical(diff):
+    return not (diff["added"] or diff["changed"] or diff["removed"])
@@ -0,0 +1,101 @@
+import time
+from PyQt5.QtCore import QObject, QRunnable, pyqtSignal
+from tree_diff import diff_trees
+from telemetry import telemetry
+
+class JobQueueSignals(QObject):
+    changed = pyqtSignal()  # 改键队列的任务状态或进度变化（从工作线程发出，在界面线程处理）
+
+class HierarchyScanWorkerSignals(QObject):
+    finished = pyqtSignal(object)  # 子目录发生变化的目录路径列表
+
+class HierarchyScanWorker(QRunnable):
+    # 启动时界面先用索引缓存显示，这里在后台逐个校验已显示目录的 mtime，变化的目录重新扫描；
+    # 之后再并发预热 roots 中各数据文件夹的索引，切换数据文件夹或展开时不必再等待扫描
+    def __init__(self, hierarchy_index, loaded, roots=(), cancel_event=None):
+        super().__init__()
+        self.hierarchy_index = hierarchy_index
+        self.loaded = loaded  # [(路径, 界面当前显示的子目录名)]
+        self.roots = list(roots)
+        self.cancel_event = cancel_event
+        self.signals = HierarchyScanWorkerSignals()
+
+    def run(self):
+        changed = []
+        if self.loaded:
+            with telemetry.span("startup.scan") as span:
+                for path, names in self.loaded:
+                    if self.hierarchy_index.get_children(path) != names:
+                        changed.append(path)
+                span.fields.update(directories=len(self.loaded), changed=len(changed))
+        self.signals.finished.emit(changed)
+        if self.roots:
+            with telemetry.span("roots.scan", roots=self.roots) as span:
+                span.fields["directories"] = self.hierarchy_index.scan_roots(self.roots, cancel_event=self.cancel_event)
+
+class SearchIndexWorkerSignals(QObject):
+    finished = pyqtSignal(str, int, object)  # 数据文件夹、开始建立时的目录版本号、PathSearchIndex（失败时为 None）
+
+class SearchIndexWorker(QRunnable):
+    # 在后台遍历目录索引并计算各级名称的拼音首字母，角色很多时输入第一个字也不卡界面
+    def __init__(self, root, hierarchy_index, generation):
+        super().__init__()
+        self.root = root
+        self.hierarchy_index = hierarchy_index
+        self.generation = generation
+        self.signals = SearchIndexWorkerSignals()
+
+    def run(self):
+        from path_search import PathSearchIndex
+        start = time.perf_counter()
+        index = PathSearchIndex()
+        try:
+            index.build(self.root, self.hierarchy_index)
+        except Exception as e:
+            telemetry.warn(f"无法建立搜索索引 {self.root}: {e}")
+            index = None
+        telemetry.observe("search.build", time.perf_counter() - start)
+        self.signals.finished.emit(self.root, self.generation, index)
+
+class DiffWorkerSignals(QObject):
+    finished = pyqtSignal(object)  # diff_trees 的结果
+    failed = pyqtSignal(str)
+
+class DiffWorker(QRunnable):
+    # 在后台比较源和目标角色目录，首次比较需要计算哈希时界面不卡顿
+    def __init__(self, source_path, target_path, hash_cache=None, transfer_filter=None):
+        super().__init__()
+        self.transfer_filter = transfer_filter
+        self.source_path = source_path
+        self.target_path = target_path
+        self.hash_cache = hash_cache
+        self.signals = DiffWorkerSignals()
+
+    def run(self):
+        try:
+            diff = diff_trees(self.source_path, self.target_path, self.hash_cache, self.transfer_filter)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(diff)
+
+class TaskWorkerSignals(QObject):
+    finished = pyqtSignal(object)
+    failed = pyqtSignal(str)
+
+class TaskWorker(QRunnable):
+    # 在后台执行一次性的耗时操作（导出/导入配置包等），结果通过信号返回界面线程
+    def __init__(self, func, *args, **kwargs):
+        super().__init__()
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.signals = TaskWorkerSignals()
+
+    def run(self):
+        try:
+            result = self.func(*self.args, **self.kwargs)
+        except Exception as e:
+            self.signals.failed.emit(str(e))
+            return
+        self.signals.finished.emit(result)